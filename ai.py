@@ -0,0 +1,197 @@
+import random
+import time
+
+from engine import geometry
+
+DIFFICULTIES = {'easy': 'Легкий', 'medium': 'Середній', 'hard': 'Складний'}
+# How often 'medium' plays the best move instead of a random one.
+MEDIUM_ACCURACY = 0.6
+SEARCH_BUDGET = 0.3
+
+_ROTATE = (6, 3, 0, 7, 4, 1, 8, 5, 2)
+_MIRROR = (2, 1, 0, 5, 4, 3, 8, 7, 6)
+
+
+def _symmetries():
+    perms = []
+    perm = tuple(range(9))
+    for _ in range(4):
+        perms.append(perm)
+        perms.append(tuple(_MIRROR[cell] for cell in perm))
+        perm = tuple(_ROTATE[cell] for cell in perm)
+    return perms
+
+
+# SYMMETRIES[s][cell] is where symmetry s sends cell; MASK_MAPS[s] does the same for whole 9-bit masks.
+SYMMETRIES = _symmetries()
+INVERSES = [tuple(perm.index(cell) for cell in range(9)) for perm in SYMMETRIES]
+MASK_MAPS = [tuple(sum(1 << perm[cell] for cell in range(9) if mask >> cell & 1) for mask in range(512))
+             for perm in SYMMETRIES]
+
+# Canonical (mover, opponent) masks -> (score for the mover, best moves in canonical coordinates).
+TABLE = {}
+
+
+def canonical(mine, theirs):
+    best = None
+    best_symmetry = 0
+    for symmetry, mask_map in enumerate(MASK_MAPS):
+        key = (mask_map[mine], mask_map[theirs])
+        if best is None or key < best:
+            best, best_symmetry = key, symmetry
+    return best, best_symmetry
+
+
+def _solve(mine, theirs, lines, full):
+    key, _ = canonical(mine, theirs)
+    entry = TABLE.get(key)
+    if entry is not None:
+        return entry[0]
+
+    mine, theirs = key
+    free = full & ~(mine | theirs)
+    best_score = None
+    best_moves = []
+    for cell in range(9):
+        bit = 1 << cell
+        if not free & bit:
+            continue
+        placed = mine | bit
+        if any(placed & line == line for line in lines):
+            # Win now; sooner wins (more free cells left) score higher.
+            score = bin(free).count('1')
+        elif placed | theirs == full:
+            score = 0
+        else:
+            score = -_solve(theirs, placed, lines, full)
+
+        if best_score is None or score > best_score:
+            best_score, best_moves = score, [cell]
+        elif score == best_score:
+            best_moves.append(cell)
+
+    TABLE[key] = (best_score, tuple(best_moves))
+    return best_score
+
+
+def build_table():
+    if not TABLE:
+        shape = geometry(3)
+        _solve(0, 0, shape.lines, shape.full)
+    return TABLE
+
+
+def perfect_moves(mine, theirs):
+    key, symmetry = canonical(mine, theirs)
+    entry = TABLE.get(key)
+    if entry is None:
+        build_table()
+        entry = TABLE[key]
+    inverse = INVERSES[symmetry]
+    return [inverse[cell] for cell in entry[1]]
+
+
+def _evaluate(mine, theirs, lines, weights):
+    score = 0
+    for line in lines:
+        if not line & theirs:
+            score += weights[bin(line & mine).count('1')]
+        elif not line & mine:
+            score -= weights[bin(line & theirs).count('1')]
+    return score
+
+
+def _candidates(shape, mine, theirs):
+    occupied = mine | theirs
+    if not occupied:
+        center = shape.size // 2
+        return [center * shape.size + center]
+
+    size = shape.size
+    cells = []
+    for cell in range(shape.cells):
+        if occupied >> cell & 1:
+            continue
+        row, col = divmod(cell, size)
+        for d_row in (-1, 0, 1):
+            for d_col in (-1, 0, 1):
+                r, c = row + d_row, col + d_col
+                if 0 <= r < size and 0 <= c < size and occupied >> (r * size + c) & 1:
+                    cells.append(cell)
+                    break
+            else:
+                continue
+            break
+    return cells
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+def _negamax(shape, mine, theirs, depth, alpha, beta, deadline, weights):
+    if time.perf_counter() > deadline:
+        raise SearchTimeout
+    if depth == 0:
+        return _evaluate(mine, theirs, shape.lines, weights)
+
+    moves = _candidates(shape, mine, theirs)
+    if not moves:
+        return 0
+
+    best = -float('inf')
+    for cell in moves:
+        placed = mine | 1 << cell
+        if any(placed & line == line for line in shape.lines_through[cell]):
+            return weights[-1] * (depth + 1)
+        score = -_negamax(shape, theirs, placed, depth - 1, -beta, -alpha, deadline, weights)
+        if score > best:
+            best = score
+        alpha = max(alpha, score)
+        if alpha >= beta:
+            break
+    return best
+
+
+def search_move(board, side, budget=SEARCH_BUDGET):
+    shape = board.geometry
+    mine, theirs = board.masks[side], board.masks[1 - side]
+    weights = [0] + [10 ** count for count in range(1, shape.length)] + [10 ** (shape.length + 2)]
+    deadline = time.perf_counter() + budget
+
+    moves = _candidates(shape, mine, theirs)
+    for cell in moves:
+        placed = mine | 1 << cell
+        if any(placed & line == line for line in shape.lines_through[cell]):
+            return cell
+    for cell in moves:
+        blocked = theirs | 1 << cell
+        if any(blocked & line == line for line in shape.lines_through[cell]):
+            return cell
+
+    best_move = moves[0]
+    depth = 1
+    # Iterative deepening: keep the best move of the deepest search that finished within the budget.
+    while depth <= len(moves):
+        try:
+            scores = {}
+            for cell in moves:
+                placed = mine | 1 << cell
+                scores[cell] = -_negamax(shape, theirs, placed, depth - 1, -float('inf'), float('inf'),
+                                         deadline, weights)
+        except SearchTimeout:
+            break
+        moves.sort(key=scores.get, reverse=True)
+        best_move = moves[0]
+        depth += 1
+    return best_move
+
+
+def best_move(board, side, difficulty='hard', budget=SEARCH_BUDGET):
+    empty = board.empty_cells()
+    if difficulty == 'easy' or difficulty == 'medium' and random.random() > MEDIUM_ACCURACY:
+        return random.choice(empty)
+
+    if board.size == 3 and board.geometry.length == 3:
+        return random.choice(perfect_moves(board.masks[side], board.masks[1 - side]))
+    return search_move(board, side, budget)
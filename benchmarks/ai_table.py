@@ -0,0 +1,56 @@
+import argparse
+import random
+import time
+
+import ai
+from engine import Board
+
+
+def random_positions(count, size=3):
+    positions = []
+    while len(positions) < count:
+        board = Board(size)
+        side = random.randint(0, 1)
+        for _ in range(random.randint(0, size * size - 1)):
+            if board.winner() is not None:
+                break
+            board.play(side, random.choice(board.empty_cells()))
+            side = 1 - side
+        if board.winner() is None and not board.is_full():
+            positions.append((board, side))
+    return positions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bot opponent: 3x3 table build/lookup and larger-board search.')
+    parser.add_argument('--builds', type=int, default=20)
+    parser.add_argument('--lookups', type=int, default=200_000)
+    parser.add_argument('--searches', type=int, default=5)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    for _ in range(args.builds):
+        ai.TABLE.clear()
+        ai.build_table()
+    build = (time.perf_counter() - started) / args.builds
+    print(f'3x3 table: {len(ai.TABLE)} canonical positions, built in {build * 1000:.1f} ms')
+
+    positions = [(board.masks[side], board.masks[1 - side]) for board, side in random_positions(1000)]
+    started = time.perf_counter()
+    for index in range(args.lookups):
+        ai.perfect_moves(*positions[index % len(positions)])
+    elapsed = time.perf_counter() - started
+    print(f'3x3 lookups: {args.lookups / elapsed:,.0f} moves/s ({elapsed / args.lookups * 1e6:.2f} us each)')
+
+    for size in (5, 8):
+        samples = []
+        for board, side in random_positions(args.searches, size):
+            started = time.perf_counter()
+            ai.best_move(board, side, 'hard')
+            samples.append(time.perf_counter() - started)
+        print(f'{size}x{size} search: mean {sum(samples) / len(samples) * 1000:.0f} ms per move '
+              f'(budget {ai.SEARCH_BUDGET * 1000:.0f} ms)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+import argparse
+import importlib
+import random
+import time
+
+from engine import move_callback
+
+bot_module = importlib.import_module('tic-tac-toe')
+
+MENU_CALLBACKS = ['join_waiting', 'leave_waiting', 'find_player', 'find_player_by_id', 'select_player_123456789',
+                  'symbol_choice_123456789_❌', 'play_bot', 'play_bot_hard', 'check_id', 'go_back', 'settings',
+                  'board_size', 'board_size_5', 'check_rules', 'confirm_game_123456789', 'deny_game_123456789']
+
+
+def legacy_route(data):
+    # The if/elif chain `button` used before the router, reduced to its comparisons and inline parsing.
+    if data == 'join_waiting':
+        return 'join_waiting', ()
+    elif data == 'leave_waiting':
+        return 'leave_waiting', ()
+    elif data == 'find_player':
+        return 'find_player', ()
+    elif data.startswith('select_player_'):
+        return 'select_player', (int(data.split('_')[-1]),)
+    elif data.startswith('symbol_choice_'):
+        _, _, user_id, symbol = data.split('_')
+        return 'symbol_choice', (int(user_id), symbol)
+    elif data.startswith('move'):
+        return 'move', (int(data[4:]),)
+    elif data == 'play_bot':
+        return 'play_bot', ()
+    elif data.startswith('play_bot_'):
+        return 'play_bot_level', (data[len('play_bot_'):],)
+    elif data == 'check_id':
+        return 'check_id', ()
+    elif data == 'go_back':
+        return 'go_back', ()
+    elif data == 'find_player_by_id':
+        return 'find_player_by_id', ()
+    elif data == 'settings':
+        return 'settings', ()
+    elif data == 'board_size' or data.startswith('board_size_'):
+        return 'board_size', (int(data.split('_')[-1]),) if data.startswith('board_size_') else ()
+    elif data == 'check_rules':
+        return 'check_rules', ()
+    elif data.startswith('confirm_game_'):
+        return 'confirm_game', (int(data.split('_')[-1]),)
+    elif data.startswith('deny_game_'):
+        return 'deny_game', (int(data.split('_')[-1]),)
+
+
+def workload(count, move_share, board_size):
+    cells = board_size * board_size
+    return [move_callback(random.randrange(cells)) if random.random() < move_share else random.choice(MENU_CALLBACKS)
+            for _ in range(count)]
+
+
+def measure(route, callbacks, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for data in callbacks:
+            route(data)
+        best = min(best, time.perf_counter() - started)
+    return len(callbacks) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Callback dispatch throughput: if/elif chain vs router.')
+    parser.add_argument('--callbacks', type=int, default=200_000)
+    parser.add_argument('--move-share', type=float, default=0.8)
+    parser.add_argument('--board-size', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    router = bot_module.router
+    callbacks = workload(args.callbacks, args.move_share, args.board_size)
+    for data in set(callbacks):
+        if router.resolve(data) is None:
+            raise SystemExit(f'router does not handle {data!r}')
+
+    print(f'{args.callbacks} callbacks, {args.move_share:.0%} moves on {args.board_size}x{args.board_size}')
+    legacy = measure(legacy_route, callbacks, args.repeat)
+    print(f'if/elif chain:       {legacy:12,.0f} callbacks/s')
+    uncached = measure(lambda data: router.exact.get(data) or router._match_prefix(data), callbacks, args.repeat)
+    print(f'router, no cache:    {uncached:12,.0f} callbacks/s ({uncached / legacy:.1f}x)')
+    cached = measure(router.resolve, callbacks, args.repeat)
+    print(f'router, cached:      {cached:12,.0f} callbacks/s ({cached / legacy:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+import argparse
+import asyncio
+import importlib
+import random
+from collections import Counter
+
+import functions
+from benchmarks.fakes import bind_outbox, FakeBot, VirtualWheel, make_context
+from common import games_in_progress
+
+bot_module = importlib.import_module('tic-tac-toe')
+
+
+async def play(context, wheel, user_id, opponent_id, think_time):
+    await bot_module.start_game(user_id, f'p{user_id}', opponent_id, f'p{opponent_id}', context)
+    game = games_in_progress[user_id]
+    calls = game.api_calls
+    game.assign_symbol(user_id, '❌')
+    await functions.show_board(context, user_id)
+    await functions.set_turn_timer(context, user_id)
+    await functions.show_board(context, opponent_id)
+
+    while user_id in games_in_progress:
+        await wheel.advance(random.uniform(*think_time))
+        game = games_in_progress.get(user_id)
+        if not game:
+            break
+        player = game.turn
+        other = game.opponent_of(player)
+        game.play(game.side_of(player), random.choice(game.board.empty_cells()))
+        await functions.process_winner(player, other, context)
+    return calls
+
+
+async def run(mode, games, think_time):
+    functions.COUNTDOWN_MODE = mode
+    wheel = VirtualWheel()
+    functions.wheel = wheel
+    bot = FakeBot()
+    bind_outbox(bot)
+    context = make_context(bot)
+    total = Counter()
+    for game in range(games):
+        total.update(await play(context, wheel, 2 * game + 1, 2 * game + 2, think_time))
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bot API calls per game for each countdown mode.')
+    parser.add_argument('--games', type=int, default=500)
+    parser.add_argument('--think', type=float, nargs=2, default=(2.0, 19.0), metavar=('MIN', 'MAX'),
+                        help='seconds a player takes per move; above the turn limit the timeout moves instead')
+    parser.add_argument('--marks', type=int, nargs='+', default=list(functions.COUNTDOWN_MARKS))
+    args = parser.parse_args()
+    functions.COUNTDOWN_MARKS = tuple(sorted(args.marks, reverse=True))
+
+    for mode in ('message', 'board'):
+        random.seed(1)
+        total = asyncio.run(run(mode, args.games, args.think))
+        per_game = {method: count / args.games for method, count in sorted(total.items())}
+        print(f'{mode:>8}: {sum(total.values()) / args.games:6.1f} API calls per game  {per_game}')
+
+
+if __name__ == '__main__':
+    main()
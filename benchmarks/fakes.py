@@ -0,0 +1,181 @@
+import asyncio
+import heapq
+import itertools
+import random
+import sqlite3
+import time
+from types import SimpleNamespace
+
+from telegram.error import RetryAfter
+
+from database import SQLiteBackend
+from outbox import outbox
+
+
+class FakeMessage:
+    def __init__(self, message_id, chat_id, text=None, reply_markup=None):
+        self.message_id = message_id
+        self.chat_id = chat_id
+        self.text = text
+        self.reply_markup = reply_markup
+
+
+class FakeBot:
+    def __init__(self, delay=0.0, jitter=0.0, retry_after=0.0, retry_seconds=1.0, seed=None):
+        self.delay = delay
+        self.jitter = jitter
+        # Share of calls that fail with RetryAfter, as Telegram does when a chat or the bot is over its limits.
+        self.retry_after = retry_after
+        self.retry_seconds = retry_seconds
+        self.rng = random.Random(seed)
+        self.calls = []
+        self.retries = 0
+        self.listeners = []
+        self._message_ids = itertools.count(1)
+
+    async def _call(self, method, chat_id, **kwargs):
+        self.calls.append((method, chat_id))
+        delay = self.delay + (self.rng.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            await asyncio.sleep(delay)
+        if self.retry_after and self.rng.random() < self.retry_after:
+            self.retries += 1
+            raise RetryAfter(self.retry_seconds)
+        for listener in self.listeners:
+            listener(method, chat_id, kwargs)
+
+    async def send_message(self, chat_id, text, reply_markup=None, **kwargs):
+        await self._call('send_message', chat_id, text=text, reply_markup=reply_markup)
+        return FakeMessage(next(self._message_ids), chat_id, text, reply_markup)
+
+    async def edit_message_text(self, text, chat_id=None, message_id=None, reply_markup=None, **kwargs):
+        await self._call('edit_message_text', chat_id, text=text, reply_markup=reply_markup)
+        return FakeMessage(message_id, chat_id, text, reply_markup)
+
+    async def delete_message(self, chat_id, message_id, **kwargs):
+        await self._call('delete_message', chat_id)
+        return True
+
+
+class VirtualTimer:
+    __slots__ = ('cancelled',)
+
+    def __init__(self):
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class VirtualWheel:
+    # Drop-in for scheduler.wheel that runs on virtual time, so a 20 second turn costs no wall time.
+    def __init__(self):
+        self.now = 0.0
+        self._heap = []
+        self._sequence = itertools.count()
+
+    def call_later(self, delay, callback, *args):
+        timer = VirtualTimer()
+        heapq.heappush(self._heap, (self.now + delay, next(self._sequence), timer, callback, args))
+        return timer
+
+    async def advance(self, seconds):
+        target = self.now + seconds
+        while self._heap and self._heap[0][0] <= target:
+            deadline, _, timer, callback, args = heapq.heappop(self._heap)
+            if timer.cancelled:
+                continue
+            self.now = deadline
+            timer.cancelled = True
+            result = callback(*args)
+            if asyncio.iscoroutine(result):
+                await result
+        self.now = target
+
+    def __len__(self):
+        return sum(1 for entry in self._heap if not entry[2].cancelled)
+
+
+def bind_outbox(bot, throttled=False):
+    # Benchmarks measure the bot, not Telegram's rate limits, unless they ask for them.
+    if throttled:
+        outbox.bind(bot)
+    else:
+        outbox.bind(bot, global_rate=1e9, global_burst=1e9, chat_rate=1e9, chat_burst=1e9)
+    return outbox
+
+
+def make_context(bot):
+    return SimpleNamespace(bot=bot)
+
+
+def make_user(user_id, first_name=None, username=None):
+    return SimpleNamespace(id=user_id, first_name=first_name or f'player{user_id}', username=username)
+
+
+def make_message_update(bot, user_id, text, first_name=None, username=None):
+    async def reply_text(reply, **kwargs):
+        return await bot.send_message(chat_id=user_id, text=reply, **kwargs)
+
+    message = SimpleNamespace(from_user=make_user(user_id, first_name, username), text=text, reply_text=reply_text)
+    return SimpleNamespace(message=message, callback_query=None, effective_message=message)
+
+
+def make_callback_update(bot, user_id, data, message_id=1, first_name=None, username=None):
+    async def answer(*args, **kwargs):
+        return True
+
+    message = FakeMessage(message_id, user_id)
+    query = SimpleNamespace(from_user=make_user(user_id, first_name, username), data=data, message=message,
+                            answer=answer)
+    return SimpleNamespace(message=None, callback_query=query, effective_message=message)
+
+
+class SlowCursor:
+    def __init__(self, cursor, delay):
+        self._cursor = cursor
+        self._delay = delay
+
+    def execute(self, query, params=()):
+        # Blocking on purpose: this stands in for a network round trip inside the DB driver.
+        time.sleep(self._delay)
+        return self._cursor.execute(query, params)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class SlowConnection:
+    def __init__(self, conn, delay):
+        self._conn = conn
+        self._delay = delay
+
+    def cursor(self):
+        return SlowCursor(self._conn.cursor(), self._delay)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class SlowSQLiteBackend(SQLiteBackend):
+    def __init__(self, path, delay=0.0):
+        super().__init__(path)
+        self.delay = delay
+
+    def connect(self):
+        conn = super().connect()
+        return SlowConnection(conn, self.delay) if self.delay else conn
+
+
+def copy_database(source, target):
+    with sqlite3.connect(source) as src, sqlite3.connect(target) as dst:
+        src.backup(dst)
+    return target
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
@@ -0,0 +1,112 @@
+import argparse
+import asyncio
+import importlib
+import time
+
+import functions
+import outbox as outbox_module
+from benchmarks.fakes import FakeBot, VirtualWheel, bind_outbox, make_context, percentile
+from common import games_in_progress
+
+bot_module = importlib.import_module('tic-tac-toe')
+
+# X wins on the top row after five moves: four ordinary transitions and one game-ending one.
+MOVES = [0, 3, 1, 4, 2]
+
+
+class SerialOutbox:
+    # The pre-outbox behaviour: every Bot API call waits for the previous one to finish.
+    def __init__(self, bot):
+        self.bot = bot
+        self.lock = asyncio.Lock()
+        self.chats = set()
+
+    def _call(self, method, **kwargs):
+        kwargs.pop('priority', None)
+        self.chats.add(id(kwargs))
+        return asyncio.ensure_future(self._run(method, kwargs))
+
+    async def _run(self, method, kwargs):
+        try:
+            async with self.lock:
+                return await getattr(self.bot, method)(**kwargs)
+        finally:
+            self.chats.discard(id(kwargs))
+
+    def send_message(self, **kwargs):
+        return self._call('send_message', **kwargs)
+
+    def edit_message_text(self, **kwargs):
+        return self._call('edit_message_text', **kwargs)
+
+    def delete_message(self, **kwargs):
+        return self._call('delete_message', **kwargs)
+
+
+async def serial_fan_out(*sends):
+    return [await send for send in sends]
+
+
+def use(outbox, fan_out):
+    for module in (functions, bot_module):
+        module.outbox = outbox
+        module.fan_out = fan_out
+
+
+async def settled(outbox, started):
+    while outbox.chats:
+        await asyncio.sleep(0.0005)
+    return time.perf_counter() - started
+
+
+async def play(context, outbox, user_id, opponent_id, samples):
+    started = time.perf_counter()
+    await bot_module.start_game(user_id, f'p{user_id}', opponent_id, f'p{opponent_id}', context)
+    samples['start'].append(await settled(outbox, started))
+
+    game = games_in_progress[user_id]
+    game.assign_symbol(user_id, '❌')
+    await functions.fan_out(functions.show_board(context, user_id), functions.show_board(context, opponent_id))
+    await functions.set_turn_timer(context, user_id)
+    await settled(outbox, started)
+
+    for index, cell in enumerate(MOVES):
+        player, other = (user_id, opponent_id) if index % 2 == 0 else (opponent_id, user_id)
+        game.play(game.side_of(player), cell)
+        started = time.perf_counter()
+        await functions.process_winner(player, other, context)
+        samples['end' if index == len(MOVES) - 1 else 'move'].append(await settled(outbox, started))
+
+
+async def run(mode, games, delay):
+    bot = FakeBot(delay=delay)
+    functions.wheel = VirtualWheel()
+    context = make_context(bot)
+    if mode == 'serial':
+        outbox = SerialOutbox(bot)
+        use(outbox, serial_fan_out)
+    else:
+        outbox = bind_outbox(bot)
+        use(outbox, outbox_module.fan_out)
+
+    samples = {'start': [], 'move': [], 'end': []}
+    for game in range(games):
+        await play(context, outbox, 2 * game + 1, 2 * game + 2, samples)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Two-player transition latency, serial sends vs fan-out.')
+    parser.add_argument('--games', type=int, default=50)
+    parser.add_argument('--delay', type=float, default=0.02, help='simulated Bot API round trip in seconds')
+    args = parser.parse_args()
+
+    for mode in ('serial', 'fan-out'):
+        samples = asyncio.run(run(mode, args.games, args.delay))
+        report = '  '.join(f'{name} p50 {percentile(values, 50) * 1000:6.1f} ms p99 {percentile(values, 99) * 1000:6.1f} ms'
+                           for name, values in samples.items())
+        print(f'{mode:>8}: {report}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+import argparse
+import asyncio
+import os
+import random
+import resource
+import tempfile
+import time
+
+from benchmarks.fakes import percentile
+from history import GameHistory, HistoryStore, export, history_row
+from sessions import Game
+
+
+def finished_game(rng, number):
+    game = Game(2 * number + 1, f'p{2 * number + 1}', 2 * number + 2, f'p{2 * number + 2}')
+    game.assign_symbol(game.players[0], '❌')
+    side = 0
+    while game.board.winner() is None and not game.board.is_full():
+        game.play(side, rng.choice(game.board.empty_cells()), auto=rng.random() < 0.05)
+        side ^= 1
+    return game, game.board.winner()
+
+
+async def record(store, games):
+    history = GameHistory()
+    history.open(store)
+    samples = []
+    for game, winner in games:
+        started = time.perf_counter()
+        history.record(game, winner)
+        samples.append(time.perf_counter() - started)
+        # Finished games trickle in between other work, so the writer thread gets to run.
+        await asyncio.sleep(0)
+    started = time.perf_counter()
+    history.close()
+    return samples, time.perf_counter() - started, history.stats()
+
+
+def fill(store, rng, games, chunk=10_000):
+    # Distinct copies of a few thousand recorded games, written straight to the store.
+    templates = [history_row(*finished_game(rng, number)) for number in range(2000)]
+    for start in range(0, games, chunk):
+        store.write([(f'{number:032x}', *templates[number % len(templates)][1:])
+                     for number in range(start, min(games, start + chunk))])
+
+
+def max_rss_mib():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cost of recording finished games and of streaming them out.')
+    parser.add_argument('--recorded', type=int, default=20_000)
+    parser.add_argument('--exported', type=int, default=1_000_000)
+    args = parser.parse_args()
+    rng = random.Random(1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        games = [finished_game(rng, number) for number in range(args.recorded)]
+        samples, drain, stats = asyncio.run(record(HistoryStore(os.path.join(tmp, 'recorded.db')), games))
+        moves = sum(len(game.moves) for game, _ in games)
+        print(f'record: p50 {percentile(samples, 50) * 1e6:6.1f} us  p99 {percentile(samples, 99) * 1e6:6.1f} us '
+              f'per finished game; {stats["games"]} games in {stats["batches"]} batches, '
+              f'{drain * 1000:.0f} ms left to write at shutdown; {moves / len(games):.1f} bytes of moves per game')
+
+        store = HistoryStore(os.path.join(tmp, 'exported.db'))
+        started = time.perf_counter()
+        fill(store, rng, args.exported)
+        filled = time.perf_counter() - started
+        before = max_rss_mib()
+        path = os.path.join(tmp, 'games.jsonl')
+        started = time.perf_counter()
+        with open(path, 'w', encoding='utf-8') as f:
+            exported = export(store, f)
+        elapsed = time.perf_counter() - started
+        print(f'export: {exported} games in {elapsed:.1f} s ({exported / elapsed:.0f} games/s), '
+              f'{os.path.getsize(path) / 2 ** 20:.0f} MiB written, peak RSS {before:.0f} -> {max_rss_mib():.0f} MiB '
+              f'(database filled in {filled:.1f} s, {os.path.getsize(store.path) / 2 ** 20:.0f} MiB)')
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+import argparse
+import asyncio
+import importlib
+import os
+import tempfile
+import time
+
+import functions
+import journal as journal_module
+from state_store import SQLiteStateStore
+from benchmarks.fakes import bind_outbox, FakeBot, VirtualWheel, make_context, percentile
+from common import bot_players, games_in_progress, player_sessions, waiting_room
+
+bot_module = importlib.import_module('tic-tac-toe')
+
+
+async def run(games, moves, path):
+    bot = FakeBot()
+    bind_outbox(bot)
+    functions.wheel = VirtualWheel()
+    context = make_context(bot)
+    games_in_progress.clear()
+    player_sessions.clear()
+
+    journal = journal_module.Journal()
+    if path:
+        journal.open(SQLiteStateStore(path))
+    functions.journal = bot_module.journal = journal
+
+    players = []
+    for game in range(games):
+        user_id, opponent_id = 2 * game + 1, 2 * game + 2
+        await bot_module.start_game(user_id, f'p{user_id}', opponent_id, f'p{opponent_id}', context)
+        games_in_progress[user_id].assign_symbol(user_id, '❌')
+        await functions.set_turn_timer(context, user_id)
+        players.append(user_id)
+    await asyncio.sleep(0)
+
+    samples = []
+    # Alternate columns 0/1 on the 3x3 board: three moves each, nobody wins before the fourth row exists.
+    for move in range(moves):
+        game = games_in_progress[players[move % games]]
+        player = game.turn
+        cell = move // games // 2 * 3 + move // games % 2
+        game.play(game.side_of(player), cell)
+        started = time.perf_counter()
+        await functions.process_winner(player, game.opponent_of(player), context)
+        # Let the journal's per-tick flush run so its cost on the loop is part of the sample.
+        await asyncio.sleep(0)
+        samples.append(time.perf_counter() - started)
+    stats = journal.stats()
+    journal.close()
+    return samples, stats
+
+
+async def restart(path, context):
+    games_in_progress.clear()
+    player_sessions.clear()
+    waiting_room.clear()
+    bot_players.clear()
+    functions.wheel = VirtualWheel()
+    journal = journal_module.Journal()
+    journal.open(SQLiteStateStore(path))
+    functions.journal = bot_module.journal = journal
+    started = time.perf_counter()
+    restored = await functions.restore_live_state(context)
+    elapsed = time.perf_counter() - started
+    armed = len(functions.wheel)
+    journal.close()
+    return restored, armed, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cost of the write-behind journal on the move path, and recovery.')
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--moves', type=int, default=4, help='moves per game')
+    args = parser.parse_args()
+    moves = args.games * min(args.moves, 5)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'journal.db')
+        results = {}
+        for mode, journal_path in (('off', None), ('on', path)):
+            samples, stats = asyncio.run(run(args.games, moves, journal_path))
+            results[mode] = samples
+            print(f'journal {mode:>3}: p50 {percentile(samples, 50) * 1e6:7.1f} us  '
+                  f'p99 {percentile(samples, 99) * 1e6:7.1f} us per move  {stats}')
+        added = percentile(results['on'], 50) - percentile(results['off'], 50)
+        print(f'added to the move path: {added * 1e6:.1f} us at p50')
+
+        restored, armed, elapsed = asyncio.run(restart(path, make_context(FakeBot())))
+        print(f'restart: restored {restored[0]} games, {restored[1]} waiting, {restored[2]} challenges, '
+              f'{armed} timers re-armed in {elapsed * 1000:.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from ratings import Leaderboard
+
+TOP = 10
+
+
+def sql_queries(conn, user_id):
+    top = conn.execute('SELECT user_id, rating FROM ratings ORDER BY rating DESC, user_id LIMIT ?', (TOP,)).fetchall()
+    rating, = conn.execute('SELECT rating FROM ratings WHERE user_id = ?', (user_id,)).fetchone()
+    rank, = conn.execute('SELECT COUNT(*) FROM ratings WHERE rating > ? OR rating = ? AND user_id < ?',
+                         (rating, rating, user_id)).fetchone()
+    return top, rank + 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Leaderboard clicks and rating updates: skip list vs ORDER BY.')
+    parser.add_argument('--players', type=int, default=100_000)
+    parser.add_argument('--games', type=int, default=20_000)
+    parser.add_argument('--clicks', type=int, default=2_000)
+    args = parser.parse_args()
+    rng = random.Random(1)
+
+    rows = [(user_id, rng.gauss(1000, 150), 0, 0, 0) for user_id in range(1, args.players + 1)]
+    leaderboard = Leaderboard()
+    started = time.perf_counter()
+    leaderboard.load(rows)
+    print(f'{args.players} players loaded in {time.perf_counter() - started:.2f} s')
+
+    started = time.perf_counter()
+    for _ in range(args.games):
+        user_id, opponent_id = rng.sample(range(1, args.players + 1), 2)
+        leaderboard.record(user_id, opponent_id, rng.choice((0, 0.5, 1)))
+    elapsed = time.perf_counter() - started
+    print(f'game result:  {elapsed / args.games * 1e6:8.1f} µs (two ratings re-ranked)')
+
+    users = [rng.randrange(1, args.players + 1) for _ in range(args.clicks)]
+    started = time.perf_counter()
+    for user_id in users:
+        leaderboard.top(TOP)
+        leaderboard.rank_of(user_id)
+    memory = (time.perf_counter() - started) / args.clicks
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, 'ratings.db'))
+        conn.execute('CREATE TABLE ratings (user_id INTEGER PRIMARY KEY, rating REAL NOT NULL, wins INTEGER NOT NULL, '
+                     'losses INTEGER NOT NULL, draws INTEGER NOT NULL)')
+        conn.executemany('INSERT INTO ratings VALUES (?, ?, ?, ?, ?)',
+                         [(user_id, *leaderboard.row(user_id)) for user_id in leaderboard.players])
+        conn.commit()
+        clicks = users[:max(1, args.clicks // 20)]
+        started = time.perf_counter()
+        for user_id in clicks:
+            top, rank = sql_queries(conn, user_id)
+        sql = (time.perf_counter() - started) / len(clicks)
+        assert [user_id for user_id, _ in top] == [user_id for user_id, _ in leaderboard.top(TOP)]
+        assert rank == leaderboard.rank_of(clicks[-1])
+        conn.close()
+
+    print(f'leaderboard click (top {TOP} + my rank):  skip list {memory * 1e6:8.1f} µs  '
+          f'ORDER BY on SQLite {sql * 1e6:8.1f} µs  ({sql / memory:.0f}x)')
+
+
+if __name__ == '__main__':
+    main()
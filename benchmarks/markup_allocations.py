@@ -0,0 +1,82 @@
+import argparse
+import random
+import time
+import tracemalloc
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from engine import Board, move_callback
+from markups import board_markup, cache_stats, _board_markup
+
+
+def rebuilt_markup(board):
+    # What show_board used to do for each player on every move.
+    size = board.size
+    keyboard = [
+        [InlineKeyboardButton(symbol, callback_data=move_callback(i * size + j)) for j, symbol in enumerate(row)]
+        for i, row in enumerate(board.rows())
+    ]
+    return InlineKeyboardMarkup(keyboard)
+
+
+def positions(size, games, rng):
+    # Each move shows the board to both players.
+    boards = []
+    for _ in range(games):
+        board = Board(size)
+        side = 0
+        while board.winner() is None and not board.is_full():
+            board.play(side, rng.choice(board.empty_cells()))
+            snapshot = Board(size, board.geometry.length, board.masks)
+            boards.extend((snapshot, snapshot))
+            side ^= 1
+    return boards
+
+
+def measure(build, boards, reset=None):
+    # Markups are kept so that everything a move allocates is still in the heap when it is counted.
+    kept = []
+    if reset:
+        reset()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for board in boards:
+        kept.append(build(board))
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, 'filename')
+    blocks = sum(stat.count_diff for stat in stats)
+    size = sum(stat.size_diff for stat in stats)
+
+    # Timed separately: tracing slows allocation-heavy code far more than the rest.
+    if reset:
+        reset()
+    kept.clear()
+    started = time.perf_counter()
+    for board in boards:
+        kept.append(build(board))
+    elapsed = time.perf_counter() - started
+    moves = len(boards) / 2
+    return blocks / moves, size / moves, elapsed / moves
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Objects allocated for board keyboards per move, rebuilt vs cached.')
+    parser.add_argument('--games', type=int, default=2000)
+    args = parser.parse_args()
+
+    for size in (3, 8):
+        boards = positions(size, args.games, random.Random(size))
+        # Cold starts from an empty cache, as for positions no game has reached before; warm repeats the same games.
+        runs = (('rebuilt', rebuilt_markup, None), ('cold', board_markup, _board_markup.cache_clear),
+                ('warm', board_markup, None))
+        for name, build, reset in runs:
+            blocks, size_bytes, seconds = measure(build, boards, reset)
+            print(f'{size}x{size} {name:>8}: {blocks:7.1f} allocations  {size_bytes:9.0f} bytes  '
+                  f'{seconds * 1e6:7.1f} us per move')
+    board = cache_stats()['board']
+    print(f"board markup cache: {board['currsize']} positions, {board['hits']} hits, {board['misses']} misses")
+
+
+if __name__ == '__main__':
+    main()
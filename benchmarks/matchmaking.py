@@ -0,0 +1,86 @@
+import argparse
+import random
+import time
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from benchmarks.fakes import percentile
+from matchmaking import WaitingRoom, PAGE_SIZE
+
+
+def full_keyboard(players, user_id):
+    # What find_player used to send: one button per waiting player.
+    keyboard = [[InlineKeyboardButton(username, callback_data=f'select_player_{uid}')]
+                for uid, username in players.items() if uid != user_id]
+    keyboard.append([InlineKeyboardButton("Назад", callback_data='go_back')])
+    return InlineKeyboardMarkup(keyboard)
+
+
+def scan_match(players, ratings, user_id, rating):
+    best = None
+    for uid in players:
+        if uid != user_id and (best is None or abs(ratings[uid] - rating) < abs(ratings[best] - rating)):
+            best = uid
+    return best
+
+
+def timed(samples, call, *args):
+    started = time.perf_counter()
+    result = call(*args)
+    samples.append(time.perf_counter() - started)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Waiting room joins, auto-matching and browsing with many players.')
+    parser.add_argument('--players', type=int, default=50_000)
+    parser.add_argument('--matches', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    room = WaitingRoom()
+    players, ratings = {}, {}
+    joins = []
+    for user_id in range(1, args.players + 1):
+        rating = rng.randint(600, 2200)
+        timed(joins, room.add, user_id, f'player{user_id}', rating)
+        players[user_id] = f'player{user_id}'
+        ratings[user_id] = rating
+
+    indexed, scanned = [], []
+    for i in range(args.matches):
+        user_id, rating = args.players + 1 + i, rng.randint(600, 2200)
+        opponent_id, _ = timed(indexed, room.match, user_id, rating)
+        expected = timed(scanned, scan_match, players, ratings, user_id, rating)
+        if abs(ratings[opponent_id] - rating) != abs(ratings[expected] - rating):
+            raise AssertionError('Auto-matching did not pick the closest rating')
+        # Both sides leave the room and a newcomer takes the matched player's place, keeping the room full.
+        room.remove(opponent_id)
+        del players[opponent_id]
+        newcomer = args.players * 2 + i
+        room.add(newcomer, f'player{newcomer}', rating)
+        players[newcomer], ratings[newcomer] = f'player{newcomer}', rating
+
+    first = []
+    timed(first, room.page_markup, 0)
+    pages, cached, old = [], [], []
+    for _ in range(200):
+        timed(pages, room.page_markup, rng.randrange(args.players // PAGE_SIZE))
+        timed(cached, room.page_markup, 0)
+    for _ in range(5):
+        markup = timed(old, full_keyboard, players, 0)
+    buttons = sum(len(row) for row in markup.inline_keyboard)
+
+    print(f'{args.players} waiting players')
+    print(f'join:         p50 {percentile(joins, 50) * 1e6:9.1f} us  p99 {percentile(joins, 99) * 1e6:9.1f} us')
+    print(f'auto-match:   p50 {percentile(indexed, 50) * 1e6:9.1f} us  p99 {percentile(indexed, 99) * 1e6:9.1f} us  '
+          f'(linear scan p50 {percentile(scanned, 50) * 1e6:9.1f} us)')
+    print(f'page:         p50 {percentile(pages, 50) * 1e6:9.1f} us  cached p50 {percentile(cached, 50) * 1e6:5.1f} us  '
+          f'first page after a change '
+          f'{first[0] * 1e3:7.1f} ms (snapshot + page)')
+    print(f'full list:    p50 {percentile(old, 50) * 1e3:9.1f} ms  {buttons} buttons in one keyboard')
+
+
+if __name__ == '__main__':
+    main()
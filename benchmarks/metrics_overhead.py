@@ -0,0 +1,75 @@
+import argparse
+import asyncio
+import importlib
+import random
+import time
+
+import functions
+import metrics
+from benchmarks.fakes import FakeBot, VirtualWheel, bind_outbox, make_callback_update, make_context, percentile
+from common import games_in_progress, player_sessions
+from sessions import get_session
+
+bot_module = importlib.import_module('tic-tac-toe')
+
+
+def per_call(func, calls=200_000):
+    started = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - started) / calls
+
+
+async def play(games):
+    bot = FakeBot()
+    bind_outbox(bot)
+    context = make_context(bot)
+    functions.wheel = VirtualWheel()
+    rng = random.Random(1)
+    samples = []
+    for game in range(games):
+        user_id = 1000 + game
+        for data in ('play_bot', 'play_bot_easy'):
+            await bot_module.button(make_callback_update(bot, user_id, data), context)
+        while user_id in games_in_progress:
+            cell = rng.choice(games_in_progress[user_id].board.empty_cells())
+            update = make_callback_update(bot, user_id, f'move{cell}')
+            started = time.perf_counter()
+            await bot_module.button(update, context)
+            samples.append(time.perf_counter() - started)
+        await asyncio.sleep(0)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cost of the built-in metrics on the hot path.')
+    parser.add_argument('--games', type=int, default=2000)
+    parser.add_argument('--sessions', type=int, default=100_000)
+    args = parser.parse_args()
+
+    histogram, counter = metrics.Histogram(), metrics.Counter()
+    timed_noop = metrics.timed(metrics.DB_SECONDS)(lambda: None)
+    print(f'histogram observe {per_call(lambda: histogram.observe(0.0042)) * 1e9:6.0f} ns  '
+          f'counter inc {per_call(counter.inc) * 1e9:6.0f} ns  '
+          f'timed database call wrapper {(per_call(timed_noop) - per_call(lambda: None)) * 1e9:6.0f} ns')
+
+    on = asyncio.run(play(args.games))
+    # The same games with every observation turned into a no-op.
+    observe, inc = metrics.Histogram.observe, metrics.Counter.inc
+    metrics.Histogram.observe = lambda self, seconds: None
+    metrics.Counter.inc = lambda self, amount=1: None
+    off = asyncio.run(play(args.games))
+    metrics.Histogram.observe, metrics.Counter.inc = observe, inc
+    print(f'move callback p50: {percentile(on, 50) * 1e6:6.1f} us with metrics, '
+          f'{percentile(off, 50) * 1e6:6.1f} us without ({len(on)} moves)')
+
+    for user_id in range(args.sessions):
+        get_session(user_id).last_message_id = user_id
+    started = time.perf_counter()
+    text = metrics.registry.render()
+    print(f'scrape with {len(player_sessions)} sessions: {(time.perf_counter() - started) * 1000:.1f} ms, '
+          f'{len(text)} bytes')
+
+
+if __name__ == '__main__':
+    main()
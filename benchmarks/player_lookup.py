@@ -0,0 +1,88 @@
+import argparse
+import asyncio
+import importlib
+import os
+import random
+import tempfile
+import time
+
+import database
+import player_store
+from benchmarks.fakes import FakeBot, SlowSQLiteBackend, bind_outbox, copy_database, make_context, \
+    make_message_update, percentile
+from common import waiting_room
+from sessions import get_session
+
+bot_module = importlib.import_module('tic-tac-toe')
+
+
+async def timed(samples, call, *args):
+    started = time.perf_counter()
+    result = call(*args)
+    if asyncio.iscoroutine(result):
+        result = await result
+    samples.append(time.perf_counter() - started)
+    return result
+
+
+async def run(players, lookups, rng):
+    users = [(20_000_000 + i, f'Гравець{i}', f'user{i}') for i in range(players)]
+    player_ids = await player_store.get_or_create_players(users)
+
+    started = time.perf_counter()
+    await player_store.load_index()
+    loaded = time.perf_counter() - started
+
+    known = [player_ids[user_id] for user_id, _, _ in rng.sample(users, lookups)]
+    indexed, stored, searched = [], [], []
+    for player_id in known:
+        entry = await timed(indexed, player_store.find_player, player_id)
+        name = await timed(stored, player_store.run_in_store, database.get_player_name_from_player_id, player_id)
+        if entry[1] != name:
+            raise AssertionError('The index disagrees with the database')
+    for _ in range(lookups):
+        await timed(searched, player_store.search_players, f'гравець{rng.randrange(players)}'[:9])
+
+    # The full message path: a waiting player is found by ID and offered as the only button.
+    bot = FakeBot()
+    bind_outbox(bot)
+    context = make_context(bot)
+    user_id, first_name, _ = users[0]
+    waiting_room.add(user_id, first_name)
+    get_session(1).awaiting_id = True
+    messages, typed_names = [], []
+    for _ in range(lookups):
+        await timed(messages, bot_module.handle_message, make_message_update(bot, 1, player_ids[user_id]), context)
+    # A name prefix is no player ID, so it goes straight to the prefix search without asking the database first.
+    for _ in range(lookups):
+        await timed(typed_names, bot_module.handle_message, make_message_update(bot, 1, first_name[:4]), context)
+    await asyncio.sleep(0)
+    return loaded, indexed, stored, searched, messages, typed_names
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Player ID lookups and name search: in-memory index vs the database.')
+    parser.add_argument('--players', type=int, default=100_000)
+    parser.add_argument('--lookups', type=int, default=2000)
+    parser.add_argument('--db-delay', type=float, default=0.0, help='extra seconds per SQL statement')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = copy_database('tic_tac_toe.db', os.path.join(tmp, 'lookup.db'))
+        player_store.use_backend(SlowSQLiteBackend(path, args.db_delay))
+        database.create_table()
+        loaded, indexed, stored, searched, messages, typed_names = asyncio.run(run(args.players, args.lookups,
+                                                                      random.Random(1)))
+        database.pool.close()
+
+    print(f'{len(player_store.index)} players indexed in {loaded * 1000:.0f} ms')
+    print(f'ID lookup (index):    p50 {percentile(indexed, 50) * 1e6:8.1f} us  p99 {percentile(indexed, 99) * 1e6:8.1f} us')
+    print(f'ID lookup (database): p50 {percentile(stored, 50) * 1e6:8.1f} us  p99 {percentile(stored, 99) * 1e6:8.1f} us')
+    print(f'prefix search:        p50 {percentile(searched, 50) * 1e6:8.1f} us  p99 {percentile(searched, 99) * 1e6:8.1f} us')
+    print(f'typed ID message:     p50 {percentile(messages, 50) * 1e6:8.1f} us  p99 {percentile(messages, 99) * 1e6:8.1f} us')
+    print(f'typed name message:   p50 {percentile(typed_names, 50) * 1e6:8.1f} us  '
+          f'p99 {percentile(typed_names, 99) * 1e6:8.1f} us')
+
+
+if __name__ == '__main__':
+    main()
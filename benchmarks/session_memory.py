@@ -0,0 +1,88 @@
+import argparse
+import gc
+import time
+import tracemalloc
+from collections import Counter
+
+import sessions
+from common import JOIN_MARKUP, player_sessions
+from engine import Board
+from game_timers import GameTimers
+from sessions import Game, get_session, register_game, evict_idle_sessions
+from telegram import InlineKeyboardMarkup
+
+
+def legacy_state(users, playing, messages):
+    # The dicts this replaced: user_states with the menu markup each update carried in, user_messages and
+    # start_messages as ever-growing lists, and two player dicts per game.
+    user_states, user_messages, start_messages, board_ids, games = {}, {}, {}, {}, {}
+    for user_id in range(1, users + 1):
+        user_states[user_id] = {'awaiting_id': False, 'started': True,
+                                'reply_markup': InlineKeyboardMarkup.de_json(JOIN_MARKUP.to_dict(), None)}
+        user_messages[user_id] = list(range(user_id, user_id + messages))
+        start_messages[user_id] = [user_id]
+    for user_id in range(1, playing + 1, 2):
+        opponent_id = user_id + 1
+        board_ids[user_id] = board_ids[opponent_id] = user_id
+        games[user_id] = {'player_id': user_id, 'username': f'p{user_id}', 'opponent_id': opponent_id,
+                          'board': Board(), 'timers': GameTimers(), 'api_calls': Counter(), 'turn': user_id,
+                          'symbol': '❌'}
+        games[opponent_id] = dict(games[user_id], player_id=opponent_id, username=f'p{opponent_id}',
+                                  opponent_id=user_id, symbol='⭕')
+    return user_states, user_messages, start_messages, board_ids, games
+
+
+def session_state(users, playing, messages):
+    for user_id in range(1, users + 1):
+        session = get_session(user_id)
+        session.started = True
+        session.start_message_id = user_id
+        session.last_message_id = user_id + messages - 1
+    for user_id in range(1, playing + 1, 2):
+        game = Game(user_id, f'p{user_id}', user_id + 1, f'p{user_id + 1}')
+        game.assign_symbol(user_id, '❌')
+        register_game(game)
+        for player_id in game.players:
+            get_session(player_id).board_message_id = user_id
+
+
+def measure(build, *args):
+    gc.collect()
+    tracemalloc.start()
+    state = build(*args)
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return state, current
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Memory per user: legacy state dicts vs session and game objects.')
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--playing', type=float, default=0.1, help='share of users in a game')
+    parser.add_argument('--messages', type=int, default=20, help='messages tracked per user by the legacy lists')
+    args = parser.parse_args()
+    playing = int(args.users * args.playing) // 2 * 2
+
+    print(f'{args.users} users, {playing // 2} games, {args.messages} messages per user')
+    state, current = measure(legacy_state, args.users, playing, args.messages)
+    print(f'legacy dicts:     {current / 2 ** 20:7.1f} MiB  {current / args.users:6.0f} B/user')
+    del state
+
+    gc.collect()
+    tracemalloc.start()
+    session_state(args.users, playing, args.messages)
+    current = tracemalloc.get_traced_memory()[0]
+    print(f'session objects:  {current / 2 ** 20:7.1f} MiB  {current / args.users:6.0f} B/user')
+
+    started = time.perf_counter()
+    evicted = evict_idle_sessions(time.monotonic() + sessions.SESSION_IDLE_TIMEOUT)
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f'after idle sweep: {current / 2 ** 20:7.1f} MiB  evicted {evicted}, kept {len(player_sessions)} '
+          f'playing  ({elapsed / args.users * 1e9:.0f} ns per session swept, traced)')
+
+
+if __name__ == '__main__':
+    main()
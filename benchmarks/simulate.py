@@ -0,0 +1,170 @@
+import argparse
+import asyncio
+import importlib
+import os
+import random
+import resource
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+
+import functions
+import player_store
+from benchmarks.fakes import (FakeBot, SlowSQLiteBackend, VirtualWheel, bind_outbox, copy_database, make_context,
+                              make_callback_update, make_message_update, percentile)
+from common import bot_players, games_in_progress, player_sessions, waiting_room
+from history import history, HistoryStore
+from journal import journal
+from outbox import outbox
+from state_store import SQLiteStateStore
+
+bot_module = importlib.import_module('tic-tac-toe')
+
+# Simulated users get IDs far above real Telegram ones, so they never meet a player from the copied database.
+FIRST_USER_ID = 10 ** 12
+
+
+class Simulation:
+    def __init__(self, bot, context, seed):
+        self.bot = bot
+        self.context = context
+        self.rng = random.Random(seed)
+        self.updates = 0
+        self.games = 0
+        self.moves = 0
+        self.latencies = []
+        # Chat -> future resolved when the board edit for the last move reaches that chat.
+        self.pending = {}
+        bot.listeners.append(self.on_call)
+
+    def on_call(self, method, chat_id, kwargs):
+        if method != 'edit_message_text' or kwargs.get('reply_markup') is None:
+            return
+        entry = self.pending.pop(chat_id, None)
+        if entry is not None:
+            started, future = entry
+            self.latencies.append(time.perf_counter() - started)
+            if not future.done():
+                future.set_result(None)
+
+    async def message(self, user_id, text):
+        self.updates += 1
+        update = make_message_update(self.bot, user_id, text)
+        if text.startswith('/start'):
+            await bot_module.start(update, self.context)
+        else:
+            await bot_module.handle_message(update, self.context)
+
+    async def button(self, user_id, data):
+        self.updates += 1
+        await bot_module.button(make_callback_update(self.bot, user_id, data), self.context)
+
+    async def play_pair(self, host, guest, think):
+        await self.message(host, '/start')
+        await self.message(guest, '/start')
+        await self.button(host, 'join_waiting')
+        await asyncio.sleep(think)
+
+        # The guest browses the waiting room, then finds the host by typing the player ID.
+        await self.button(guest, 'find_player')
+        await self.button(guest, 'find_player_by_id')
+        await self.message(guest, player_store.index.player_id_of(host))
+        await asyncio.sleep(think)
+        await self.button(guest, f'select_player_{host}')
+        await asyncio.sleep(think)
+        await self.button(host, f'confirm_game_{guest}')
+        await self.button(host, f'symbol_choice_{host}_❌')
+
+        while host in games_in_progress:
+            await asyncio.sleep(think)
+            game = games_in_progress[host]
+            player = game.turn
+            opponent = game.opponent_of(player)
+            board = game.board
+            cell = self.rng.choice([cell for cell in range(board.size * board.size) if board.is_empty(cell)])
+            seen = asyncio.get_running_loop().create_future()
+            self.pending[opponent] = (time.perf_counter(), seen)
+            await self.button(player, f'move{cell}')
+            self.moves += 1
+            if host in games_in_progress:
+                # A player answers the board they can see, so the next move waits for the edit.
+                await seen
+            else:
+                self.pending.pop(opponent, None)
+        self.games += 1
+
+
+async def drain():
+    while outbox.stats()['queued']:
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0)
+
+
+async def run(args, tmp):
+    bot = FakeBot(args.delay, args.jitter, args.retry_rate, args.retry_seconds, args.seed)
+    bind_outbox(bot, args.throttled)
+    # Turn and challenge timers would only fire for idle players; nobody here idles.
+    functions.wheel = bot_module.wheel = VirtualWheel()
+    for state in (games_in_progress, player_sessions, waiting_room, bot_players):
+        state.clear()
+    journal.open(SQLiteStateStore(os.path.join(tmp, 'state.db')))
+    history.open(HistoryStore(os.path.join(tmp, 'history.db')))
+    await player_store.load_index()
+
+    simulation = Simulation(bot, make_context(bot), args.seed)
+    pairs = [(FIRST_USER_ID + 2 * pair, FIRST_USER_ID + 2 * pair + 1) for pair in range(args.players // 2)]
+    started = time.perf_counter()
+    await asyncio.gather(*(simulation.play_pair(host, guest, args.think) for host, guest in pairs))
+    await drain()
+    elapsed = time.perf_counter() - started
+
+    journal.close()
+    history.close()
+    return simulation, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Drive simulated players end to end through the bot, offline.')
+    parser.add_argument('--players', type=int, default=2000)
+    parser.add_argument('--delay', type=float, default=0.02, help='simulated Bot API round trip in seconds')
+    parser.add_argument('--jitter', type=float, default=0.01, help='extra random API latency, up to this many seconds')
+    parser.add_argument('--retry-rate', type=float, default=0.01, help='share of API calls answered with RetryAfter')
+    parser.add_argument('--retry-seconds', type=float, default=0.05, help='RetryAfter pause the fake Telegram asks for')
+    parser.add_argument('--db-delay', type=float, default=0.0, help='simulated database round trip in seconds')
+    parser.add_argument('--think', type=float, default=0.0, help='pause between a player\'s actions in seconds')
+    parser.add_argument('--throttled', action='store_true', help="apply Telegram's rate limits in the outbox")
+    parser.add_argument('--trace-memory', action='store_true', help='also report the Python heap peak (slower)')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = copy_database('tic_tac_toe.db', os.path.join(tmp, 'players.db'))
+        player_store.use_backend(SlowSQLiteBackend(path, args.db_delay))
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if args.trace_memory:
+            tracemalloc.start()
+        simulation, elapsed = asyncio.run(run(args, tmp))
+        heap_peak = tracemalloc.get_traced_memory()[1] if args.trace_memory else None
+        tracemalloc.stop()
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    bot = simulation.bot
+    calls = Counter(method for method, _ in bot.calls)
+    games = simulation.games or 1
+    latencies = simulation.latencies
+    print(f'{args.players} players, {simulation.games} games, {simulation.moves} moves in {elapsed:.2f} s '
+          f'({args.delay * 1000:.0f}+{args.jitter * 1000:.0f} ms API, {args.retry_rate:.0%} RetryAfter, '
+          f'{args.db_delay * 1000:.0f} ms DB)')
+    print(f'throughput:  {simulation.updates / elapsed:8.0f} updates/s ({simulation.updates} updates)')
+    print('move->edit: ' + ''.join(f' p{pct} {percentile(latencies, pct) * 1000:7.1f} ms' for pct in (50, 95, 99))
+          + f'  max {max(latencies, default=0) * 1000:7.1f} ms')
+    print(f'API calls:   {len(bot.calls) / games:8.1f} per game  '
+          + '  '.join(f'{method} {count / games:.1f}' for method, count in sorted(calls.items())))
+    print(f'RetryAfter:  {bot.retries} injected, {outbox.stats()["retried"]} retried')
+    print(f'memory:      peak RSS {rss_after / 1024:.0f} MiB (+{(rss_after - rss_before) / 1024:.0f} MiB in the run)'
+          + (f', Python heap peak {heap_peak / 2 ** 20:.0f} MiB' if heap_peak is not None else ''))
+
+
+if __name__ == '__main__':
+    main()
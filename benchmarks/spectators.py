@@ -0,0 +1,105 @@
+import argparse
+import asyncio
+import importlib
+import time
+
+import functions
+from benchmarks.fakes import FakeBot, VirtualWheel, bind_outbox, make_callback_update, make_context, percentile
+from broadcast import Broadcaster
+from common import games_in_progress, player_sessions
+from outbox import outbox, PRIORITY_MOVE
+from sessions import Game, register_game
+
+bot_module = importlib.import_module('tic-tac-toe')
+
+# A drawn 3x3 game, so spectators see all nine moves.
+MOVES = (0, 1, 2, 4, 3, 5, 7, 6, 8)
+FIRST_SPECTATOR = 1000
+
+
+class NaiveBroadcaster(Broadcaster):
+    # Every position straight to every spectator, the way show_board updates the players.
+    def publish(self, game_id, text, markup, final=False):
+        audience = self.audiences.get(game_id)
+        if audience is None:
+            return
+        for user_id, message_id in audience.watchers.items():
+            self.sent += 1
+            outbox.edit_message_text(text=text, chat_id=user_id, message_id=message_id, reply_markup=markup,
+                                     priority=PRIORITY_MOVE)
+
+
+async def run(broadcaster, spectators, delay, move_interval, timeout):
+    bot = FakeBot(delay)
+    bind_outbox(bot)
+    functions.wheel = bot_module.wheel = VirtualWheel()
+    functions.broadcaster = bot_module.broadcaster = broadcaster
+    games_in_progress.clear()
+    player_sessions.clear()
+    context = make_context(bot)
+
+    game = Game(1, 'p1', 2, 'p2')
+    game.assign_symbol(1, '❌')
+    register_game(game)
+    await asyncio.gather(functions.show_board(context, 1), functions.show_board(context, 2))
+    viewers = range(FIRST_SPECTATOR, FIRST_SPECTATOR + spectators)
+    await asyncio.gather(*(bot_module.button(make_callback_update(bot, user_id, 'watch_1'), context)
+                           for user_id in viewers))
+    while outbox.stats()['queued']:
+        await asyncio.sleep(0.01)
+    # Telegram's global and per-chat limits from here on; setting up the audience is not part of the run.
+    bind_outbox(bot, throttled=True)
+    calls_before = len(bot.calls)
+
+    moved_at = None
+    player_latency = []
+    result_at = {}
+
+    def on_call(method, chat_id, kwargs):
+        now = time.perf_counter()
+        if chat_id in game.players and method == 'edit_message_text' and moved_at is not None:
+            player_latency.append(now - moved_at)
+        elif chat_id >= FIRST_SPECTATOR and kwargs['text'].startswith('Нічия'):
+            result_at.setdefault(chat_id, now)
+
+    bot.listeners.append(on_call)
+    for cell in MOVES:
+        moved_at = time.perf_counter()
+        await bot_module.button(make_callback_update(bot, game.turn, f'move{cell}'), context)
+        await asyncio.sleep(move_interval)
+    ended = moved_at
+
+    deadline = time.monotonic() + timeout
+    while len(result_at) < spectators and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+    spectator_calls = sum(1 for _, chat_id in bot.calls[calls_before:] if chat_id >= FIRST_SPECTATOR)
+    backlog = outbox.stats()['queued'] + len(outbox.limiter._waiters)
+    seen = sorted(at - ended for at in result_at.values())
+    return spectator_calls, backlog, player_latency, seen
+
+
+def main():
+    parser = argparse.ArgumentParser(description='One game, many spectators, under Telegram rate limits.')
+    parser.add_argument('--spectators', type=int, default=1000)
+    parser.add_argument('--delay', type=float, default=0.02, help='simulated Bot API round trip in seconds')
+    parser.add_argument('--move-interval', type=float, default=1.0, help='seconds between moves')
+    parser.add_argument('--interval', type=float, default=2.0, help='SPECTATOR_INTERVAL for the broadcast run')
+    parser.add_argument('--timeout', type=float, default=90, help='seconds to wait for everyone to see the result')
+    parser.add_argument('--mode', choices=('naive', 'broadcast', 'both'), default='both')
+    args = parser.parse_args()
+
+    modes = ('naive', 'broadcast') if args.mode == 'both' else (args.mode,)
+    print(f'{args.spectators} spectators, {len(MOVES)} moves {args.move_interval:g} s apart')
+    for mode in modes:
+        broadcaster = NaiveBroadcaster() if mode == 'naive' else Broadcaster(args.interval)
+        calls, backlog, latency, seen = asyncio.run(run(broadcaster, args.spectators, args.delay,
+                                                        args.move_interval, args.timeout))
+        result = (f'all saw the result within {seen[-1]:5.1f} s of the last move (p50 {percentile(seen, 50):5.1f} s)'
+                  if len(seen) == args.spectators else
+                  f'{len(seen)}/{args.spectators} saw the result within {args.timeout:g} s, {backlog} requests queued')
+        print(f'{mode:>9}: {calls:5} spectator edits  player board edit p50 {percentile(latency, 50) * 1000:7.0f} ms '
+              f'max {max(latency, default=0) * 1000:7.0f} ms  {result}')
+
+
+if __name__ == '__main__':
+    main()
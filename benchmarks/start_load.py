@@ -0,0 +1,79 @@
+import argparse
+import asyncio
+import importlib
+import os
+import tempfile
+import time
+
+import database
+import player_store
+from benchmarks.fakes import bind_outbox, FakeBot, SlowSQLiteBackend, copy_database, make_context, make_message_update, percentile
+from common import player_sessions
+
+bot_module = importlib.import_module('tic-tac-toe')
+
+
+async def blocking_get_or_create_player(user_id, first_name, username):
+    return database.get_or_create_player(user_id, first_name, username)
+
+
+async def measure_loop_lag(stop, samples):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(0.001)
+        samples.append(loop.time() - started - 0.001)
+
+
+async def run(users, mode):
+    bot = FakeBot()
+    bind_outbox(bot)
+    context = make_context(bot)
+    latencies = []
+    lag = []
+    stop = asyncio.Event()
+
+    if mode == 'blocking':
+        bot_module.get_or_create_player = blocking_get_or_create_player
+    else:
+        bot_module.get_or_create_player = player_store.get_or_create_player
+
+    async def one(user_id):
+        update = make_message_update(bot, user_id, '/start')
+        started = time.perf_counter()
+        await bot_module.start(update, context)
+        latencies.append(time.perf_counter() - started)
+
+    lag_task = asyncio.create_task(measure_loop_lag(stop, lag))
+    started = time.perf_counter()
+    await asyncio.gather(*(one(10_000_000 + i) for i in range(users)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await lag_task
+    return elapsed, latencies, lag
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent /start latency against a slow player store.')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--db-delay', type=float, default=0.005, help='seconds per SQL statement')
+    parser.add_argument('--pool-size', type=int, default=database.POOL_SIZE)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ('blocking', 'async'):
+            path = copy_database('tic_tac_toe.db', os.path.join(tmp, f'{mode}.db'))
+            player_store.use_backend(SlowSQLiteBackend(path, args.db_delay), args.pool_size)
+            database.create_table()
+            player_sessions.clear()
+
+            elapsed, latencies, lag = asyncio.run(run(args.users, mode))
+            print(f'{mode:>8}: {args.users / elapsed:8.1f} starts/s  '
+                  f'p50 {percentile(latencies, 50) * 1000:7.1f} ms  '
+                  f'p99 {percentile(latencies, 99) * 1000:7.1f} ms  '
+                  f'max loop lag {max(lag, default=0) * 1000:7.1f} ms')
+            database.pool.close()
+
+
+if __name__ == '__main__':
+    main()
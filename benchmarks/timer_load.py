@@ -0,0 +1,82 @@
+import argparse
+import asyncio
+import importlib
+import time
+
+import functions
+from benchmarks.fakes import bind_outbox, FakeBot, make_context, percentile
+from common import games_in_progress, player_sessions
+from scheduler import wheel
+
+bot_module = importlib.import_module('tic-tac-toe')
+
+
+async def run(games, moves):
+    bot = FakeBot()
+    bind_outbox(bot)
+    context = make_context(bot)
+    games_in_progress.clear()
+    player_sessions.clear()
+
+    players = []
+    for game in range(games):
+        user_id, opponent_id = 2 * game + 1, 2 * game + 2
+        await bot_module.start_game(user_id, f'p{user_id}', opponent_id, f'p{opponent_id}', context)
+        games_in_progress[user_id].assign_symbol(user_id, '❌')
+        await functions.set_turn_timer(context, user_id)
+        players.append((user_id, opponent_id))
+
+    samples = []
+    for move in range(moves):
+        user_id, opponent_id = players[move % games]
+        game = games_in_progress[user_id]
+        if game.turn != user_id:
+            user_id, opponent_id = opponent_id, user_id
+        game.play(game.side_of(user_id), move // games % 2)
+
+        started = time.perf_counter()
+        await functions.process_winner(user_id, opponent_id, context)
+        samples.append(time.perf_counter() - started)
+
+    pending = len(wheel)
+    for user_id, _ in players:
+        games_in_progress[user_id].timers.cancel()
+    wheel.stop()
+    return samples, pending
+
+
+async def arm_and_cancel(timers):
+    handles = [wheel.call_later(20 + i % 300, print) for i in range(timers)]
+    started = time.perf_counter()
+    for handle in handles:
+        handle.cancel()
+    cancel = time.perf_counter() - started
+
+    started = time.perf_counter()
+    handles = [wheel.call_later(20 + i % 300, print) for i in range(timers)]
+    arm = time.perf_counter() - started
+    for handle in handles:
+        handle.cancel()
+    wheel.stop()
+    return arm / timers, cancel / timers
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Per-move timer bookkeeping cost as the number of live games grows.')
+    parser.add_argument('--games', type=int, nargs='+', default=[10, 100, 1000, 10000])
+    parser.add_argument('--moves', type=int, default=2000)
+    args = parser.parse_args()
+
+    for games in args.games:
+        samples, pending = asyncio.run(run(games, args.moves))
+        print(f'{games:>6} games: p50 {percentile(samples, 50) * 1e6:8.1f} us  '
+              f'p99 {percentile(samples, 99) * 1e6:8.1f} us per move  '
+              f'pending timers {pending} (turn + countdown per game)')
+
+    for timers in (10_000, 100_000):
+        arm, cancel = asyncio.run(arm_and_cancel(timers))
+        print(f'timer wheel with {timers} timers: arm {arm * 1e9:6.0f} ns  cancel {cancel * 1e9:6.0f} ns')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+import argparse
+import asyncio
+import importlib
+import random
+import resource
+import time
+
+import functions
+import tournament as tournament_module
+from benchmarks.fakes import FakeBot, VirtualWheel, bind_outbox, make_callback_update, make_context
+from common import games_in_progress, player_sessions
+from outbox import outbox
+
+bot_module = importlib.import_module('tic-tac-toe')
+
+
+async def drain():
+    while outbox.stats()['queued']:
+        await asyncio.sleep(0.01)
+
+
+async def play_round(bot, context, tournament, rng):
+    # Every player whose turn it is moves at once, as thousands of real players would.
+    round_number = tournament.round
+    moves = 0
+    while tournament.round == round_number and tournament.games:
+        turns = []
+        for match in list(tournament.games.values()):
+            game = games_in_progress.get(match.players[0])
+            if game is None or game.game_id != match.game_id:
+                continue
+            board = game.board
+            cell = rng.choice([cell for cell in range(board.size * board.size) if board.is_empty(cell)])
+            turns.append(bot_module.button(make_callback_update(bot, game.turn, f'move{cell}'), context))
+        await asyncio.gather(*turns)
+        moves += len(turns)
+    return moves
+
+
+async def run(players, tournament_format, delay, seed):
+    bot = FakeBot(delay)
+    bind_outbox(bot)
+    functions.wheel = bot_module.wheel = wheel = VirtualWheel()
+    games_in_progress.clear()
+    player_sessions.clear()
+    tournaments = tournament_module.Tournaments(players, tournament_format)
+    tournaments.on_game_over = bot_module.on_tournament_game_over
+    functions.tournaments = bot_module.tournaments = tournaments
+    context = make_context(bot)
+    rng = random.Random(seed)
+
+    launches = []
+    start_round = bot_module.start_round
+
+    async def timed_start_round(context, tournament):
+        # Creating the round's games, sending every board and arming the shared first deadline.
+        started = time.perf_counter()
+        await start_round(context, tournament)
+        launches.append((time.perf_counter() - started, len(tournament.games), len(wheel)))
+
+    bot_module.start_round = timed_start_round
+    await asyncio.gather(*(bot_module.button(make_callback_update(bot, user_id, 'tournament_join'), context)
+                           for user_id in range(1, players)))
+    # The last registration fills the tournament and launches round one from inside its handler.
+    await bot_module.button(make_callback_update(bot, players, 'tournament_join'), context)
+    tournament = next(iter(tournaments.running.values()))
+
+    rows = []
+    while tournaments.running:
+        round_number = tournament.round
+        started = time.perf_counter()
+        moves = await play_round(bot, context, tournament, rng)
+        # The round's last result launches the next one from inside its handler; that part is the next launch.
+        played = time.perf_counter() - started - (launches[round_number][0] if len(launches) > round_number else 0)
+        rows.append((round_number, *launches[round_number - 1], played, moves))
+    bot_module.start_round = start_round
+    await drain()
+    return tournament, rows, len(bot.calls)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Play out a whole tournament of simulated players.')
+    parser.add_argument('--players', type=int, default=4096)
+    parser.add_argument('--format', choices=sorted(tournament_module.FORMATS), default='single')
+    parser.add_argument('--delay', type=float, default=0.0, help='simulated Bot API round trip in seconds')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    tournament, rows, calls = asyncio.run(run(args.players, args.format, args.delay, args.seed))
+    elapsed = time.perf_counter() - started
+    games = sum(row[2] for row in rows)
+    moves = sum(row[5] for row in rows)
+    print(f'{args.players} players, {args.format}: {tournament.rounds} rounds, {games} games, {moves} moves '
+          f'in {elapsed:.1f} s, champion {tournament.names[tournament.champion()]}')
+    for round_number, launched, round_games, timers, played, round_moves in rows:
+        print(f'round {round_number:2}: {round_games:5} games  launch {launched * 1000:8.1f} ms  '
+              f'{timers:5} timers armed  play {played:6.2f} s ({round_moves / max(played, 1e-6):6.0f} moves/s)')
+    print(f'{calls / games:.1f} API calls per game, '
+          f'peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MiB')
+
+
+if __name__ == '__main__':
+    main()
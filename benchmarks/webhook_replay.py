@@ -0,0 +1,152 @@
+import argparse
+import asyncio
+import importlib
+import json
+import logging
+import os
+import tempfile
+import time
+
+import functions
+import player_store
+from benchmarks.fakes import FakeBot, VirtualWheel, bind_outbox, copy_database
+from common import games_in_progress, player_sessions
+from database import SQLiteBackend
+from sessions import Game, register_game
+from telegram import Bot, User
+from telegram.ext import Application
+from update_processor import OrderedUpdateProcessor
+from webhook import WebhookServer
+
+bot_module = importlib.import_module('tic-tac-toe')
+
+PATH = '/telegram'
+SECRET = 'replay-secret'
+# A drawn 3x3 game, so every game takes all nine moves.
+MOVES = (0, 1, 2, 4, 3, 5, 7, 6, 8)
+
+
+class ReplayBot(Bot):
+    # Answers callback queries after a simulated round trip instead of calling Telegram.
+    def __init__(self, delay):
+        super().__init__('0:replay')
+        self._delay = delay
+
+    async def initialize(self):
+        self._bot_user = User(0, 'replay', True, username='replay_bot')
+        self._initialized = True
+
+    async def shutdown(self):
+        pass
+
+    async def answer_callback_query(self, *args, **kwargs):
+        await asyncio.sleep(self._delay)
+        return True
+
+
+def callback_update(update_id, user_id, data):
+    return {'update_id': update_id,
+            'callback_query': {'id': str(update_id), 'chat_instance': str(user_id), 'data': data,
+                               'from': {'id': user_id, 'is_bot': False, 'first_name': f'p{user_id}'},
+                               'message': {'message_id': 1, 'date': 0,
+                                           'chat': {'id': user_id, 'type': 'private'}}}}
+
+
+def synthesize(games):
+    # Moves go round-robin across games, so every game is in flight at once, as with real traffic.
+    updates = []
+    for index, cell in enumerate(MOVES):
+        for game in range(games):
+            user_id = 2 * game + 1 + index % 2
+            updates.append(callback_update(len(updates) + 1, user_id, f'move{cell}'))
+    return updates
+
+
+async def setup_games(games):
+    for game in range(games):
+        user_id, opponent_id = 2 * game + 1, 2 * game + 2
+        game = Game(user_id, f'p{user_id}', opponent_id, f'p{opponent_id}')
+        game.assign_symbol(user_id, '❌')
+        register_game(game)
+        await functions.set_turn_timer(None, user_id)
+
+
+async def post_all(port, bodies):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    head = f'POST {PATH} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n' \
+           f'X-Telegram-Bot-Api-Secret-Token: {SECRET}\r\n'
+    # One keep-alive connection in file order: updates reach the bot in the order Telegram would send them.
+    for body in bodies:
+        writer.write(f'{head}Content-Length: {len(body)}\r\n\r\n'.encode() + body)
+        await writer.drain()
+        status = await reader.readline()
+        if not status.startswith(b'HTTP/1.1 200'):
+            raise RuntimeError(f'Webhook answered {status!r}')
+        while await reader.readline() not in (b'\r\n', b''):
+            pass
+    writer.close()
+
+
+async def run(updates, concurrency, delay, games):
+    bind_outbox(FakeBot(delay))
+    functions.wheel = VirtualWheel()
+    games_in_progress.clear()
+    player_sessions.clear()
+    application = (Application.builder().bot(ReplayBot(delay)).updater(None)
+                   .concurrent_updates(OrderedUpdateProcessor(concurrency)).build())
+    bot_module.add_handlers(application)
+
+    async with application:
+        await application.start()
+        server = WebhookServer(application, PATH, SECRET)
+        port = await server.start('127.0.0.1', 0)
+        if games:
+            await setup_games(games)
+
+        bodies = [json.dumps(update).encode() for update in updates]
+        started = time.perf_counter()
+        await post_all(port, bodies)
+        received = time.perf_counter() - started
+        await application.update_queue.join()
+        elapsed = time.perf_counter() - started
+
+        await server.stop()
+        await application.stop()
+    return received, elapsed, len(games_in_progress)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='POST recorded updates to the webhook endpoint and time processing.')
+    parser.add_argument('--updates', help='JSON lines file of Telegram updates to replay as-is')
+    parser.add_argument('--record', help='write the synthesized updates to this JSON lines file')
+    parser.add_argument('--games', type=int, default=500, help='games to synthesize when no file is given')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 64, 256])
+    parser.add_argument('--delay', type=float, default=0.02, help='simulated Bot API round trip in seconds')
+    args = parser.parse_args()
+    # Application start/stop is logged at INFO for every run.
+    logging.getLogger('telegram').setLevel(logging.WARNING)
+    logging.getLogger('apscheduler').setLevel(logging.WARNING)
+
+    if args.updates:
+        with open(args.updates) as f:
+            updates = [json.loads(line) for line in f if line.strip()]
+        games = 0
+    else:
+        updates = synthesize(args.games)
+        games = args.games
+        if args.record:
+            with open(args.record, 'w') as f:
+                f.writelines(json.dumps(update) + '\n' for update in updates)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # /start and name lookups in a replayed file need a player store; never the real one.
+        player_store.use_backend(SQLiteBackend(copy_database('tic_tac_toe.db', os.path.join(tmp, 'replay.db'))), 2)
+        print(f'{len(updates)} updates, {args.delay * 1000:.0f} ms simulated API round trip')
+        for concurrency in args.concurrency:
+            received, elapsed, unfinished = asyncio.run(run(updates, concurrency, args.delay, games))
+            print(f'concurrency {concurrency:4}: {len(updates) / elapsed:8.0f} updates/s  '
+                  f'(ingress {len(updates) / received:8.0f} updates/s, {unfinished // 2} games unfinished)')
+
+
+if __name__ == '__main__':
+    main()
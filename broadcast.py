@@ -0,0 +1,133 @@
+import asyncio
+import time
+from functools import partial
+
+import database
+from outbox import outbox, PRIORITY_SPECTATOR
+
+# Each audience gets at most one round of edits per SPECTATOR_INTERVAL seconds; positions in between are skipped.
+SPECTATOR_INTERVAL = float(database.credentials.get("SPECTATOR_INTERVAL", 2))
+
+
+class Audience:
+    __slots__ = ('watchers', 'delivered', 'in_flight', 'version', 'text', 'markup', 'last_flush', 'flush_handle',
+                 'closed')
+
+    def __init__(self, text, markup):
+        # user ID -> message showing them the game, and the version of the render it shows.
+        self.watchers = {}
+        self.delivered = {}
+        self.in_flight = set()
+        # One render shared by every watcher, bumped on each publish.
+        self.version = 1
+        self.text = text
+        self.markup = markup
+        self.last_flush = None
+        self.flush_handle = None
+        self.closed = False
+
+
+class Broadcaster:
+    # Spectators of live games. A watcher has at most one edit on its way; a newer position published meanwhile
+    # replaces the ones they have not been sent yet, so a slow audience skips moves instead of queueing them.
+    def __init__(self, interval=SPECTATOR_INTERVAL, clock=time.monotonic):
+        self.interval = interval
+        self.clock = clock
+        self.audiences = {}
+        self.watching = {}
+        self.sent = 0
+        self.skipped = 0
+
+    def __contains__(self, user_id):
+        return user_id in self.watching
+
+    def spectators(self):
+        return len(self.watching)
+
+    def watch(self, user_id, game_id, message_id, text, markup):
+        # Returns the render the caller shows in message_id right away.
+        self.unwatch(user_id)
+        audience = self.audiences.get(game_id)
+        if audience is None:
+            audience = self.audiences[game_id] = Audience(text, markup)
+        audience.watchers[user_id] = message_id
+        audience.delivered[user_id] = audience.version
+        self.watching[user_id] = game_id
+        return audience.text, audience.markup
+
+    def unwatch(self, user_id):
+        game_id = self.watching.pop(user_id, None)
+        if game_id is None:
+            return False
+        audience = self.audiences[game_id]
+        audience.watchers.pop(user_id, None)
+        audience.delivered.pop(user_id, None)
+        if not audience.watchers:
+            self._drop(game_id, audience)
+        return True
+
+    def publish(self, game_id, text, markup, final=False):
+        audience = self.audiences.get(game_id)
+        if audience is None:
+            return
+        audience.version += 1
+        audience.text = text
+        audience.markup = markup
+        audience.closed = final
+        self._schedule(game_id, audience)
+
+    def _schedule(self, game_id, audience):
+        if audience.flush_handle is not None:
+            return
+        delay = 0.0
+        if audience.last_flush is not None:
+            delay = max(0.0, audience.last_flush + self.interval - self.clock())
+        audience.flush_handle = asyncio.get_running_loop().call_later(delay, self._flush, game_id, audience)
+
+    def _flush(self, game_id, audience):
+        audience.flush_handle = None
+        audience.last_flush = self.clock()
+        version = audience.version
+        for user_id, message_id in audience.watchers.items():
+            delivered = audience.delivered[user_id]
+            if user_id in audience.in_flight or delivered >= version:
+                continue
+            self.skipped += version - delivered - 1
+            self.sent += 1
+            audience.in_flight.add(user_id)
+            future = outbox.edit_message_text(text=audience.text, chat_id=user_id, message_id=message_id,
+                                              reply_markup=audience.markup, priority=PRIORITY_SPECTATOR)
+            future.add_done_callback(partial(self._delivered, game_id, audience, user_id, version))
+        self._close_if_done(game_id, audience)
+
+    def _delivered(self, game_id, audience, user_id, version, future):
+        audience.in_flight.discard(user_id)
+        if user_id in audience.watchers:
+            if future.cancelled() or future.exception() is not None:
+                # Blocked the bot or deleted the message: stop sending to them.
+                self.unwatch(user_id)
+            else:
+                audience.delivered[user_id] = version
+                if audience.version > version:
+                    self._schedule(game_id, audience)
+        self._close_if_done(game_id, audience)
+
+    def _close_if_done(self, game_id, audience):
+        if audience.closed and not audience.in_flight and \
+                all(delivered == audience.version for delivered in audience.delivered.values()):
+            self._drop(game_id, audience)
+
+    def _drop(self, game_id, audience):
+        if audience.flush_handle is not None:
+            audience.flush_handle.cancel()
+        for user_id in audience.watchers:
+            if self.watching.get(user_id) == game_id:
+                del self.watching[user_id]
+        self.audiences.pop(game_id, None)
+
+    def stats(self):
+        return {'audiences': len(self.audiences), 'spectators': len(self.watching), 'sent': self.sent,
+                'skipped': self.skipped}
+
+
+broadcaster = Broadcaster()
@@ -0,0 +1,142 @@
+import json
+import time
+from collections import OrderedDict
+
+try:
+    import redis.asyncio as redis
+except ImportError:
+    redis = None
+
+MISSING = object()
+
+
+class TTLCache:
+    def __init__(self, maxsize, ttl, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+
+    def get(self, key, default=MISSING):
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        expires_at, value = entry
+        if expires_at <= self.clock():
+            del self._data[key]
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self._data[key] = (self.clock() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key, default=None):
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'size': len(self._data)}
+
+
+class RedisCacheBackend:
+    def __init__(self, url, ttl, prefix='ttt:'):
+        if redis is None:
+            raise RuntimeError('The shared player cache needs the "redis" package installed.')
+        self.client = redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    async def get(self, key):
+        raw = await self.client.get(self.prefix + key)
+        return MISSING if raw is None else json.loads(raw)
+
+    async def set(self, key, value):
+        await self.client.set(self.prefix + key, json.dumps(value), ex=int(self.ttl))
+
+    async def delete(self, *keys):
+        if keys:
+            await self.client.delete(*(self.prefix + key for key in keys))
+
+
+class PlayerCache:
+    def __init__(self, maxsize=10_000, ttl=600, shared=None):
+        self.by_user = TTLCache(maxsize, ttl)
+        self.by_player = TTLCache(maxsize, ttl)
+        self.shared = shared
+        self.shared_hits = 0
+        self.shared_misses = 0
+
+    async def _get(self, local, kind, key):
+        value = local.get(key)
+        if value is not MISSING or self.shared is None:
+            return value
+
+        value = await self.shared.get(f'{kind}:{key}')
+        if value is MISSING:
+            self.shared_misses += 1
+            return value
+
+        self.shared_hits += 1
+        if isinstance(value, list):
+            value = tuple(value)
+        local.set(key, value)
+        return value
+
+    async def get_user(self, user_id):
+        return await self._get(self.by_user, 'user', user_id)
+
+    async def get_player_name(self, player_id):
+        return await self._get(self.by_player, 'player', player_id)
+
+    async def remember(self, user_id, player_id, first_name):
+        self.by_user.set(user_id, (player_id, first_name))
+        self.by_player.set(player_id, first_name)
+        if self.shared is not None:
+            await self.shared.set(f'user:{user_id}', [player_id, first_name])
+            await self.shared.set(f'player:{player_id}', first_name)
+
+    async def remember_player_name(self, player_id, first_name):
+        self.by_player.set(player_id, first_name)
+        if self.shared is not None:
+            await self.shared.set(f'player:{player_id}', first_name)
+
+    async def invalidate(self, user_id):
+        entry = self.by_user.pop(user_id)
+        if entry is None and self.shared is not None:
+            entry = await self.shared.get(f'user:{user_id}')
+            entry = None if entry is MISSING else entry
+
+        keys = [f'user:{user_id}']
+        if entry is not None:
+            self.by_player.pop(entry[0])
+            keys.append(f'player:{entry[0]}')
+        if self.shared is not None:
+            await self.shared.delete(*keys)
+
+    def clear(self):
+        self.by_user.clear()
+        self.by_player.clear()
+
+    def stats(self):
+        return {'by_user': self.by_user.stats(),
+                'by_player': self.by_player.stats(),
+                'shared': {'hits': self.shared_hits, 'misses': self.shared_misses}}
@@ -1,14 +1,22 @@
+from collections import OrderedDict
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from matchmaking import WaitingRoom
 
-user_messages = {}
+# user ID -> Game; both players of a game point at the same object.
 games_in_progress = {}
-timers = {}
-user_board_message_ids = {}
-start_messages = {}
+# user ID -> PlayerSession, least recently seen first.
+player_sessions = OrderedDict()
+# Everyone in the waiting room, with their first names.
+waiting_room = WaitingRoom()
+bot_players = set()
 
 KEYBOARD_JOIN = [
             [InlineKeyboardButton("Перейти в зал очікування", callback_data='join_waiting')],
             [InlineKeyboardButton("Знайти гравця", callback_data='find_player')],
+            [InlineKeyboardButton("Автоматичний підбір", callback_data='auto_match')],
+            [InlineKeyboardButton("Грати з ботом", callback_data='play_bot')],
+            [InlineKeyboardButton("Турнір", callback_data='tournament')],
+            [InlineKeyboardButton("Дивитися гру", callback_data='live_games')],
             [InlineKeyboardButton("Налаштування", callback_data='settings')]
         ]
 JOIN_MARKUP = InlineKeyboardMarkup(KEYBOARD_JOIN)
@@ -18,4 +26,7 @@ KEYBOARD_LEAVE = [
                 [InlineKeyboardButton("Налаштування", callback_data='settings')]
             ]
 LEAVE_MARKUP = InlineKeyboardMarkup(KEYBOARD_LEAVE)
-tasks = []
+
+
+def menu_markup(user_id):
+    return LEAVE_MARKUP if user_id in waiting_room else JOIN_MARKUP
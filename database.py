@@ -1,8 +1,17 @@
 import secrets
 import string
 import json
-import pymssql
-from contextlib import closing
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from metrics import DB_SECONDS, timed
+
+try:
+    import pymssql
+except ImportError:
+    pymssql = None
 
 with open('credentials.json', 'r') as f:
     credentials = json.load(f)
@@ -12,6 +21,13 @@ database = credentials.get("DATABASE")
 login = credentials.get("LOGIN")
 password = credentials.get("PASSWORD")
 
+DB_BACKEND = credentials.get("DB_BACKEND", "mssql")
+SQLITE_PATH = credentials.get("SQLITE_PATH", "tic_tac_toe.db")
+POOL_SIZE = int(credentials.get("DB_POOL_SIZE", 5))
+PLAYER_ID_ATTEMPTS = 5
+PLAYER_ID_LENGTH = 6
+BULK_CHUNK_SIZE = 500
+
 
 def connect_db():
     conn = pymssql.connect(server=server,
@@ -22,19 +38,10 @@ def connect_db():
     return conn
 
 
-def generate_unique_player_id():
-    alphabet = string.ascii_letters + string.digits
-    while True:
-        player_id = ''.join(secrets.choice(alphabet) for _ in range(6))
-        return player_id
-
-
-def create_table():
-    with closing(connect_db()) as db:
-        with db as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-            IF NOT EXISTS ( 
+class MSSQLBackend:
+    placeholder = '%s'
+    create_table_sql = '''
+            IF NOT EXISTS (
                 SELECT * FROM INFORMATION_SCHEMA.TABLES
                 WHERE TABLE_NAME = 'players'
             )
@@ -43,89 +50,322 @@ def create_table():
                     user_id INT UNIQUE,
                     first_name NVARCHAR(20),
                     username NVARCHAR(20),
-                    player_id CHAR(6) PRIMARY KEY          
+                    player_id CHAR(6) PRIMARY KEY
                 )
             END
-        ''')
+        '''
 
+    create_ratings_sql = '''
+            IF NOT EXISTS (
+                SELECT * FROM INFORMATION_SCHEMA.TABLES
+                WHERE TABLE_NAME = 'ratings'
+            )
+            BEGIN
+                CREATE TABLE ratings (
+                    user_id INT PRIMARY KEY,
+                    rating FLOAT NOT NULL,
+                    wins INT NOT NULL,
+                    losses INT NOT NULL,
+                    draws INT NOT NULL
+                )
+            END
+        '''
 
-def view_table():
-    with closing(connect_db()) as db:
-        with db as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM players')
-            rows = cursor.fetchall()
-            for row in rows:
-                print(row)
+    @property
+    def integrity_errors(self):
+        return (pymssql.IntegrityError,) if pymssql else ()
 
+    def upsert_players_sql(self, count):
+        rows = ', '.join(['(%s, %s, %s, %s)'] * count)
+        return f'''
+            MERGE players WITH (HOLDLOCK) AS target
+            USING (VALUES {rows}) AS source (user_id, first_name, username, player_id)
+            ON target.user_id = source.user_id
+            WHEN MATCHED THEN UPDATE SET target.user_id = target.user_id
+            WHEN NOT MATCHED THEN INSERT (user_id, first_name, username, player_id)
+                VALUES (source.user_id, source.first_name, source.username, source.player_id)
+            OUTPUT inserted.user_id, inserted.player_id, inserted.first_name;
+        '''
+
+    def upsert_ratings_sql(self, count):
+        rows = ', '.join(['(%s, %s, %s, %s, %s)'] * count)
+        return f'''
+            MERGE ratings WITH (HOLDLOCK) AS target
+            USING (VALUES {rows}) AS source (user_id, rating, wins, losses, draws)
+            ON target.user_id = source.user_id
+            WHEN MATCHED THEN UPDATE SET rating = source.rating, wins = source.wins, losses = source.losses,
+                draws = source.draws
+            WHEN NOT MATCHED THEN INSERT (user_id, rating, wins, losses, draws)
+                VALUES (source.user_id, source.rating, source.wins, source.losses, source.draws);
+        '''
+
+    def connect(self):
+        return connect_db()
+
+
+class SQLiteBackend:
+    placeholder = '?'
+    integrity_errors = (sqlite3.IntegrityError,)
+    create_table_sql = '''
+            CREATE TABLE IF NOT EXISTS players (
+                user_id INTEGER UNIQUE,
+                first_name VARCHAR(20),
+                username VARCHAR(20),
+                player_id VARCHAR(6) PRIMARY KEY
+            )
+        '''
+
+    create_ratings_sql = '''
+            CREATE TABLE IF NOT EXISTS ratings (
+                user_id INTEGER PRIMARY KEY,
+                rating REAL NOT NULL,
+                wins INTEGER NOT NULL,
+                losses INTEGER NOT NULL,
+                draws INTEGER NOT NULL
+            )
+        '''
+
+    def __init__(self, path=SQLITE_PATH):
+        self.path = path
+
+    def upsert_players_sql(self, count):
+        rows = ', '.join(['(?, ?, ?, ?)'] * count)
+        return f'''
+            INSERT INTO players (user_id, first_name, username, player_id)
+            VALUES {rows}
+            ON CONFLICT (user_id) DO UPDATE SET user_id = excluded.user_id
+            RETURNING user_id, player_id, first_name
+        '''
+
+    def upsert_ratings_sql(self, count):
+        rows = ', '.join(['(?, ?, ?, ?, ?)'] * count)
+        return f'''
+            INSERT INTO ratings (user_id, rating, wins, losses, draws)
+            VALUES {rows}
+            ON CONFLICT (user_id) DO UPDATE SET rating = excluded.rating, wins = excluded.wins,
+                losses = excluded.losses, draws = excluded.draws
+        '''
+
+    def connect(self):
+        return sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+
+
+class ConnectionPool:
+    def __init__(self, backend, size=POOL_SIZE):
+        self.backend = backend
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    @contextmanager
+    def connection(self):
+        self._slots.acquire()
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self.backend.connect()
+
+            try:
+                yield conn
+            except Exception:
+                # The connection may be left mid-transaction or broken, so it is not reused.
+                conn.close()
+                raise
+            self._idle.put(conn)
+        finally:
+            self._slots.release()
+
+    def sql(self, query):
+        if self.backend.placeholder == '%s':
+            return query
+        return query.replace('%s', self.backend.placeholder)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+def make_backend(name=DB_BACKEND):
+    if name == 'sqlite':
+        return SQLiteBackend()
+    return MSSQLBackend()
+
+
+pool = ConnectionPool(make_backend())
+
+
+def set_backend(backend, size=POOL_SIZE):
+    global pool
+    pool.close()
+    pool = ConnectionPool(backend, size)
+    return pool
 
-def insert_player(user_id, first_name, username):
-    player_id = generate_unique_player_id()
 
-    while get_player_name_from_player_id(player_id):
-        player_id = generate_unique_player_id()
+def _execute(query, params=()):
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(pool.sql(query), params)
+        conn.commit()
 
-    with closing(connect_db()) as db:
-        with db as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
+
+def _fetchone(query, params=()):
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(pool.sql(query), params)
+        return cursor.fetchone()
+
+
+def _fetchall(query, params=()):
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(pool.sql(query), params)
+        return cursor.fetchall()
+
+
+def generate_unique_player_id():
+    alphabet = string.ascii_letters + string.digits
+    while True:
+        player_id = ''.join(secrets.choice(alphabet) for _ in range(PLAYER_ID_LENGTH))
+        return player_id
+
+
+def create_table():
+    _execute(pool.backend.create_table_sql)
+
+
+def create_ratings_table():
+    _execute(pool.backend.create_ratings_sql)
+
+
+def view_table():
+    rows = _fetchall('SELECT * FROM players')
+    for row in rows:
+        print(row)
+
+
+@timed(DB_SECONDS)
+def insert_player(user_id, first_name, username):
+    # A clashing player_id is rejected by the primary key; draw a new one instead of polling for free IDs.
+    for attempt in range(PLAYER_ID_ATTEMPTS):
+        try:
+            _execute('''
                 INSERT INTO players (user_id, first_name, username, player_id)
                 VALUES (%s, %s, %s, %s)
-            ''', (user_id, first_name, username, player_id))
-            conn.commit()
+            ''', (user_id, first_name, username, generate_unique_player_id()))
+            return
+        except pool.backend.integrity_errors:
+            if attempt == PLAYER_ID_ATTEMPTS - 1 or _player_id(user_id):
+                raise
 
 
+@timed(DB_SECONDS)
 def delete_player(user_id):
-    with closing(connect_db()) as db:
-        with db as conn:
-            cursor = conn.cursor()
-            cursor.execute('DELETE FROM players WHERE user_id = %s', (user_id,))
+    _execute('DELETE FROM players WHERE user_id = %s', (user_id,))
 
 
+# Timed functions call only untimed helpers, so no query is counted twice in DB_SECONDS.
+@timed(DB_SECONDS)
 def get_player_id(user_id):
-    with closing(connect_db()) as db:
-        with db as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT player_id FROM players WHERE user_id = %s', (user_id,))
-            row = cursor.fetchone()
-            return row[0] if row else None
+    return _player_id(user_id)
 
 
+def _player_id(user_id):
+    row = _fetchone('SELECT player_id FROM players WHERE user_id = %s', (user_id,))
+    return row[0] if row else None
+
+
+@timed(DB_SECONDS)
+def get_player(user_id):
+    row = _fetchone('SELECT player_id, first_name FROM players WHERE user_id = %s', (user_id,))
+    return tuple(row) if row else None
+
+
+@timed(DB_SECONDS)
 def get_player_name_from_player_id(player_id):
-    with closing(connect_db()) as db:
-        with db as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT first_name FROM players WHERE player_id = %s', (player_id,))
-            row = cursor.fetchone()
-            return row[0] if row else None
+    row = _fetchone('SELECT first_name FROM players WHERE player_id = %s', (player_id,))
+    return row[0] if row else None
+
 
+@timed(DB_SECONDS)
+def get_player_by_player_id(player_id):
+    row = _fetchone('SELECT user_id, first_name, username FROM players WHERE player_id = %s', (player_id,))
+    return tuple(row) if row else None
 
+
+@timed(DB_SECONDS)
+def get_all_players():
+    return _fetchall('SELECT user_id, first_name, username, player_id FROM players')
+
+
+@timed(DB_SECONDS)
 def get_player_name_from_user_id(user_id):
-    with closing(connect_db()) as db:
-        with db as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT first_name FROM players WHERE user_id = %s', (user_id,))
-            row = cursor.fetchone()
-            return row[0] if row else None
+    row = _fetchone('SELECT first_name FROM players WHERE user_id = %s', (user_id,))
+    return row[0] if row else None
+
+
+def _upsert_players(rows):
+    query = pool.backend.upsert_players_sql(len(rows))
+    for attempt in range(PLAYER_ID_ATTEMPTS):
+        params = [value for user_id, first_name, username in rows
+                  for value in (user_id, first_name, username, generate_unique_player_id())]
+        try:
+            return _fetchall(query, params)
+        except pool.backend.integrity_errors:
+            if attempt == PLAYER_ID_ATTEMPTS - 1:
+                raise
 
 
+@timed(DB_SECONDS)
+def get_or_create_players(users):
+    pending = {}
+    for user_id, first_name, username in users:
+        pending[user_id] = (user_id, first_name, username or '-')
+
+    rows = list(pending.values())
+    player_ids = {}
+    for start in range(0, len(rows), BULK_CHUNK_SIZE):
+        for user_id, player_id, _ in _upsert_players(rows[start:start + BULK_CHUNK_SIZE]):
+            player_ids[user_id] = player_id
+    return player_ids
+
+
+@timed(DB_SECONDS)
+def get_or_create_player_profile(user_id, first_name, username):
+    return _get_or_create_player_profile(user_id, first_name, username)
+
+
+@timed(DB_SECONDS)
 def get_or_create_player(user_id, first_name, username):
+    return _get_or_create_player_profile(user_id, first_name, username)[0]
+
+
+def _get_or_create_player_profile(user_id, first_name, username):
     if not username:
         username = '-'
 
-    player_id = get_player_id(user_id)
-    if not player_id:
-        insert_player(user_id, first_name, username)
+    _, player_id, stored_name = _upsert_players([(user_id, first_name, username)])[0]
+    return player_id, stored_name
+
+
+@timed(DB_SECONDS)
+def get_all_ratings():
+    return _fetchall('SELECT user_id, rating, wins, losses, draws FROM ratings')
+
 
-    player_id = get_player_id(user_id)
-    return player_id
+@timed(DB_SECONDS)
+def save_ratings(rows):
+    # Absolute values rather than increments, so a batch can be retried or replayed without double counting.
+    for start in range(0, len(rows), BULK_CHUNK_SIZE):
+        chunk = rows[start:start + BULK_CHUNK_SIZE]
+        _execute(pool.backend.upsert_ratings_sql(len(chunk)), [value for row in chunk for value in row])
 
 
 def drop_table():
-    with closing(connect_db()) as db:
-        with db as conn:
-            cursor = conn.cursor()
-            cursor.execute('DROP TABLE players')
+    _execute('DROP TABLE players')
 
 
 if __name__ == "__main__":
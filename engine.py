@@ -0,0 +1,112 @@
+from functools import lru_cache
+
+SYMBOLS = ('❌', '⭕')
+EMPTY = ' '
+
+# Board side -> cells in a row needed to win. 8x8 is the largest keyboard Telegram accepts (8 buttons per row).
+BOARD_SIZES = {3: 3, 5: 4, 8: 5}
+DEFAULT_SIZE = 3
+
+DIRECTIONS = ((0, 1), (1, 0), (1, 1), (1, -1))
+MOVE_PREFIX = 'move'
+
+
+class Geometry:
+    __slots__ = ('size', 'length', 'cells', 'full', 'lines', 'lines_through')
+
+    def __init__(self, size, length):
+        self.size = size
+        self.length = length
+        self.cells = size * size
+        self.full = (1 << self.cells) - 1
+
+        lines = []
+        lines_through = [[] for _ in range(self.cells)]
+        for row in range(size):
+            for col in range(size):
+                for d_row, d_col in DIRECTIONS:
+                    end_row, end_col = row + d_row * (length - 1), col + d_col * (length - 1)
+                    if not (0 <= end_row < size and 0 <= end_col < size):
+                        continue
+                    cells = [(row + d_row * i) * size + col + d_col * i for i in range(length)]
+                    line = sum(1 << cell for cell in cells)
+                    lines.append(line)
+                    for cell in cells:
+                        lines_through[cell].append(line)
+        self.lines = tuple(lines)
+        self.lines_through = tuple(tuple(cell_lines) for cell_lines in lines_through)
+
+
+@lru_cache(maxsize=None)
+def geometry(size, length=None):
+    return Geometry(size, length or BOARD_SIZES[size])
+
+
+def side_of(symbol):
+    return SYMBOLS.index(symbol)
+
+
+class Board:
+    __slots__ = ('geometry', 'masks', 'winning_side')
+
+    def __init__(self, size=DEFAULT_SIZE, length=None, masks=(0, 0)):
+        self.geometry = geometry(size, length)
+        self.masks = list(masks)
+        self.winning_side = None
+        for side in (0, 1):
+            if self.has_line(self.masks[side]):
+                self.winning_side = side
+
+    def has_line(self, mask):
+        return any(mask & line == line for line in self.geometry.lines)
+
+    @property
+    def size(self):
+        return self.geometry.size
+
+    def occupied(self):
+        return self.masks[0] | self.masks[1]
+
+    def is_empty(self, cell):
+        return 0 <= cell < self.geometry.cells and not self.occupied() >> cell & 1
+
+    def play(self, side, cell):
+        mask = self.masks[side] | 1 << cell
+        self.masks[side] = mask
+        # Only lines through the new stone can have been completed by it.
+        for line in self.geometry.lines_through[cell]:
+            if mask & line == line:
+                self.winning_side = side
+                break
+
+    def empty_cells(self):
+        free = self.geometry.full & ~self.occupied()
+        cells = []
+        while free:
+            low = free & -free
+            cells.append(low.bit_length() - 1)
+            free ^= low
+        return cells
+
+    def winner(self):
+        return self.winning_side
+
+    def is_full(self):
+        return self.occupied() == self.geometry.full
+
+    def key(self):
+        return self.geometry.size, self.masks[0], self.masks[1]
+
+    def cells(self):
+        x, o = self.masks
+        return [SYMBOLS[0] if x >> cell & 1 else SYMBOLS[1] if o >> cell & 1 else EMPTY
+                for cell in range(self.geometry.cells)]
+
+    def rows(self):
+        cells = self.cells()
+        size = self.geometry.size
+        return [cells[row * size:(row + 1) * size] for row in range(size)]
+
+
+def move_callback(cell):
+    return f'{MOVE_PREFIX}{cell}'
@@ -1,246 +1,366 @@
-import telegram.error
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import CallbackContext
 from datetime import timedelta
-from common import games_in_progress, timers, user_board_message_ids, JOIN_MARKUP, tasks, user_messages, start_messages
-import random
+from common import games_in_progress, player_sessions, waiting_room, JOIN_MARKUP, bot_players
 import asyncio
+import random
+import time
+from scheduler import wheel
+from engine import Board
+from ai import best_move
+from outbox import outbox, fan_out, PRIORITY_MOVE
+from markups import BACK_MARKUP, board_markup, spectator_markup
+from sessions import get_session, register_game, finish_game
+from journal import journal
+from history import history
+from ratings import leaderboard
+from tournament import tournaments
+from broadcast import broadcaster
 
 TURN_TIME_LIMIT = timedelta(seconds=20)
 CONFIRM_TIME_LIMIT = timedelta(minutes=5)
+COUNTDOWN_SECONDS = 7
+# 'message' sends a separate countdown message ticking every second, 'board' folds the remaining time
+# into the board message at the marks below.
+COUNTDOWN_MODE = 'board'
+COUNTDOWN_MARKS = (10, 5, 3)
+# Strength of the move made for a player who runs out of time; 'easy' is a random cell, as the rules promise.
+TIMEOUT_MOVE_DIFFICULTY = 'easy'
+
+
+def next_bot_id():
+    # Bot opponents get negative pseudo user IDs, which never collide with Telegram users. They are random rather
+    # than counted so that bots restored after a restart cannot clash with new ones.
+    return -random.getrandbits(62) - 1
 
 
 async def clear_previous_message(user_id, context):
-    await context.bot.delete_message(chat_id=user_id, message_id=user_messages[user_id][-1])
+    session = player_sessions.get(user_id)
+    if session is not None and session.last_message_id is not None:
+        outbox.delete_message(chat_id=user_id, message_id=session.last_message_id)
 
 
 async def set_confirm_timer(context: CallbackContext, player_id: int, username: str,
-                            opponent_id: int, opponent_name: str) -> None:
-    job = context.job_queue.run_once(
-        callback=confirm_timeout,
-        when=CONFIRM_TIME_LIMIT,
-        data={'player_id': player_id,
-              'username': username,
-              'opponent_id': opponent_id,
-              'opponent_name': opponent_name},
-        name=f'confirm_timer_{player_id}'
-    )
-    print(f"Set confirm timer for {player_id}")
-    timers[player_id] = job
-
-
-async def set_turn_timer(context: CallbackContext, player_id: int) -> None:
-    job = context.job_queue.run_once(
-        callback=turn_timeout,
-        when=TURN_TIME_LIMIT,
-        data={'player_id': player_id},
-        name=f'timer_{player_id}'
-    )
-    timers[player_id] = job
-    task = asyncio.create_task(set_countdown(context, player_id))
-    tasks.append(task)
-
-
-async def confirm_timeout(context: CallbackContext) -> None:
-    job = context.job
-    player_id = job.data['player_id']
-    username = job.data['username']
-    opponent_id = job.data['opponent_id']
-    opponent_name = job.data['opponent_name']
+                            opponent_id: int, opponent_name: str, delay=None) -> None:
+    if delay is None:
+        delay = CONFIRM_TIME_LIMIT.total_seconds()
+    session = get_session(player_id)
+    # A newer challenge replaces the pending one; its timer would otherwise still fire.
+    if session.confirm_timer is not None:
+        session.confirm_timer.cancel()
+    session.confirm_timer = wheel.call_later(delay, confirm_timeout, context, player_id, username, opponent_id,
+                                             opponent_name)
+    session.challenger = opponent_id
+    journal.save_challenge(player_id, username, opponent_id, opponent_name, time.time() + delay)
+
+
+def cancel_confirm_timer(player_id: int) -> None:
+    session = player_sessions.get(player_id)
+    if session is not None and session.confirm_timer is not None:
+        session.confirm_timer.cancel()
+        session.confirm_timer = None
+        session.challenger = None
+    journal.drop_challenge(player_id)
+
+
+async def set_turn_timer(context: CallbackContext, player_id: int, remaining=None) -> None:
+    game = games_in_progress[player_id]
+    if remaining is None:
+        remaining = TURN_TIME_LIMIT.total_seconds()
+    game.deadline = time.time() + remaining
+    journal.save_game(game)
+
+    game_timers = game.timers
+    # Re-arming replaces whatever is still pending; left alone, the old timers would fire as well.
+    game_timers.cancel()
+    game_timers.turn_timer = wheel.call_later(remaining, turn_timeout, context, player_id)
+    if COUNTDOWN_MODE == 'board':
+        marks = [mark for mark in COUNTDOWN_MARKS if mark <= remaining]
+        mark = marks[0] if marks else 0
+        delay = remaining - mark
+    else:
+        mark = min(COUNTDOWN_SECONDS, int(remaining) - 1)
+        delay = remaining - mark - 1
+    if mark > 0:
+        game_timers.countdown_timer = wheel.call_later(delay, countdown_tick, context, player_id, mark)
+
+
+def is_bot_player(user_id):
+    return user_id in bot_players
+
+
+def send_to_player(chat_id, text, **kwargs):
+    if is_bot_player(chat_id):
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(None)
+        return future
+    return outbox.send_message(chat_id=chat_id, text=text, **kwargs)
+
+
+async def choose_move(game, player_id, difficulty):
+    # Returns None if the game moved on while a larger board was being searched.
+    board = game.board
+    side = game.side_of(player_id)
+    if board.size == 3 or difficulty == 'easy':
+        return best_move(board, side, difficulty)
+    # Searching a larger board takes up to the search budget, so it runs off the event loop on a copy.
+    snapshot = Board(board.size, board.geometry.length, board.masks)
+    cell = await asyncio.get_running_loop().run_in_executor(None, best_move, snapshot, side, difficulty)
+    if games_in_progress.get(player_id) is not game or game.turn != player_id or not board.is_empty(cell):
+        return None
+    return cell
+
+
+def count_api_call(game, method, calls=1):
+    game.api_calls[method] += calls
+
+
+async def confirm_timeout(context: CallbackContext, player_id: int, username: str,
+                          opponent_id: int, opponent_name: str) -> None:
+    session = player_sessions.get(player_id)
+    if session is not None:
+        session.confirm_timer = None
+        session.challenger = None
+    journal.drop_challenge(player_id)
 
     await clear_previous_message(player_id, context)
-    await context.bot.send_message(chat_id=player_id,
-                                   text=f"Ви не відповіли на виклик {opponent_name}.")
-    await context.bot.send_message(chat_id=opponent_id,
-                                   text=f"{username} не відповів(-ла) на ваш виклик.")
+    outbox.send_message(chat_id=player_id,
+                        text=f"Ви не відповіли на виклик {opponent_name}.")
+    outbox.send_message(chat_id=opponent_id,
+                        text=f"{username} не відповів(-ла) на ваш виклик.")
 
 
-async def turn_timeout(context: CallbackContext) -> None:
-    job = context.job
-    player_id = job.data['player_id']
+async def turn_timeout(context: CallbackContext, player_id: int) -> None:
     game = games_in_progress.get(player_id)
 
     if game:
-        opponent_id = game['opponent_id']
+        opponent_id = game.opponent_of(player_id)
+        game.timers.turn_timer = None
 
-        await context.bot.send_message(
+        count_api_call(game, 'send_message', 2)
+        send_to_player(
             chat_id=player_id,
             text="Час на хід вичерпано! Хід передається іншому гравцю."
         )
-        await context.bot.send_message(
+        send_to_player(
             chat_id=opponent_id,
             text="Ваш опонент не здійснив хід вчасно. Тепер ваш хід."
         )
 
-        board = game['board']
-        empty_cells = get_empty_cells(board)
-        random_index = random.choice(empty_cells)
-        game['board'][random_index] = game['symbol']
+        cell = await choose_move(game, player_id, TIMEOUT_MOVE_DIFFICULTY)
+        if cell is None:
+            return
+        game.play(game.side_of(player_id), cell, auto=True)
 
         await process_winner(player_id, opponent_id, context)
 
 
-async def set_countdown(context: CallbackContext, user_id: int):
-    await asyncio.sleep(12)
+async def countdown_tick(context: CallbackContext, user_id: int, remaining: int):
+    game = games_in_progress.get(user_id)
+    if not game:
+        return
 
-    countdown_message_id = None
+    game_timers = game.timers
+    handle = game_timers.countdown_timer
 
-    for i in range(7, 0, -1):
-        if countdown_message_id:
-            try:
-                await context.bot.edit_message_text(
-                    text=f"У вас залишилося {i} секунд!",
-                    chat_id=user_id,
-                    message_id=countdown_message_id
-                )
-            except telegram.error.BadRequest:
-                pass
-        else:
-            message = await context.bot.send_message(chat_id=user_id, text=f"У вас залишилося {i} секунд!")
-            countdown_message_id = message.message_id
+    if COUNTDOWN_MODE == 'board':
+        await show_board(context, user_id, remaining)
+        later_marks = [mark for mark in COUNTDOWN_MARKS if mark < remaining]
+        next_remaining = later_marks[0] if later_marks else 0
+    else:
+        await send_countdown_message(context, game, user_id, remaining, handle)
+        next_remaining = remaining - 1
+
+    # A move made while the message was in flight has already replaced or cancelled this countdown.
+    if next_remaining > 0 and game_timers.countdown_timer is handle:
+        game_timers.countdown_timer = wheel.call_later(remaining - next_remaining, countdown_tick,
+                                                       context, user_id, next_remaining)
+
+
+async def send_countdown_message(context, game, user_id, remaining, handle):
+    game_timers = game.timers
+    text = f"У вас залишилося {remaining} секунд!"
+
+    if game_timers.countdown_message_id:
+        count_api_call(game, 'edit_message_text')
+        # A BadRequest here (e.g. the message was deleted) is logged by the outbox and otherwise ignored.
+        outbox.edit_message_text(
+            text=text,
+            chat_id=user_id,
+            message_id=game_timers.countdown_message_id
+        )
+    else:
+        count_api_call(game, 'send_message')
+        message = await outbox.send_message(chat_id=user_id, text=text)
+        if game_timers.countdown_timer is handle:
+            game_timers.countdown_message_id = message.message_id
 
-        await asyncio.sleep(1)
 
+async def show_board(context, user_id, remaining=None):
+    if is_bot_player(user_id):
+        return
 
-async def show_board(context, user_id):
     game = games_in_progress[user_id]
-    board = game['board']
-    turn = game['turn']
+    board = game.board
+    turn = game.turn
     text = "Ваш хід." if user_id == turn else "Хід суперника."
-    keyboard = [
-        [InlineKeyboardButton(board[i * 3 + j], callback_data=f'move{i * 3 + j}') for j in range(3)] for i in range(3)
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-
-    if user_id not in user_board_message_ids:
-        message = await context.bot.send_message(chat_id=user_id, text=text, reply_markup=reply_markup)
-        user_board_message_ids[user_id] = message.message_id
+    if remaining is not None and user_id == turn:
+        text += f" Залишилося {remaining} секунд."
+
+    # Nothing visible changed, e.g. a countdown mark landing on an already up-to-date board.
+    session = get_session(user_id)
+    render = (text, board.key())
+    if session.board_render == render:
+        return
+    session.board_render = render
+
+    reply_markup = board_markup(board)
+
+    if session.board_message_id is None:
+        count_api_call(game, 'send_message')
+        message = await outbox.send_message(chat_id=user_id, text=text, reply_markup=reply_markup,
+                                            priority=PRIORITY_MOVE)
+        session.board_message_id = message.message_id
     else:
-        await context.bot.edit_message_text(chat_id=user_id, message_id=user_board_message_ids[user_id], text=text,
-                                            reply_markup=reply_markup)
+        count_api_call(game, 'edit_message_text')
+        outbox.edit_message_text(chat_id=user_id, message_id=session.board_message_id, text=text,
+                                 reply_markup=reply_markup, priority=PRIORITY_MOVE)
+
 
+def spectator_text(game):
+    crosses = game.crosses
+    noughts = game.opponent_of(crosses)
+    return f"{game.name_of(crosses)} ❌ — {game.name_of(noughts)} ⭕\nХодить {game.name_of(game.turn)}."
 
-def get_empty_cells(board):
-    empty_cells = []
-    for i in range(9):
-        if board[i] == ' ':
-            empty_cells.append(i)
-    return empty_cells
+
+def publish_result(game, winner):
+    if winner is None:
+        result = "Нічия!"
+    else:
+        result = f"{game.name_of(game.crosses if winner == 0 else game.opponent_of(game.crosses))} виграє!"
+    broadcaster.publish(game.game_id, f"{result}\n\n{render_board(game.board)}", BACK_MARKUP, final=True)
 
 
-def check_winner(board):
-    winning_combinations = [
-        (0, 1, 2), (3, 4, 5), (6, 7, 8),
-        (0, 3, 6), (1, 4, 7), (2, 5, 8),
-        (0, 4, 8), (2, 4, 6)
-    ]
-    for combo in winning_combinations:
-        if board[combo[0]] == board[combo[1]] == board[combo[2]] != ' ':
-            return board[combo[0]]
-    return None
+def render_board(board):
+    board_str = "\n".join(["".join(row) for row in board.rows()])
+    return board_str.replace(' ', '⬜')
 
 
 async def announce_winner(context, user_id, winner):
     game = games_in_progress[user_id]
-    opponent_id = game['opponent_id']
-    board = game['board']
-    board_str = "\n".join(["".join(board[i * 3:(i + 1) * 3]) for i in range(3)])
-    board_str = board_str.replace(' ', '⬜')
-    if winner == game['symbol']:
-        await context.bot.send_message(chat_id=user_id, text=f"{game['username']} виграє!\n\n{board_str}")
-        await context.bot.send_message(chat_id=opponent_id, text=f"{game['username']} виграє!\n\n{board_str}")
-    else:
-        await context.bot.send_message(chat_id=user_id, text=f"{games_in_progress[opponent_id]['username']}"
-                                                             f" виграє!\n\n{board_str}")
-        await context.bot.send_message(chat_id=opponent_id, text=f"{games_in_progress[opponent_id]['username']}"
-                                                                 f" виграє!\n\n{board_str}")
+    opponent_id = game.opponent_of(user_id)
+    board_str = render_board(game.board)
+    count_api_call(game, 'send_message', 2)
+    winner_name = game.name_of(user_id if game.side_of(user_id) == winner else opponent_id)
+    await fan_out(send_to_player(chat_id=user_id, text=f"{winner_name} виграє!\n\n{board_str}"),
+                  send_to_player(chat_id=opponent_id, text=f"{winner_name} виграє!\n\n{board_str}"))
 
 
 async def announce_draw(context, user_id):
     game = games_in_progress[user_id]
-    opponent_id = game['opponent_id']
-    board = game['board']
-    board_str = "\n".join(["".join(board[i * 3:(i + 1) * 3]) for i in range(3)])
-    board_str = board_str.replace(' ', '⬜')
-    await context.bot.send_message(chat_id=user_id, text=f"Нічия!\n\n{board_str}")
-    await context.bot.send_message(chat_id=opponent_id, text=f"Нічия!\n\n{board_str}")
+    opponent_id = game.opponent_of(user_id)
+    board_str = render_board(game.board)
+    count_api_call(game, 'send_message', 2)
+    await fan_out(send_to_player(chat_id=user_id, text=f"Нічия!\n\n{board_str}"),
+                  send_to_player(chat_id=opponent_id, text=f"Нічия!\n\n{board_str}"))
+
+
+async def send_main_menus(user_id, opponent_id):
+    messages = await fan_out(send_to_player(chat_id=user_id,
+                                            text='Ви повернулися до головного меню.',
+                                            reply_markup=JOIN_MARKUP),
+                             send_to_player(chat_id=opponent_id,
+                                            text='Ви повернулися до головного меню.',
+                                            reply_markup=JOIN_MARKUP))
+    for player_id, message in zip((user_id, opponent_id), messages):
+        if is_bot_player(player_id):
+            bot_players.discard(player_id)
+            continue
+        if message:
+            get_session(player_id).start_message_id = message.message_id
 
 
 async def process_winner(user_id, opponent_id, context):
     game = games_in_progress.get(user_id)
-    winner = check_winner(game['board'])
+    winner = game.board.winner()
+
+    if winner is not None or game.board.is_full():
+        await end_game(context, game, winner, user_id)
+        return
+
+    game.timers.cancel()
+
+    game.turn = opponent_id
+    await fan_out(show_board(context, user_id), show_board(context, opponent_id))
+    if game.game_id in broadcaster.audiences:
+        broadcaster.publish(game.game_id, spectator_text(game), spectator_markup(game.board))
+    if is_bot_player(opponent_id):
+        await play_bot_turn(context, opponent_id)
+    else:
+        await set_turn_timer(context, opponent_id)
+
 
-    if winner:
+async def end_game(context, game, winner, user_id=None):
+    # winner is the winning side, or None for a draw; user_id is whoever ended the game, if anyone.
+    if user_id is None:
+        user_id = game.players[0]
+    opponent_id = game.opponent_of(user_id)
+    game.timers.cancel()
+    if winner is not None:
         await announce_winner(context, user_id, winner)
+    else:
+        await announce_draw(context, user_id)
 
-        del user_board_message_ids[user_id]
-        del user_board_message_ids[opponent_id]
+    if game.game_id in broadcaster.audiences:
+        publish_result(game, winner)
 
-        del games_in_progress[user_id]
-        del games_in_progress[opponent_id]
+    history.record(game, winner)
+    if not is_bot_player(user_id) and not is_bot_player(opponent_id):
+        leaderboard.record_game(game, winner)
+    finish_game(game)
+    journal.drop_game(game)
 
-        if game['turn'] == user_id:
-            for t in tasks:
-                t.cancel()
-            await asyncio.gather(*tasks, return_exceptions=True)
-            del timers[user_id]
-        else:
-            del timers[opponent_id]
-
-        message_user = await context.bot.send_message(chat_id=user_id,
-                                                      text='Ви повернулися до головного меню.',
-                                                      reply_markup=JOIN_MARKUP)
-        message_opponent = await context.bot.send_message(chat_id=opponent_id,
-                                                          text='Ви повернулися до головного меню.',
-                                                          reply_markup=JOIN_MARKUP)
-        start_messages[user_id] = []
-        start_messages[opponent_id] = []
-
-        start_messages[user_id].append(message_user.message_id)
-        start_messages[opponent_id].append(message_opponent.message_id)
+    if tournaments.owns(game.game_id):
+        await tournaments.on_game_over(context, game, winner)
         return
-    elif ' ' not in game['board']:
-        await announce_draw(context, user_id)
+    count_api_call(game, 'send_message', 2)
+    await send_main_menus(user_id, opponent_id)
+
+
+async def play_bot_turn(context, bot_id):
+    game = games_in_progress[bot_id]
+    cell = await choose_move(game, bot_id, game.difficulty)
+    if cell is None:
+        return
+    game.play(game.side_of(bot_id), cell)
+    await process_winner(bot_id, game.opponent_of(bot_id), context)
+
+
+async def restore_live_state(context):
+    games, waiting, challenges = await journal.call(journal.load)
+    now = time.time()
 
-        del user_board_message_ids[user_id]
-        del user_board_message_ids[opponent_id]
+    for user_id, username in waiting:
+        waiting_room.add(user_id, username, leaderboard.rating_of(user_id))
 
-        del games_in_progress[user_id]
-        del games_in_progress[opponent_id]
+    for player_id, username, opponent_id, opponent_name, deadline in challenges:
+        await set_confirm_timer(context, player_id, username, opponent_id, opponent_name, max(0.0, deadline - now))
 
-        if game['turn'] == user_id:
-            for t in tasks:
-                t.cancel()
-            await asyncio.gather(*tasks, return_exceptions=True)
-            del timers[user_id]
+    for game, message_ids in games:
+        register_game(game)
+        for player_id, message_id in zip(game.players, message_ids):
+            if player_id < 0:
+                bot_players.add(player_id)
+            else:
+                get_session(player_id).board_message_id = message_id
+
+        if game.crosses is None:
+            # Still choosing symbols; the choice buttons keep working without a timer.
+            continue
+        if is_bot_player(game.turn):
+            wheel.call_later(0, play_bot_turn, context, game.turn)
         else:
-            del timers[opponent_id]
-
-        message_user = await context.bot.send_message(chat_id=user_id,
-                                                      text='Ви повернулися до головного меню.',
-                                                      reply_markup=JOIN_MARKUP)
-        message_opponent = await context.bot.send_message(chat_id=opponent_id,
-                                                          text='Ви повернулися до головного меню.',
-                                                          reply_markup=JOIN_MARKUP)
-        start_messages[user_id] = []
-        start_messages[opponent_id] = []
-
-        start_messages[user_id].append(message_user.message_id)
-        start_messages[opponent_id].append(message_opponent.message_id)
-        return
+            remaining = None if game.deadline is None else max(0.0, game.deadline - now)
+            await set_turn_timer(context, game.turn, remaining)
+
+    return len(games), len(waiting), len(challenges)
 
-    for t in tasks:
-        t.cancel()
-    await asyncio.gather(*tasks, return_exceptions=True)
-
-    if user_id in timers:
-        job = context.job_queue.get_jobs_by_name(f'timer_{user_id}')
-        if job:
-            job[0].schedule_removal()
-        del timers[user_id]
-
-    game['turn'] = opponent_id
-    games_in_progress[opponent_id]['turn'] = game['turn']
-    await show_board(context, user_id)
-    await show_board(context, opponent_id)
-    await set_turn_timer(context, opponent_id)
@@ -0,0 +1,15 @@
+class GameTimers:
+    __slots__ = ('turn_timer', 'countdown_timer', 'countdown_message_id')
+
+    def __init__(self):
+        self.turn_timer = None
+        self.countdown_timer = None
+        self.countdown_message_id = None
+
+    def cancel(self):
+        for timer in (self.turn_timer, self.countdown_timer):
+            if timer is not None:
+                timer.cancel()
+        self.turn_timer = None
+        self.countdown_timer = None
+        self.countdown_message_id = None
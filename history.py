@@ -0,0 +1,188 @@
+import argparse
+import json
+import sqlite3
+import sys
+import time
+
+import database
+from sessions import AUTO_MOVE
+from write_behind import WriteBehind
+
+HISTORY_PATH = database.credentials.get("HISTORY_PATH", database.SQLITE_PATH)
+# Finished games go out in batches of up to HISTORY_BATCH, and no later than HISTORY_FLUSH_INTERVAL seconds.
+HISTORY_BATCH = int(database.credentials.get("HISTORY_BATCH", 500))
+HISTORY_FLUSH_INTERVAL = float(database.credentials.get("HISTORY_FLUSH_INTERVAL", 1))
+EXPORT_CHUNK = 1000
+
+# result: 0 when crosses won, 1 when noughts won; first_side: 0 when crosses moved first, 1 when noughts did.
+RESULT_DRAW = 2
+SIDES = ('x', 'o')
+RESULTS = (*SIDES, 'draw')
+
+SQLITE_SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS game_history (
+        game_id TEXT PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        username TEXT,
+        opponent_id INTEGER NOT NULL,
+        opponent_name TEXT,
+        crosses INTEGER NOT NULL,
+        board_size INTEGER NOT NULL,
+        board_length INTEGER NOT NULL,
+        difficulty TEXT,
+        result INTEGER NOT NULL,
+        started_at REAL NOT NULL,
+        ended_at REAL NOT NULL,
+        moves BLOB NOT NULL,
+        move_times BLOB NOT NULL,
+        first_side INTEGER NOT NULL
+    )''',
+    'CREATE INDEX IF NOT EXISTS game_history_user ON game_history (user_id, ended_at)',
+    'CREATE INDEX IF NOT EXISTS game_history_opponent ON game_history (opponent_id, ended_at)',
+    'CREATE INDEX IF NOT EXISTS game_history_ended ON game_history (ended_at)',
+)
+
+COLUMNS = ('game_id, user_id, username, opponent_id, opponent_name, crosses, board_size, board_length, difficulty, '
+           'result, started_at, ended_at, moves, move_times, first_side')
+
+
+def history_row(game, winner, ended_at=None):
+    user_id, opponent_id = game.players
+    return (game.game_id, user_id, game.names[0], opponent_id, game.names[1], game.crosses, game.board.size,
+            game.board.geometry.length, game.difficulty, RESULT_DRAW if winner is None else winner,
+            game.started_at, time.time() if ended_at is None else ended_at, bytes(game.moves),
+            bytes(game.move_times), game.first_side)
+
+
+def decode_moves(moves):
+    return [(move & ~AUTO_MOVE, bool(move & AUTO_MOVE)) for move in moves]
+
+
+def export_record(row):
+    (game_id, user_id, username, opponent_id, opponent_name, crosses, size, length, difficulty, result,
+     started_at, ended_at, moves, move_times, first_side) = row
+    moves = decode_moves(moves)
+    return {'game_id': game_id, 'players': [[user_id, username], [opponent_id, opponent_name]], 'crosses': crosses,
+            'board_size': size, 'board_length': length, 'difficulty': difficulty, 'result': RESULTS[result],
+            'started_at': started_at, 'ended_at': ended_at, 'first': SIDES[first_side],
+            'moves': [cell for cell, _ in moves],
+            'auto_moves': [index for index, (_, auto) in enumerate(moves) if auto],
+            'move_times': [tenths / 10 for tenths in move_times]}
+
+
+class HistoryStore:
+    def __init__(self, path, timeout=30):
+        self.path = path
+        self.timeout = timeout
+        self.connection = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        with self.connection:
+            for statement in SQLITE_SCHEMA:
+                self.connection.execute(statement)
+
+    def write(self, rows):
+        with self.connection:
+            self.connection.executemany(f'INSERT OR REPLACE INTO game_history ({COLUMNS}) '
+                                        'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+    def get(self, game_id):
+        return self.connection.execute(f'SELECT {COLUMNS} FROM game_history WHERE game_id = ?',
+                                       (game_id,)).fetchone()
+
+    def last_game_of(self, user_id):
+        rows = [self.connection.execute(f'SELECT {COLUMNS} FROM game_history WHERE {column} = ? '
+                                        'ORDER BY ended_at DESC LIMIT 1', (user_id,)).fetchone()
+                for column in ('user_id', 'opponent_id')]
+        return max((row for row in rows if row is not None), key=lambda row: row[11], default=None)
+
+    def iter_games(self, since=None, chunk=EXPORT_CHUNK):
+        # A connection of its own, so a long export reads a consistent snapshot while the writer goes on.
+        connection = sqlite3.connect(self.path, timeout=self.timeout)
+        try:
+            cursor = connection.execute(f'SELECT {COLUMNS} FROM game_history WHERE ended_at >= ? ORDER BY ended_at',
+                                        (since or 0,))
+            while True:
+                rows = cursor.fetchmany(chunk)
+                if not rows:
+                    return
+                yield from rows
+        finally:
+            connection.close()
+
+    def close(self):
+        self.connection.close()
+
+
+class GameHistory:
+    def __init__(self):
+        self.store = None
+        self.writer = WriteBehind('history', 'finished games to the history')
+        self.pending = []
+        self.games = 0
+        self.batches = 0
+
+    def open(self, store):
+        self.store = store
+        self.writer.open()
+
+    def close(self):
+        if not self.writer.is_open:
+            return
+        self.flush()
+        self.writer.close()
+        self.store.close()
+        self.store = None
+
+    def record(self, game, winner):
+        if not self.writer.is_open:
+            return
+        self.pending.append(history_row(game, winner))
+        if len(self.pending) >= HISTORY_BATCH:
+            self.flush()
+        else:
+            self.writer.schedule(self.flush, HISTORY_FLUSH_INTERVAL)
+
+    def flush(self):
+        self.writer.cancel()
+        rows, self.pending = self.pending, []
+        if not rows:
+            return None
+        self.games += len(rows)
+        self.batches += 1
+        return self.writer.submit(self.store.write, rows)
+
+    async def call(self, method, *args):
+        # Reads share the writer thread, so they see every game recorded before them.
+        return await self.writer.call(method, *args)
+
+    def stats(self):
+        return {'games': self.games, 'batches': self.batches, 'pending': len(self.pending)}
+
+
+def export(store, out, since=None):
+    exported = 0
+    for row in store.iter_games(since):
+        out.write(json.dumps(export_record(row), ensure_ascii=False))
+        out.write('\n')
+        exported += 1
+    return exported
+
+
+history = GameHistory()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Export finished games as JSON lines.')
+    parser.add_argument('output', help="file to write, or '-' for stdout")
+    parser.add_argument('--since', type=float, help='only games that ended at or after this Unix time')
+    args = parser.parse_args()
+
+    store = HistoryStore(HISTORY_PATH)
+    if args.output == '-':
+        count = export(store, sys.stdout, args.since)
+    else:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            count = export(store, f, args.since)
+    store.close()
+    print(f'Exported {count} games', file=sys.stderr)
@@ -0,0 +1,116 @@
+import database
+from common import player_sessions
+from engine import Board
+from sessions import Game
+from write_behind import WriteBehind
+
+JOURNAL_PATH = database.credentials.get("JOURNAL_PATH", database.SQLITE_PATH)
+# 'sqlite' keeps live state in JOURNAL_PATH, so it survives a restart; 'memory' keeps it in-process.
+STATE_STORE = database.credentials.get("STATE_STORE", "sqlite")
+
+
+def game_row(game):
+    user_id, opponent_id = game.players
+    message_ids = []
+    for player_id in game.players:
+        session = player_sessions.get(player_id)
+        message_ids.append(session.board_message_id if session is not None else None)
+    # Masks of an 8x8 board need all 64 bits, which SQLite's signed INTEGER cannot hold.
+    crosses_mask, noughts_mask = game.board.masks
+    return (game.game_id, user_id, game.names[0], opponent_id, game.names[1], game.crosses, game.board.size,
+            game.board.geometry.length, str(crosses_mask), str(noughts_mask), game.turn, game.difficulty,
+            game.deadline, *message_ids, bytes(game.moves), bytes(game.move_times), game.started_at)
+
+
+def restore_game(row):
+    (game_id, user_id, username, opponent_id, opponent_name, crosses, size, length, crosses_mask, noughts_mask,
+     turn, difficulty, deadline, user_message_id, opponent_message_id, moves, move_times, started_at) = row
+    game = Game(user_id, username, opponent_id, opponent_name, size, difficulty, game_id)
+    game.board = Board(size, length, (int(crosses_mask), int(noughts_mask)))
+    game.crosses = crosses
+    game.turn = turn
+    game.deadline = deadline
+    game.moves = bytearray(moves)
+    game.move_times = bytearray(move_times)
+    game.started_at = started_at
+    return game, (user_message_id, opponent_message_id)
+
+
+class Journal:
+    def __init__(self, store=None):
+        self.store = store
+        self.writer = WriteBehind('journal', 'the live state journal')
+        self.games = {}
+        self.waiting = {}
+        self.challenges = {}
+        self.flushes = 0
+        self.rows = 0
+
+    def open(self, store):
+        self.store = store
+        self.writer.open()
+
+    def close(self):
+        if not self.writer.is_open:
+            return
+        self.flush()
+        self.writer.close()
+        self.store.close()
+        self.store = None
+
+    def load(self):
+        games, waiting, challenges = self.store.load()
+        return [restore_game(row) for row in games], waiting, challenges
+
+    def save_game(self, game):
+        self._mark(self.games, game.game_id, game)
+
+    def drop_game(self, game):
+        self._mark(self.games, game.game_id, None)
+
+    def save_waiting(self, user_id, username):
+        self._mark(self.waiting, user_id, username)
+
+    def drop_waiting(self, user_id):
+        self._mark(self.waiting, user_id, None)
+
+    def save_challenge(self, player_id, username, opponent_id, opponent_name, deadline):
+        self._mark(self.challenges, player_id, (player_id, username, opponent_id, opponent_name, deadline))
+
+    def drop_challenge(self, player_id):
+        self._mark(self.challenges, player_id, None)
+
+    def _mark(self, changes, key, value):
+        if not self.writer.is_open:
+            return
+        # Only the latest state of each key matters; everything marked during one loop iteration goes out together.
+        changes[key] = value
+        self.writer.schedule(self.flush)
+
+    def flush(self):
+        self.writer.cancel()
+        games, self.games = self.games, {}
+        waiting, self.waiting = self.waiting, {}
+        challenges, self.challenges = self.challenges, {}
+        if not (games or waiting or challenges):
+            return None
+
+        batch = ([game_row(game) for game in games.values() if game is not None],
+                 [(game_id,) for game_id, game in games.items() if game is None],
+                 [(user_id, username) for user_id, username in waiting.items() if username is not None],
+                 [(user_id,) for user_id, username in waiting.items() if username is None],
+                 [row for row in challenges.values() if row is not None],
+                 [(player_id,) for player_id, row in challenges.items() if row is None])
+        self.flushes += 1
+        self.rows += sum(len(rows) for rows in batch)
+        return self.writer.submit(self.store.write, *batch)
+
+    async def call(self, method, *args):
+        # Other store calls share the writer thread, so they see every batch flushed before them.
+        return await self.writer.call(method, *args)
+
+    def stats(self):
+        return {'flushes': self.flushes, 'rows': self.rows}
+
+
+journal = Journal()
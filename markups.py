@@ -0,0 +1,97 @@
+from functools import lru_cache
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from ai import DIFFICULTIES
+from engine import BOARD_SIZES, SYMBOLS, EMPTY, move_callback
+
+# Telegram objects are immutable, so one markup can go out in any number of messages.
+# Every 3x3 position fits; bigger boards have too many positions and keep the most recent ones.
+BOARD_MARKUP_CACHE = 3 ** 9
+PLAYER_MARKUP_CACHE = 1024
+
+BACK_BUTTON = InlineKeyboardButton("Назад", callback_data='go_back')
+BACK_MARKUP = InlineKeyboardMarkup([[BACK_BUTTON]])
+UNWATCH_BUTTON = InlineKeyboardButton("Перестати дивитися", callback_data='unwatch')
+SETTINGS_MARKUP = InlineKeyboardMarkup([[InlineKeyboardButton("Мій ігровий ID", callback_data='check_id')],
+                                        [InlineKeyboardButton("Розмір поля", callback_data='board_size')],
+                                        [InlineKeyboardButton("Правила", callback_data='check_rules')],
+                                        [InlineKeyboardButton("Рейтинг гравців", callback_data='leaderboard')],
+                                        [BACK_BUTTON]])
+TOURNAMENT_JOIN_MARKUP = InlineKeyboardMarkup([[InlineKeyboardButton("Зареєструватися", callback_data='tournament_join')],
+                                               [BACK_BUTTON]])
+TOURNAMENT_LEAVE_MARKUP = InlineKeyboardMarkup([[InlineKeyboardButton("Скасувати реєстрацію",
+                                                                      callback_data='tournament_leave')],
+                                                [BACK_BUTTON]])
+DIFFICULTY_MARKUP = InlineKeyboardMarkup([[InlineKeyboardButton(title, callback_data=f'play_bot_{level}')]
+                                          for level, title in DIFFICULTIES.items()] + [[BACK_BUTTON]])
+
+
+@lru_cache(maxsize=None)
+def board_size_markup(selected):
+    keyboard = [
+        [InlineKeyboardButton(f"{'✅ ' if size == selected else ''}{size}×{size}, {length} в ряд",
+                              callback_data=f'board_size_{size}')] for size, length in BOARD_SIZES.items()
+    ]
+    keyboard.append([BACK_BUTTON])
+    return InlineKeyboardMarkup(keyboard)
+
+
+@lru_cache(maxsize=PLAYER_MARKUP_CACHE)
+def symbol_choice_markup(user_id):
+    return InlineKeyboardMarkup([[InlineKeyboardButton(symbol, callback_data=f'symbol_choice_{user_id}_{symbol}')]
+                                 for symbol in SYMBOLS])
+
+
+@lru_cache(maxsize=PLAYER_MARKUP_CACHE)
+def challenge_markup(user_id):
+    return InlineKeyboardMarkup([[InlineKeyboardButton("Підтвердити гру", callback_data=f'confirm_game_{user_id}')],
+                                 [InlineKeyboardButton("Відхилити гру", callback_data=f'deny_game_{user_id}')]])
+
+
+@lru_cache(maxsize=None)
+def cell_button(cell, symbol):
+    return InlineKeyboardButton(symbol, callback_data=move_callback(cell))
+
+
+@lru_cache(maxsize=BOARD_MARKUP_CACHE)
+def _board_markup(size, crosses, noughts):
+    keyboard = []
+    for row in range(size):
+        buttons = []
+        for cell in range(row * size, (row + 1) * size):
+            symbol = SYMBOLS[0] if crosses >> cell & 1 else SYMBOLS[1] if noughts >> cell & 1 else EMPTY
+            buttons.append(cell_button(cell, symbol))
+        keyboard.append(buttons)
+    return InlineKeyboardMarkup(keyboard)
+
+
+def board_markup(board):
+    return _board_markup(*board.key())
+
+
+@lru_cache(maxsize=None)
+def spectator_cell_button(symbol):
+    return InlineKeyboardButton(symbol, callback_data='spectate')
+
+
+@lru_cache(maxsize=BOARD_MARKUP_CACHE)
+def _spectator_markup(size, crosses, noughts):
+    # Cells that do nothing when pressed, so a spectator can never move in a game of their own.
+    keyboard = []
+    for row in range(size):
+        keyboard.append([spectator_cell_button(SYMBOLS[0] if crosses >> cell & 1 else
+                                               SYMBOLS[1] if noughts >> cell & 1 else EMPTY)
+                         for cell in range(row * size, (row + 1) * size)])
+    keyboard.append([UNWATCH_BUTTON])
+    return InlineKeyboardMarkup(keyboard)
+
+
+def spectator_markup(board):
+    return _spectator_markup(*board.key())
+
+
+def cache_stats():
+    return {name: func.cache_info()._asdict() for name, func in
+            (('board', _board_markup), ('cell', cell_button), ('symbol_choice', symbol_choice_markup),
+             ('challenge', challenge_markup), ('spectator', _spectator_markup))}
@@ -0,0 +1,127 @@
+import bisect
+import itertools
+import time
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+import database
+from markups import BACK_BUTTON
+from ratings import DEFAULT_RATING
+
+PAGE_SIZE = int(database.credentials.get("WAITING_PAGE_SIZE", 10))
+# Browsing pages are cut from a snapshot of the waiting room that is rebuilt at most this often.
+SNAPSHOT_TTL = float(database.credentials.get("WAITING_SNAPSHOT_TTL", 2))
+# How many unavailable candidates (already challenged) auto-matching steps over before giving up.
+MATCH_SCAN = 64
+
+AUTO_MATCH_BUTTON = InlineKeyboardButton("Автоматичний підбір", callback_data='auto_match')
+FIND_BY_ID_BUTTON = InlineKeyboardButton("Пошук гравця по ID", callback_data='find_player_by_id')
+
+
+class WaitingRoom:
+    # Everyone waiting for a game in joining order, plus a queue sorted by (rating, joined) for auto-matching.
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.players = {}
+        self.queue = []
+        self.version = 0
+        self._joined = itertools.count()
+        self._snapshot = ()
+        self._snapshot_version = 0
+        self._snapshot_at = None
+        self._pages = {}
+
+    def __contains__(self, user_id):
+        return user_id in self.players
+
+    def __len__(self):
+        return len(self.players)
+
+    def __iter__(self):
+        return iter(self.players)
+
+    def get(self, user_id, default=None):
+        entry = self.players.get(user_id)
+        return default if entry is None else entry[0]
+
+    def items(self):
+        return ((user_id, entry[0]) for user_id, entry in self.players.items())
+
+    def add(self, user_id, username, rating=DEFAULT_RATING):
+        self.remove(user_id)
+        key = (rating, next(self._joined), user_id)
+        bisect.insort(self.queue, key)
+        self.players[user_id] = (username, key)
+        self.version += 1
+
+    def remove(self, user_id):
+        entry = self.players.pop(user_id, None)
+        if entry is None:
+            return None
+        del self.queue[bisect.bisect_left(self.queue, entry[1])]
+        self.version += 1
+        return entry[0]
+
+    def clear(self):
+        self.players.clear()
+        self.queue.clear()
+        self.version += 1
+
+    def match(self, user_id, rating=DEFAULT_RATING, available=None):
+        # The closest rating wins; at the same rating, whoever has waited longest.
+        queue = self.queue
+        above = bisect.bisect_left(queue, (rating,))
+        below = above - 1
+        for _ in range(MATCH_SCAN):
+            if below < 0 and above >= len(queue):
+                return None
+            if below < 0 or (above < len(queue) and queue[above][0] - rating <= rating - queue[below][0]):
+                candidate = queue[above][2]
+                above += 1
+            else:
+                candidate = queue[below][2]
+                below -= 1
+            if candidate != user_id and (available is None or available(candidate)):
+                return candidate, self.players[candidate][0]
+        return None
+
+    def snapshot(self):
+        now = self.clock()
+        stale = self._snapshot_version != self.version
+        if self._snapshot_at is None or stale and (now - self._snapshot_at >= SNAPSHOT_TTL or not self._snapshot):
+            self._snapshot = tuple(self.items())
+            self._snapshot_version = self.version
+            self._snapshot_at = now
+            self._pages = {}
+        return self._snapshot
+
+    def page_markup(self, page, viewer=None):
+        # Every viewer of the same snapshot shares the page markups, so each page is built once per snapshot.
+        snapshot = self.snapshot()
+        pages = max(1, -(-len(snapshot) // PAGE_SIZE))
+        page = min(max(page, 0), pages - 1)
+        players = snapshot[page * PAGE_SIZE:(page + 1) * PAGE_SIZE]
+        # A waiting viewer is not offered to themselves; only the page they are on is built for them alone.
+        if any(user_id == viewer for user_id, _ in players):
+            return build_page_markup([entry for entry in players if entry[0] != viewer], page, pages), page, pages
+        markup = self._pages.get(page)
+        if markup is None:
+            markup = self._pages[page] = build_page_markup(players, page, pages)
+        return markup, page, pages
+
+
+def build_page_markup(players, page, pages):
+    keyboard = [[InlineKeyboardButton(username, callback_data=f'select_player_{user_id}')]
+                for user_id, username in players]
+    if pages > 1:
+        navigation = []
+        if page > 0:
+            navigation.append(InlineKeyboardButton("«", callback_data=f'waiting_page_{page - 1}'))
+        navigation.append(InlineKeyboardButton(f"{page + 1}/{pages}", callback_data=f'waiting_page_{page}'))
+        if page < pages - 1:
+            navigation.append(InlineKeyboardButton("»", callback_data=f'waiting_page_{page + 1}'))
+        keyboard.append(navigation)
+    keyboard.append([AUTO_MATCH_BUTTON])
+    keyboard.append([FIND_BY_ID_BUTTON])
+    keyboard.append([BACK_BUTTON])
+    return InlineKeyboardMarkup(keyboard)
@@ -0,0 +1,178 @@
+import asyncio
+import bisect
+import logging
+import threading
+import time
+from functools import wraps
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds in seconds; anything slower only lands in +Inf.
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+
+class Counter:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Family:
+    # One metric name; a child per distinct set of label values, created on first use and kept.
+    def __init__(self, name, kind, label_names, help_text):
+        self.name = name
+        self.kind = kind
+        self.label_names = label_names
+        self.help_text = help_text
+        self.children = {}
+
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            child = self.children[values] = Histogram() if self.kind == 'histogram' else Counter()
+        return child
+
+    def render(self, lines):
+        for values, child in sorted(self.children.items(), key=lambda item: tuple(map(str, item[0]))):
+            labels = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, values))
+            braced = f'{{{labels}}}' if labels else ''
+            if self.kind == 'counter':
+                lines.append(f'{self.name}{braced} {child.value}')
+                continue
+            prefix = f'{labels},' if labels else ''
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ('+Inf',), child.counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{braced} {child.sum}')
+            lines.append(f'{self.name}_count{braced} {child.count}')
+
+
+class Registry:
+    def __init__(self):
+        self.families = {}
+        self.gauges = {}
+        # Held only by observations made off the event loop (database calls run on worker threads).
+        self.lock = threading.Lock()
+
+    def histogram(self, name, label_names, help_text):
+        return self._family(name, 'histogram', label_names, help_text)
+
+    def counter(self, name, label_names, help_text):
+        return self._family(name, 'counter', label_names, help_text)
+
+    def gauge(self, name, read, help_text):
+        self.gauges[name] = (read, help_text)
+
+    def _family(self, name, kind, label_names, help_text):
+        family = self.families.get(name)
+        if family is None:
+            family = self.families[name] = Family(name, kind, label_names, help_text)
+        return family
+
+    def render(self):
+        lines = []
+        for name, family in self.families.items():
+            lines.append(f'# HELP {name} {family.help_text}')
+            lines.append(f'# TYPE {name} {family.kind}')
+            with self.lock:
+                family.render(lines)
+        for name, (read, help_text) in self.gauges.items():
+            try:
+                value = read()
+            except Exception:
+                logger.exception('Could not read gauge %s', name)
+                continue
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} gauge')
+            lines.append(f'{name} {value}')
+        lines.append('')
+        return '\n'.join(lines)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = Registry()
+
+CALLBACK_SECONDS = registry.histogram('callback_seconds', ('action',), 'Time to handle a callback query by action.')
+DB_SECONDS = registry.histogram('db_seconds', ('function',), 'Time spent in player database functions.')
+BOT_API_CALLS = registry.counter('bot_api_calls_total', ('method', 'result'), 'Bot API requests by method and result.')
+BOT_API_SECONDS = registry.histogram('bot_api_seconds', ('method',), 'Bot API request latency by method.')
+
+
+def timed(family):
+    # For functions that run on worker threads: the observation itself is made under the registry lock.
+    def decorate(func):
+        histogram = family.labels(func.__name__)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                with registry.lock:
+                    histogram.observe(elapsed)
+        return wrapper
+    return decorate
+
+
+class MetricsServer:
+    # Plain-text metrics for a local scraper on GET /metrics; one request per connection.
+    def __init__(self, listen='127.0.0.1', port=9100, registry=registry):
+        self.listen = listen
+        self.port = port
+        self.registry = registry
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._serve, self.listen, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        logger.info('Serving metrics on http://%s:%s/metrics', self.listen, self.port)
+        return self.port
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def _serve(self, reader, writer):
+        try:
+            request = await reader.readline()
+            while await reader.readline() not in (b'\r\n', b'\n', b''):
+                pass
+            parts = request.split()
+            if len(parts) >= 2 and parts[0] == b'GET' and parts[1].split(b'?')[0] == b'/metrics':
+                body = self.registry.render().encode()
+                head = 'HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+            else:
+                body = b'Not Found\n'
+                head = 'HTTP/1.1 404 Not Found\r\nContent-Type: text/plain\r\n'
+            writer.write(f'{head}Content-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode() + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
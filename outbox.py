@@ -0,0 +1,241 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from datetime import timedelta
+
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+from metrics import BOT_API_CALLS, BOT_API_SECONDS
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_MOVE = 0
+PRIORITY_CHATTER = 1
+# Spectators only get what the players leave of the global rate.
+PRIORITY_SPECTATOR = 2
+
+GLOBAL_RATE = 30
+GLOBAL_BURST = 30
+CHAT_RATE = 1
+CHAT_BURST = 3
+MAX_ATTEMPTS = 5
+BACKOFF = 0.5
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = None
+        self.paused_until = 0.0
+
+    def _refill(self, now):
+        if self.updated is not None:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now):
+        self._refill(now)
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.paused_until - now)
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def pause(self, now, seconds):
+        self.paused_until = max(self.paused_until, now + seconds)
+
+
+class PriorityRateLimiter:
+    def __init__(self, rate, burst):
+        self.bucket = TokenBucket(rate, burst)
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._wakeup = None
+
+    async def acquire(self, priority):
+        loop = asyncio.get_running_loop()
+        if not self._waiters and self.bucket.wait_time(loop.time()) == 0:
+            self.bucket.take(loop.time())
+            return
+
+        future = loop.create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        self._schedule(loop)
+        await future
+
+    def _schedule(self, loop):
+        if self._wakeup is None and self._waiters:
+            self._wakeup = loop.call_later(self.bucket.wait_time(loop.time()), self._wake, loop)
+
+    def _wake(self, loop):
+        self._wakeup = None
+        while self._waiters and self.bucket.wait_time(loop.time()) == 0:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self.bucket.take(loop.time())
+                future.set_result(None)
+        self._schedule(loop)
+
+
+class Request:
+    __slots__ = ('method', 'kwargs', 'priority', 'future', 'attempts', 'key')
+
+    def __init__(self, method, kwargs, priority, future, key=None):
+        self.method = method
+        self.kwargs = kwargs
+        self.priority = priority
+        self.future = future
+        self.attempts = 0
+        self.key = key
+
+
+class ChatQueue:
+    __slots__ = ('requests', 'bucket', 'worker')
+
+    def __init__(self, rate, burst):
+        self.requests = deque()
+        self.bucket = TokenBucket(rate, burst)
+        self.worker = None
+
+
+class Outbox:
+    def __init__(self, bot=None, global_rate=GLOBAL_RATE, global_burst=GLOBAL_BURST,
+                 chat_rate=CHAT_RATE, chat_burst=CHAT_BURST):
+        self.bot = bot
+        self.limiter = PriorityRateLimiter(global_rate, global_burst)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.chats = {}
+        self.pending_edits = {}
+        self.coalesced = 0
+        self.retried = 0
+
+    def bind(self, bot, global_rate=GLOBAL_RATE, global_burst=GLOBAL_BURST, chat_rate=CHAT_RATE, chat_burst=CHAT_BURST):
+        self.bot = bot
+        self.limiter = PriorityRateLimiter(global_rate, global_burst)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.chats = {}
+        self.pending_edits = {}
+
+    def send_message(self, chat_id, text, priority=PRIORITY_CHATTER, **kwargs):
+        return self._enqueue(chat_id, 'send_message', dict(chat_id=chat_id, text=text, **kwargs), priority)
+
+    def edit_message_text(self, text, chat_id, message_id, priority=PRIORITY_CHATTER, **kwargs):
+        key = (chat_id, message_id)
+        request = self.pending_edits.get(key)
+        if request is not None:
+            # The queued edit has not gone out yet; send only the newest content in its place.
+            request.kwargs = dict(chat_id=chat_id, message_id=message_id, text=text, **kwargs)
+            request.priority = min(request.priority, priority)
+            self.coalesced += 1
+            return request.future
+
+        return self._enqueue(chat_id, 'edit_message_text',
+                             dict(chat_id=chat_id, message_id=message_id, text=text, **kwargs), priority, key)
+
+    def delete_message(self, chat_id, message_id, priority=PRIORITY_CHATTER):
+        return self._enqueue(chat_id, 'delete_message', dict(chat_id=chat_id, message_id=message_id), priority)
+
+    def _enqueue(self, chat_id, method, kwargs, priority, key=None):
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_log_unretrieved)
+        request = Request(method, kwargs, priority, future, key)
+        if key is not None:
+            self.pending_edits[key] = request
+
+        chat = self.chats.get(chat_id)
+        if chat is None:
+            chat = self.chats[chat_id] = ChatQueue(self.chat_rate, self.chat_burst)
+        chat.requests.append(request)
+        if chat.worker is None:
+            chat.worker = asyncio.create_task(self._drain(chat_id, chat))
+        return future
+
+    async def _drain(self, chat_id, chat):
+        loop = asyncio.get_running_loop()
+        try:
+            while chat.requests:
+                request = chat.requests[0]
+                wait = chat.bucket.wait_time(loop.time())
+                if wait:
+                    await asyncio.sleep(wait)
+                    continue
+
+                if request.key is not None:
+                    self.pending_edits.pop(request.key, None)
+                chat.requests.popleft()
+                chat.bucket.take(loop.time())
+                await self.limiter.acquire(request.priority)
+                await self._send(chat, request)
+        finally:
+            chat.worker = None
+            if not chat.requests:
+                del self.chats[chat_id]
+
+    async def _send(self, chat, request):
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            result = await getattr(self.bot, request.method)(**request.kwargs)
+        except RetryAfter as error:
+            outcome = 'retry_after'
+            retry_after = error.retry_after
+            if isinstance(retry_after, timedelta):
+                retry_after = retry_after.total_seconds()
+            chat.bucket.pause(loop.time(), retry_after)
+            self._retry(chat, request)
+        except BadRequest as error:
+            outcome = 'bad_request'
+            request.future.set_exception(error)
+        except NetworkError as error:
+            outcome = 'network_error'
+            request.attempts += 1
+            if request.attempts >= MAX_ATTEMPTS:
+                request.future.set_exception(error)
+            else:
+                chat.bucket.pause(loop.time(), BACKOFF * 2 ** request.attempts)
+                self._retry(chat, request)
+        except Exception as error:
+            outcome = 'error'
+            request.future.set_exception(error)
+        else:
+            outcome = 'ok'
+            request.future.set_result(result)
+        BOT_API_SECONDS.labels(request.method).observe(time.perf_counter() - started)
+        BOT_API_CALLS.labels(request.method, outcome).inc()
+
+    def _retry(self, chat, request):
+        self.retried += 1
+        chat.requests.appendleft(request)
+        if request.key is not None:
+            self.pending_edits.setdefault(request.key, request)
+
+    def stats(self):
+        return {'chats': len(self.chats),
+                'queued': sum(len(chat.requests) for chat in self.chats.values()),
+                'coalesced': self.coalesced,
+                'retried': self.retried}
+
+
+async def fan_out(*sends):
+    # One player having blocked the bot must not stop the other player's update.
+    results = await asyncio.gather(*sends, return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            logger.warning('Could not deliver an update to one of the players: %s', result)
+    return [None if isinstance(result, Exception) else result for result in results]
+
+
+def _log_unretrieved(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.debug('Outbound request failed: %s', future.exception())
+
+
+outbox = Outbox()
@@ -0,0 +1,77 @@
+import bisect
+
+# How many prefix matches a search looks at before giving up on filling its page.
+SEARCH_SCAN = 500
+
+
+class PlayerIndex:
+    # Every known player by player_id and user_id, plus a sorted list of (casefolded key, player_id)
+    # over player IDs, usernames and first names for prefix search.
+    def __init__(self):
+        self.by_player = {}
+        self.by_user = {}
+        self.keys = []
+
+    def __len__(self):
+        return len(self.by_player)
+
+    def load(self, rows):
+        self.by_player.clear()
+        self.by_user.clear()
+        for user_id, first_name, username, player_id in rows:
+            self.by_player[player_id] = (user_id, first_name, username)
+            self.by_user[user_id] = player_id
+        self.keys = sorted(key for player_id, entry in self.by_player.items()
+                           for key in _search_keys(player_id, entry))
+
+    def clear(self):
+        self.load(())
+
+    def add(self, user_id, first_name, username, player_id):
+        self.remove(user_id)
+        entry = (user_id, first_name, username)
+        self.by_player[player_id] = entry
+        self.by_user[user_id] = player_id
+        for key in _search_keys(player_id, entry):
+            bisect.insort(self.keys, key)
+
+    def remove(self, user_id):
+        player_id = self.by_user.pop(user_id, None)
+        if player_id is None:
+            return
+        for key in _search_keys(player_id, self.by_player.pop(player_id)):
+            index = bisect.bisect_left(self.keys, key)
+            if index < len(self.keys) and self.keys[index] == key:
+                del self.keys[index]
+
+    def get(self, player_id):
+        return self.by_player.get(player_id)
+
+    def player_id_of(self, user_id):
+        return self.by_user.get(user_id)
+
+    def name_of(self, user_id):
+        player_id = self.by_user.get(user_id)
+        return None if player_id is None else self.by_player[player_id][1]
+
+    def search(self, prefix, limit=10, accept=None):
+        # Case-insensitive prefix match; each player is returned once, in key order.
+        prefix = prefix.casefold()
+        found = {}
+        start = bisect.bisect_left(self.keys, (prefix,))
+        for key, player_id in self.keys[start:start + SEARCH_SCAN]:
+            if not key.startswith(prefix) or len(found) >= limit:
+                break
+            user_id = self.by_player[player_id][0]
+            if player_id not in found and (accept is None or accept(user_id)):
+                found[player_id] = self.by_player[player_id]
+        return list(found.items())
+
+
+def _search_keys(player_id, entry):
+    _, first_name, username = entry
+    keys = {player_id.casefold()}
+    for name in (first_name, username):
+        if name and name != '-':
+            keys.add(name.casefold())
+    return [(key, player_id) for key in keys]
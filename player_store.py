@@ -0,0 +1,147 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+from cache import MISSING, PlayerCache, RedisCacheBackend, TTLCache
+from player_index import PlayerIndex
+from ratings import leaderboard
+
+CACHE_SIZE = int(database.credentials.get("CACHE_SIZE", 10_000))
+CACHE_TTL = float(database.credentials.get("CACHE_TTL", 600))
+CACHE_URL = database.credentials.get("CACHE_URL")
+# How long a player ID the database did not know is answered as unknown without asking again.
+MISSING_PLAYER_TTL = float(database.credentials.get("MISSING_PLAYER_TTL", 60))
+
+# One worker per pooled connection: a worker never waits on the pool, and the event loop never waits on either.
+executor = ThreadPoolExecutor(max_workers=database.POOL_SIZE, thread_name_prefix='player_store')
+cache = PlayerCache(CACHE_SIZE, CACHE_TTL, RedisCacheBackend(CACHE_URL, CACHE_TTL) if CACHE_URL else None)
+# Every player by player_id, loaded once at startup; ID lookups and name search never wait on the database.
+index = PlayerIndex()
+missing_players = TTLCache(CACHE_SIZE, MISSING_PLAYER_TTL)
+
+
+async def run_in_store(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, func, *args)
+
+
+async def get_player(user_id):
+    entry = await cache.get_user(user_id)
+    if entry is not MISSING:
+        return entry
+
+    entry = await run_in_store(database.get_player, user_id)
+    if entry:
+        await cache.remember(user_id, *entry)
+    return entry
+
+
+async def get_or_create_player(user_id, first_name, username):
+    entry = await cache.get_user(user_id)
+    if entry is not MISSING:
+        return entry[0]
+
+    player_id, stored_name = await run_in_store(database.get_or_create_player_profile, user_id, first_name, username)
+    await cache.remember(user_id, player_id, stored_name)
+    if index.player_id_of(user_id) != player_id:
+        index.add(user_id, stored_name, username or '-', player_id)
+    return player_id
+
+
+async def get_or_create_players(users):
+    users = list(users)
+    player_ids = await run_in_store(database.get_or_create_players, users)
+    for user_id, first_name, username in users:
+        if index.player_id_of(user_id) != player_ids[user_id]:
+            index.add(user_id, first_name, username or '-', player_ids[user_id])
+    return player_ids
+
+
+async def get_player_id(user_id):
+    entry = await get_player(user_id)
+    return entry[0] if entry else None
+
+
+async def get_player_name_from_user_id(user_id):
+    entry = await get_player(user_id)
+    return entry[1] if entry else None
+
+
+async def find_player(player_id):
+    entry = index.get(player_id)
+    if entry is not None:
+        return entry
+
+    # Only players written to the database by something else since startup are missing here. Anything that
+    # cannot be a player ID, such as a name prefix, never reaches the database, and neither does a recent miss.
+    if not looks_like_player_id(player_id) or missing_players.get(player_id) is not MISSING:
+        return None
+    entry = await run_in_store(database.get_player_by_player_id, player_id)
+    if entry is None:
+        missing_players.set(player_id, True)
+    else:
+        index.add(*entry, player_id)
+    return entry
+
+
+def looks_like_player_id(text):
+    return len(text) == database.PLAYER_ID_LENGTH and text.isascii() and text.isalnum()
+
+
+def search_players(prefix, limit=10, accept=None):
+    return index.search(prefix, limit, accept)
+
+
+async def load_index():
+    index.load(await run_in_store(database.get_all_players))
+    return len(index)
+
+
+async def load_ratings():
+    await run_in_store(database.create_ratings_table)
+    leaderboard.load(await run_in_store(database.get_all_ratings))
+    return len(leaderboard)
+
+
+async def get_player_name_from_player_id(player_id):
+    entry = index.get(player_id)
+    if entry is not None:
+        return entry[1]
+
+    first_name = await cache.get_player_name(player_id)
+    if first_name is not MISSING:
+        return first_name
+
+    first_name = await run_in_store(database.get_player_name_from_player_id, player_id)
+    if first_name is not None:
+        await cache.remember_player_name(player_id, first_name)
+    return first_name
+
+
+async def insert_player(user_id, first_name, username):
+    result = await run_in_store(database.insert_player, user_id, first_name, username)
+    await cache.invalidate(user_id)
+    player_id = await run_in_store(database.get_player_id, user_id)
+    index.add(user_id, first_name, username, player_id)
+    return result
+
+
+async def delete_player(user_id):
+    result = await run_in_store(database.delete_player, user_id)
+    await cache.invalidate(user_id)
+    index.remove(user_id)
+    return result
+
+
+def cache_stats():
+    return cache.stats()
+
+
+def use_backend(backend, size=database.POOL_SIZE):
+    global executor
+    executor.shutdown(wait=True)
+    executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix='player_store')
+    cache.clear()
+    index.clear()
+    missing_players.clear()
+    return database.set_backend(backend, size)
@@ -0,0 +1,226 @@
+import random
+
+import database
+from write_behind import WriteBehind
+
+DEFAULT_RATING = 1000
+# Elo K-factor: the most a single game can move a rating.
+RATING_K = float(database.credentials.get("RATING_K", 32))
+# Changed ratings go out in batches of up to RATING_BATCH players, and no later than RATING_FLUSH_INTERVAL seconds.
+RATING_BATCH = int(database.credentials.get("RATING_BATCH", 500))
+RATING_FLUSH_INTERVAL = float(database.credentials.get("RATING_FLUSH_INTERVAL", 1))
+# Enough levels for millions of players at one in two nodes promoted per level.
+MAX_LEVEL = 24
+
+
+class _Node:
+    __slots__ = ('key', 'next', 'width')
+
+    def __init__(self, key, level):
+        self.key = key
+        self.next = [None] * level
+        # How many positions each link skips; a link to the end counts up to one past the last key.
+        self.width = [1] * level
+
+
+class SkipList:
+    # Sorted keys with the width of every link, so finding a key's rank or the key at a rank costs O(log n),
+    # the same as an insert or a removal.
+    def __init__(self, seed=None):
+        self.head = _Node(None, MAX_LEVEL)
+        self.size = 0
+        self.random = random.Random(seed)
+
+    def __len__(self):
+        return self.size
+
+    def _level(self):
+        level = 1
+        while level < MAX_LEVEL and self.random.random() < 0.5:
+            level += 1
+        return level
+
+    def _path(self, key):
+        # The last node before key on every level, and its position counted from the head.
+        update = [None] * MAX_LEVEL
+        steps = [0] * MAX_LEVEL
+        node = self.head
+        position = 0
+        for level in reversed(range(MAX_LEVEL)):
+            while node.next[level] is not None and node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+            update[level] = node
+            steps[level] = position
+        return update, steps, position
+
+    def insert(self, key):
+        update, steps, position = self._path(key)
+        node = _Node(key, self._level())
+        for level in range(MAX_LEVEL):
+            previous = update[level]
+            if level < len(node.next):
+                node.next[level] = previous.next[level]
+                previous.next[level] = node
+                node.width[level] = previous.width[level] - (position - steps[level])
+                previous.width[level] = position - steps[level] + 1
+            else:
+                previous.width[level] += 1
+        self.size += 1
+
+    def remove(self, key):
+        update, _, _ = self._path(key)
+        node = update[0].next[0]
+        if node is None or node.key != key:
+            raise KeyError(key)
+        for level in range(MAX_LEVEL):
+            previous = update[level]
+            if previous.next[level] is node:
+                previous.width[level] += node.width[level] - 1
+                previous.next[level] = node.next[level]
+            else:
+                previous.width[level] -= 1
+        self.size -= 1
+
+    def rank(self, key):
+        update, _, position = self._path(key)
+        node = update[0].next[0]
+        if node is None or node.key != key:
+            raise KeyError(key)
+        return position
+
+    def slice(self, start, count):
+        # Up to count keys from the 0-based position start on.
+        node = self.head
+        position = -1
+        for level in reversed(range(MAX_LEVEL)):
+            while node.next[level] is not None and position + node.width[level] < start:
+                position += node.width[level]
+                node = node.next[level]
+        keys = []
+        node = node.next[0]
+        while node is not None and len(keys) < count:
+            keys.append(node.key)
+            node = node.next[0]
+        return keys
+
+
+class PlayerRating:
+    __slots__ = ('rating', 'wins', 'losses', 'draws')
+
+    def __init__(self, rating=DEFAULT_RATING, wins=0, losses=0, draws=0):
+        self.rating = rating
+        self.wins = wins
+        self.losses = losses
+        self.draws = draws
+
+
+def expected_score(rating, opponent_rating):
+    return 1 / (1 + 10 ** ((opponent_rating - rating) / 400))
+
+
+class Leaderboard:
+    # Ratings of everyone who has finished a game against another player, ordered best first. The table is read
+    # once at startup; after that every game updates memory and the changed rows are written behind.
+    def __init__(self):
+        self.players = {}
+        self.order = SkipList()
+        self.save = None
+        self.writer = WriteBehind('ratings', 'ratings')
+        self.pending = set()
+        self.writes = 0
+        self.batches = 0
+
+    def __len__(self):
+        return len(self.order)
+
+    def load(self, rows):
+        self.players.clear()
+        self.order = SkipList()
+        for user_id, rating, wins, losses, draws in rows:
+            self.players[user_id] = PlayerRating(rating, wins, losses, draws)
+            self.order.insert((-rating, user_id))
+
+    def open(self, save):
+        self.save = save
+        self.writer.open()
+
+    def close(self):
+        if not self.writer.is_open:
+            return
+        self.flush()
+        self.writer.close()
+        self.save = None
+
+    def get(self, user_id):
+        return self.players.get(user_id)
+
+    def rating_of(self, user_id):
+        entry = self.players.get(user_id)
+        return DEFAULT_RATING if entry is None else entry.rating
+
+    def rank_of(self, user_id):
+        entry = self.players.get(user_id)
+        if entry is None:
+            return None
+        return self.order.rank((-entry.rating, user_id)) + 1
+
+    def top(self, count, start=0):
+        return [(user_id, self.players[user_id]) for _, user_id in self.order.slice(start, count)]
+
+    def row(self, user_id):
+        entry = self.players[user_id]
+        return entry.rating, entry.wins, entry.losses, entry.draws
+
+    def record_game(self, game, winner):
+        # winner is the winning side, or None for a draw.
+        user_id, opponent_id = game.players
+        score = 0.5 if winner is None else float(game.side_of(user_id) == winner)
+        self.record(user_id, opponent_id, score)
+
+    def record(self, user_id, opponent_id, score):
+        player = self.players.get(user_id) or PlayerRating()
+        opponent = self.players.get(opponent_id) or PlayerRating()
+        change = RATING_K * (score - expected_score(player.rating, opponent.rating))
+        self._update(user_id, player, player.rating + change, score)
+        self._update(opponent_id, opponent, opponent.rating - change, 1 - score)
+
+        if not self.writer.is_open:
+            return
+        if len(self.pending) >= RATING_BATCH:
+            self.flush()
+        else:
+            self.writer.schedule(self.flush, RATING_FLUSH_INTERVAL)
+
+    def _update(self, user_id, entry, rating, score):
+        if user_id in self.players:
+            self.order.remove((-entry.rating, user_id))
+        else:
+            self.players[user_id] = entry
+        entry.rating = rating
+        if score == 1:
+            entry.wins += 1
+        elif score == 0:
+            entry.losses += 1
+        else:
+            entry.draws += 1
+        self.order.insert((-rating, user_id))
+        self.pending.add(user_id)
+
+    def flush(self):
+        self.writer.cancel()
+        if not self.pending or not self.writer.is_open:
+            return None
+        # Rows are taken now, on the event loop; the writer thread never reads the live entries.
+        rows = [(user_id, *self.row(user_id)) for user_id in self.pending]
+        self.pending = set()
+        self.writes += len(rows)
+        self.batches += 1
+        return self.writer.submit(self.save, rows)
+
+    def stats(self):
+        return {'players': len(self.order), 'writes': self.writes, 'batches': self.batches,
+                'pending': len(self.pending)}
+
+
+leaderboard = Leaderboard()
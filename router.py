@@ -0,0 +1,90 @@
+import logging
+import time
+
+from metrics import CALLBACK_SECONDS, registry
+
+logger = logging.getLogger(__name__)
+
+# Parsed routes kept per distinct callback string; board buttons repeat the same few dozen strings endlessly.
+ROUTE_CACHE_SIZE = 4096
+
+UNKNOWN_CALLBACKS = registry.counter('callback_unknown_total', (), 'Callback queries no route matched.').labels()
+
+
+class TrieNode:
+    __slots__ = ('children', 'route')
+
+    def __init__(self):
+        self.children = {}
+        self.route = None
+
+
+class CallbackRouter:
+    def __init__(self, cache_size=ROUTE_CACHE_SIZE):
+        self.exact = {}
+        self.prefixes = TrieNode()
+        self.cache = {}
+        self.cache_size = cache_size
+
+    def on(self, data, handler):
+        self.exact[data] = (handler, CALLBACK_SECONDS.labels(data))
+        self.cache.clear()
+
+    def on_prefix(self, prefix, handler, parse=str):
+        node = self.prefixes
+        for char in prefix:
+            node = node.children.setdefault(char, TrieNode())
+        node.route = (handler, len(prefix), parse, CALLBACK_SECONDS.labels(prefix.rstrip('_')))
+        self.cache.clear()
+
+    def resolve(self, data):
+        route = self.cache.get(data)
+        if route is not None:
+            return route
+
+        exact = self.exact.get(data)
+        if exact is not None:
+            handler, histogram = exact
+            route = (handler, (), histogram)
+        else:
+            route = self._match_prefix(data)
+            if route is None:
+                return None
+
+        if len(self.cache) >= self.cache_size:
+            self.cache.clear()
+        self.cache[data] = route
+        return route
+
+    def _match_prefix(self, data):
+        # The longest registered prefix wins, so 'play_bot_' can live next to a shorter one.
+        node = self.prefixes
+        match = None
+        for char in data:
+            node = node.children.get(char)
+            if node is None:
+                break
+            if node.route is not None:
+                match = node.route
+        if match is None:
+            return None
+
+        handler, length, parse, histogram = match
+        try:
+            payload = parse(data[length:])
+        except (ValueError, KeyError):
+            return None
+        return handler, payload if isinstance(payload, tuple) else (payload,), histogram
+
+    async def dispatch(self, query, context):
+        route = self.resolve(query.data)
+        if route is None:
+            logger.warning('Unknown callback data: %r', query.data)
+            UNKNOWN_CALLBACKS.inc()
+            return
+        handler, args, histogram = route
+        started = time.perf_counter()
+        try:
+            await handler(query, context, *args)
+        finally:
+            histogram.observe(time.perf_counter() - started)
@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import math
+
+logger = logging.getLogger(__name__)
+
+TICK = 0.1
+SLOTS = 1024
+
+
+class TimerHandle:
+    __slots__ = ('callback', 'args', 'rounds', 'slot', 'cancelled')
+
+    def __init__(self, callback, args, rounds, slot):
+        self.callback = callback
+        self.args = args
+        self.rounds = rounds
+        self.slot = slot
+        self.cancelled = False
+
+    def cancel(self):
+        if not self.cancelled:
+            self.cancelled = True
+            self.slot.pop(self, None)
+
+
+class TimerWheel:
+    def __init__(self, tick=TICK, slots=SLOTS):
+        self.tick = tick
+        self.wheel = [{} for _ in range(slots)]
+        self.position = 0
+        self._task = None
+        self._running = set()
+
+    def call_later(self, delay, callback, *args):
+        if self._task is None:
+            self.start()
+
+        ticks = max(1, math.ceil(delay / self.tick))
+        rounds, offset = divmod(ticks - 1, len(self.wheel))
+        slot = self.wheel[(self.position + 1 + offset) % len(self.wheel)]
+        handle = TimerHandle(callback, args, rounds, slot)
+        slot[handle] = None
+        return handle
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def __len__(self):
+        return sum(len(slot) for slot in self.wheel)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time() + self.tick
+        while True:
+            await asyncio.sleep(max(0.0, next_tick - loop.time()))
+            # Catch up on every tick that passed while the loop was busy.
+            while next_tick <= loop.time():
+                self._advance()
+                next_tick += self.tick
+
+    def _advance(self):
+        self.position = (self.position + 1) % len(self.wheel)
+        slot = self.wheel[self.position]
+        due = [handle for handle in slot if handle.rounds == 0]
+        for handle in slot:
+            handle.rounds -= 1
+        for handle in due:
+            del slot[handle]
+            handle.cancelled = True
+            self._fire(handle)
+
+    def _fire(self, handle):
+        try:
+            result = handle.callback(*handle.args)
+        except Exception:
+            logger.exception('Timer callback %r failed', handle.callback)
+            return
+
+        if asyncio.iscoroutine(result):
+            task = asyncio.create_task(result)
+            self._running.add(task)
+            task.add_done_callback(self._finished)
+
+    def _finished(self, task):
+        self._running.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error('Timer callback failed', exc_info=task.exception())
+
+
+wheel = TimerWheel()
@@ -0,0 +1,132 @@
+import time
+import uuid
+from collections import Counter
+
+from common import games_in_progress, player_sessions, waiting_room
+from engine import Board, SYMBOLS, DEFAULT_SIZE
+from game_timers import GameTimers
+
+# A session nobody has touched for this long is dropped, unless its user is playing, waiting or being challenged.
+SESSION_IDLE_TIMEOUT = 6 * 60 * 60
+SESSION_SWEEP_INTERVAL = 10 * 60
+# Each move is one byte: the cell, with the high bit set for a move made by the system when time ran out.
+AUTO_MOVE = 0x80
+# Time since the previous move is kept in tenths of a second, one byte per move.
+MAX_MOVE_TIME = 255
+
+
+class PlayerSession:
+    __slots__ = ('started', 'awaiting_id', 'board_size', 'last_message_id', 'start_message_id',
+                 'board_message_id', 'board_render', 'confirm_timer', 'challenger', 'last_seen')
+
+    def __init__(self):
+        self.started = False
+        self.awaiting_id = False
+        self.board_size = DEFAULT_SIZE
+        self.last_message_id = None
+        self.start_message_id = None
+        self.board_message_id = None
+        self.board_render = None
+        self.confirm_timer = None
+        # Who sent the challenge that confirm_timer is waiting on.
+        self.challenger = None
+        self.last_seen = time.monotonic()
+
+
+class Game:
+    __slots__ = ('game_id', 'players', 'names', 'crosses', 'board', 'timers', 'api_calls', 'turn', 'difficulty',
+                 'deadline', 'moves', 'move_times', 'started_at', 'last_move_at')
+
+    def __init__(self, user_id, username, opponent_id, opponent_name, board_size=DEFAULT_SIZE, difficulty=None,
+                 game_id=None):
+        self.game_id = game_id or uuid.uuid4().hex
+        self.players = (user_id, opponent_id)
+        self.names = (username, opponent_name)
+        self.crosses = None
+        self.board = Board(board_size)
+        self.timers = GameTimers()
+        self.api_calls = Counter()
+        self.turn = user_id
+        self.difficulty = difficulty
+        # Wall-clock time the current turn runs out, so it survives a restart.
+        self.deadline = None
+        self.moves = bytearray()
+        self.move_times = bytearray()
+        self.started_at = self.last_move_at = time.time()
+
+    @property
+    def first_side(self):
+        # The game starts on the first player's turn, whichever symbol they chose.
+        return self.side_of(self.players[0])
+
+    def opponent_of(self, user_id):
+        first, second = self.players
+        return second if user_id == first else first
+
+    def name_of(self, user_id):
+        return self.names[0] if user_id == self.players[0] else self.names[1]
+
+    def assign_symbol(self, user_id, symbol):
+        self.crosses = user_id if symbol == SYMBOLS[0] else self.opponent_of(user_id)
+
+    def side_of(self, user_id):
+        return 0 if user_id == self.crosses else 1
+
+    def symbol_of(self, user_id):
+        return SYMBOLS[self.side_of(user_id)]
+
+    def play(self, side, cell, auto=False):
+        self.board.play(side, cell)
+        now = time.time()
+        self.moves.append(cell | AUTO_MOVE if auto else cell)
+        self.move_times.append(min(MAX_MOVE_TIME, round((now - self.last_move_at) * 10)))
+        self.last_move_at = now
+
+
+def get_session(user_id):
+    session = player_sessions.get(user_id)
+    if session is None:
+        session = player_sessions[user_id] = PlayerSession()
+    return session
+
+
+def touch_session(user_id):
+    session = get_session(user_id)
+    session.last_seen = time.monotonic()
+    player_sessions.move_to_end(user_id)
+    return session
+
+
+def register_game(game):
+    for user_id in game.players:
+        games_in_progress[user_id] = game
+
+
+def finish_game(game):
+    for user_id in game.players:
+        games_in_progress.pop(user_id, None)
+        session = player_sessions.get(user_id)
+        if session is not None:
+            session.board_message_id = None
+            session.board_render = None
+
+
+def is_busy(user_id, session):
+    return user_id in games_in_progress or user_id in waiting_room or session.confirm_timer is not None
+
+
+def evict_idle_sessions(now=None):
+    now = time.monotonic() if now is None else now
+    evicted = 0
+    # Sessions are kept in last-seen order, so the sweep stops at the first one that is still fresh.
+    while player_sessions:
+        user_id, session = next(iter(player_sessions.items()))
+        if now - session.last_seen < SESSION_IDLE_TIMEOUT:
+            break
+        if is_busy(user_id, session):
+            session.last_seen = now
+            player_sessions.move_to_end(user_id)
+        else:
+            del player_sessions[user_id]
+            evicted += 1
+    return evicted
@@ -0,0 +1,127 @@
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+
+SQLITE_SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS live_games (
+        game_id TEXT PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        username TEXT,
+        opponent_id INTEGER NOT NULL,
+        opponent_name TEXT,
+        crosses INTEGER,
+        board_size INTEGER NOT NULL,
+        board_length INTEGER NOT NULL,
+        crosses_mask TEXT NOT NULL,
+        noughts_mask TEXT NOT NULL,
+        turn INTEGER NOT NULL,
+        difficulty TEXT,
+        deadline REAL,
+        user_board_message_id INTEGER,
+        opponent_board_message_id INTEGER,
+        moves BLOB NOT NULL,
+        move_times BLOB NOT NULL,
+        started_at REAL NOT NULL
+    )''',
+    '''CREATE TABLE IF NOT EXISTS live_waiting (
+        user_id INTEGER PRIMARY KEY,
+        username TEXT
+    )''',
+    '''CREATE TABLE IF NOT EXISTS live_challenges (
+        player_id INTEGER PRIMARY KEY,
+        username TEXT,
+        opponent_id INTEGER NOT NULL,
+        opponent_name TEXT,
+        deadline REAL NOT NULL
+    )''',
+)
+
+GAME_COLUMNS = ('game_id, user_id, username, opponent_id, opponent_name, crosses, board_size, board_length, '
+                'crosses_mask, noughts_mask, turn, difficulty, deadline, user_board_message_id, '
+                'opponent_board_message_id, moves, move_times, started_at')
+
+
+class StateStore(ABC):
+    # Live state that outlasts the process: game snapshots, the waiting room and pending challenges.
+
+    @abstractmethod
+    def write(self, games, ended_games, waiting, left_waiting, challenges, ended_challenges):
+        pass
+
+    @abstractmethod
+    def load(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class LocalStateStore(StateStore):
+    # Keeps live state in memory only: nothing survives a restart.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.games = {}
+        self.waiting = {}
+        self.challenges = {}
+
+    def write(self, games, ended_games, waiting, left_waiting, challenges, ended_challenges):
+        with self.lock:
+            for row in games:
+                self.games[row[0]] = row
+            for game_id, in ended_games:
+                self.games.pop(game_id, None)
+            for user_id, username in waiting:
+                self.waiting[user_id] = username
+            for user_id, in left_waiting:
+                self.waiting.pop(user_id, None)
+            for row in challenges:
+                self.challenges[row[0]] = row
+            for player_id, in ended_challenges:
+                self.challenges.pop(player_id, None)
+
+    def load(self):
+        with self.lock:
+            return list(self.games.values()), list(self.waiting.items()), list(self.challenges.values())
+
+
+class SQLiteStateStore(StateStore):
+    # Live state in an SQLite file, so it survives a restart.
+    def __init__(self, path, timeout=30):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        with self.lock, self.connection:
+            for statement in SQLITE_SCHEMA:
+                self.connection.execute(statement)
+
+    def write(self, games, ended_games, waiting, left_waiting, challenges, ended_challenges):
+        with self.lock, self.connection:
+            self.connection.executemany(f'INSERT OR REPLACE INTO live_games ({GAME_COLUMNS}) VALUES '
+                                        '(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', games)
+            self.connection.executemany('DELETE FROM live_games WHERE game_id = ?', ended_games)
+            self.connection.executemany('INSERT OR REPLACE INTO live_waiting VALUES (?, ?)', waiting)
+            self.connection.executemany('DELETE FROM live_waiting WHERE user_id = ?', left_waiting)
+            self.connection.executemany('INSERT OR REPLACE INTO live_challenges VALUES (?, ?, ?, ?, ?)', challenges)
+            self.connection.executemany('DELETE FROM live_challenges WHERE player_id = ?', ended_challenges)
+
+    def load(self):
+        with self.lock:
+            games = self.connection.execute(f'SELECT {GAME_COLUMNS} FROM live_games').fetchall()
+            waiting = self.connection.execute('SELECT user_id, username FROM live_waiting').fetchall()
+            challenges = self.connection.execute('SELECT player_id, username, opponent_id, opponent_name, deadline '
+                                                 'FROM live_challenges').fetchall()
+        return games, waiting, challenges
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+def make_store(kind, path=None):
+    if kind == 'memory':
+        return LocalStateStore()
+    if kind == 'sqlite':
+        return SQLiteStateStore(path)
+    raise ValueError(f'Unknown state store: {kind}')
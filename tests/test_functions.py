@@ -0,0 +1,192 @@
+import asyncio
+import importlib
+
+import pytest
+
+import functions
+from benchmarks.fakes import FakeBot, VirtualWheel, bind_outbox, make_callback_update, make_context
+from common import bot_players, games_in_progress, player_sessions, waiting_room
+from sessions import AUTO_MOVE, Game, finish_game, register_game
+
+bot_module = importlib.import_module('tic-tac-toe')
+
+
+@pytest.fixture
+def bot(monkeypatch):
+    wheel = VirtualWheel()
+    monkeypatch.setattr(functions, 'wheel', wheel)
+    monkeypatch.setattr(bot_module, 'wheel', wheel)
+    yield FakeBot()
+    games_in_progress.clear()
+    player_sessions.clear()
+    bot_players.clear()
+    waiting_room.clear()
+
+
+def new_game(size=3, chooser_symbol='❌'):
+    game = Game(1, 'alice', 2, 'bob', size)
+    if chooser_symbol is not None:
+        game.assign_symbol(1, chooser_symbol)
+    register_game(game)
+    return game
+
+
+def marks(board):
+    return [bin(mask).count('1') for mask in board.masks]
+
+
+async def player_name(user_id):
+    return {1: 'alice', 2: 'bob', 3: 'carol'}.get(user_id)
+
+
+def test_new_challenge_replaces_the_pending_confirm_timer(bot):
+    async def main():
+        bind_outbox(bot)
+        context = make_context(bot)
+        await functions.set_confirm_timer(context, 3, 'carol', 1, 'alice')
+        await functions.set_confirm_timer(context, 3, 'carol', 2, 'bob')
+        pending = len(functions.wheel)
+        await functions.wheel.advance(functions.CONFIRM_TIME_LIMIT.total_seconds() + 1)
+        await asyncio.sleep(0.01)
+        return pending
+
+    assert asyncio.run(main()) == 1
+    assert [chat_id for method, chat_id in bot.calls if method == 'send_message'] == [3, 2]
+
+
+def test_rearming_the_turn_timer_replaces_the_pending_one(bot):
+    async def main():
+        bind_outbox(bot)
+        context = make_context(bot)
+        game = new_game()
+        await functions.set_turn_timer(context, 1)
+        armed = len(functions.wheel)
+        await functions.set_turn_timer(context, 1)
+        return armed, len(functions.wheel), game
+
+    armed, rearmed, game = asyncio.run(main())
+    assert rearmed == armed
+    assert game.timers.turn_timer is not None
+
+
+def test_symbol_is_chosen_once(bot):
+    async def main():
+        bind_outbox(bot)
+        context = make_context(bot)
+        game = new_game(chooser_symbol=None)
+        await bot_module.button(make_callback_update(bot, 1, 'symbol_choice_1_❌'), context)
+        armed = len(functions.wheel)
+        await bot_module.button(make_callback_update(bot, 1, 'symbol_choice_1_⭕'), context)
+        return armed, len(functions.wheel), game
+
+    armed, after, game = asyncio.run(main())
+    assert after == armed
+    assert game.crosses == 1
+
+
+def test_symbol_click_after_the_game_is_ignored(bot):
+    async def main():
+        bind_outbox(bot)
+        await bot_module.button(make_callback_update(bot, 1, 'symbol_choice_1_❌'), make_context(bot))
+
+    asyncio.run(main())
+    assert len(functions.wheel) == 0
+
+
+def test_timeout_plays_a_random_move_and_passes_the_turn(bot):
+    async def main():
+        bind_outbox(bot)
+        game = new_game()
+        await functions.turn_timeout(make_context(bot), 1)
+        return game
+
+    game = asyncio.run(main())
+    assert marks(game.board) == [1, 0]
+    assert game.moves[0] & AUTO_MOVE
+    assert game.turn == 2
+
+
+def test_click_during_a_searched_timeout_move_wins(bot, monkeypatch):
+    monkeypatch.setattr(functions, 'TIMEOUT_MOVE_DIFFICULTY', 'hard')
+
+    async def main():
+        bind_outbox(bot)
+        context = make_context(bot)
+        game = new_game(size=5)
+        timeout = asyncio.create_task(functions.turn_timeout(context, 1))
+        await asyncio.sleep(0)
+        await bot_module.button(make_callback_update(bot, 1, 'move0'), context)
+        await timeout
+        return game
+
+    game = asyncio.run(main())
+    assert marks(game.board) == [1, 0]
+    assert game.turn == 2
+    assert not game.moves[0] & AUTO_MOVE
+
+
+def test_game_ending_during_a_searched_timeout_move(bot, monkeypatch):
+    monkeypatch.setattr(functions, 'TIMEOUT_MOVE_DIFFICULTY', 'hard')
+
+    async def main():
+        bind_outbox(bot)
+        game = new_game(size=5)
+        timeout = asyncio.create_task(functions.turn_timeout(make_context(bot), 1))
+        await asyncio.sleep(0)
+        finish_game(game)
+        await timeout
+        return game
+
+    assert marks(asyncio.run(main()).board) == [0, 0]
+
+
+def test_confirm_is_refused_once_the_challenger_plays_the_bot(bot, monkeypatch):
+    monkeypatch.setattr(bot_module, 'get_player_name_from_user_id', player_name)
+
+    async def main():
+        bind_outbox(bot)
+        context = make_context(bot)
+        waiting_room.add(3, 'carol', 1000)
+        await bot_module.button(make_callback_update(bot, 1, 'select_player_3', first_name='alice'), context)
+        await bot_module.button(make_callback_update(bot, 1, 'play_bot_easy', first_name='alice'), context)
+        bot_game = games_in_progress[1]
+        await bot_module.button(make_callback_update(bot, 3, 'confirm_game_1', first_name='carol'), context)
+        return bot_game
+
+    bot_game = asyncio.run(main())
+    assert games_in_progress[1] is bot_game
+    assert 3 not in games_in_progress
+    assert player_sessions[3].confirm_timer is None
+
+
+def test_confirm_counts_only_for_a_pending_challenge(bot, monkeypatch):
+    monkeypatch.setattr(bot_module, 'get_player_name_from_user_id', player_name)
+
+    async def main():
+        bind_outbox(bot)
+        context = make_context(bot)
+        waiting_room.add(3, 'carol', 1000)
+        await bot_module.button(make_callback_update(bot, 2, 'confirm_game_1', first_name='bob'), context)
+        await bot_module.button(make_callback_update(bot, 1, 'select_player_3', first_name='alice'), context)
+        await bot_module.button(make_callback_update(bot, 3, 'confirm_game_1', first_name='carol'), context)
+        game = games_in_progress[1]
+        await bot_module.button(make_callback_update(bot, 3, 'confirm_game_1', first_name='carol'), context)
+        return game
+
+    game = asyncio.run(main())
+    assert 2 not in games_in_progress
+    assert games_in_progress[1] is games_in_progress[3] is game
+
+
+def test_manual_challenge_to_a_challenged_player_is_rejected(bot):
+    async def main():
+        bind_outbox(bot)
+        context = make_context(bot)
+        waiting_room.add(3, 'carol', 1000)
+        await bot_module.button(make_callback_update(bot, 1, 'select_player_3'), context)
+        await bot_module.button(make_callback_update(bot, 2, 'select_player_3'), context)
+        await asyncio.sleep(0.01)
+
+    asyncio.run(main())
+    assert len(functions.wheel) == 1
+    assert player_sessions[3].challenger == 1
@@ -0,0 +1,38 @@
+import importlib
+
+import pytest
+
+from history import HistoryStore, export_record, history_row
+from sessions import Game
+
+bot_module = importlib.import_module('tic-tac-toe')
+
+
+def finished_game(symbol):
+    # alice opens with the chosen symbol and wins along the top row.
+    game = Game(1, 'alice', 2, 'bob')
+    game.assign_symbol(1, symbol)
+    for index, cell in enumerate((0, 3, 1, 4, 2)):
+        game.play(game.side_of(game.players[index % 2]), cell)
+    return game
+
+
+def test_rows_round_trip_with_the_first_side(tmp_path):
+    store = HistoryStore(str(tmp_path / 'history.db'))
+    game = finished_game('⭕')
+    store.write([history_row(game, game.board.winner())])
+
+    record = export_record(store.get(game.game_id))
+    assert store.last_game_of(2)[0] == game.game_id
+    store.close()
+    assert record['first'] == 'o'
+    assert record['result'] == 'o'
+    assert record['moves'] == [0, 3, 1, 4, 2]
+
+
+@pytest.mark.parametrize('symbol', ['❌', '⭕'])
+def test_replay_draws_the_chooser_symbol_first(symbol):
+    game = finished_game(symbol)
+    text = bot_module.replay_text(history_row(game, game.board.winner()), 5)
+    assert symbol * 3 in text
+    assert text.endswith('alice виграє!')
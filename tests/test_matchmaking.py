@@ -0,0 +1,40 @@
+from matchmaking import PAGE_SIZE, WaitingRoom
+
+
+def listed(markup):
+    return [button.callback_data for row in markup.inline_keyboard for button in row
+            if button.callback_data.startswith('select_player_')]
+
+
+def test_match_prefers_the_closest_rating_then_the_longest_wait():
+    room = WaitingRoom()
+    room.add(1, 'a', 900)
+    room.add(2, 'b', 1100)
+    room.add(3, 'c', 1000)
+    room.add(4, 'd', 1000)
+    assert room.match(9, 990) == (3, 'c')
+    assert room.match(9, 990, available=lambda user_id: user_id != 3) == (4, 'd')
+    assert room.match(9, 1080) == (2, 'b')
+    assert room.match(3, 1000) == (4, 'd')
+
+
+def test_removed_players_are_not_matched():
+    room = WaitingRoom()
+    room.add(1, 'a', 1000)
+    room.remove(1)
+    assert room.match(9, 1000) is None and 1 not in room
+
+
+def test_pages_leave_the_viewer_out():
+    room = WaitingRoom()
+    for user_id in range(PAGE_SIZE + 1):
+        room.add(user_id, f'player{user_id}', 1000)
+
+    markup, page, pages = room.page_markup(0, viewer=1)
+    assert (page, pages) == (0, 2)
+    assert 'select_player_1' not in listed(markup)
+    assert len(listed(markup)) == PAGE_SIZE - 1
+    # Everyone else still shares the cached page.
+    shared, _, _ = room.page_markup(0, viewer=PAGE_SIZE)
+    assert 'select_player_1' in listed(shared)
+    assert room.page_markup(0)[0] is shared
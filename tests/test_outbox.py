@@ -0,0 +1,96 @@
+import asyncio
+
+from telegram.error import BadRequest, RetryAfter
+
+from outbox import Outbox, PRIORITY_MOVE, PRIORITY_SPECTATOR, PriorityRateLimiter
+
+
+class StubBot:
+    def __init__(self, failures=()):
+        # Exceptions raised by the first calls, in order.
+        self.failures = list(failures)
+        self.calls = []
+
+    async def _call(self, method, **kwargs):
+        self.calls.append((method, kwargs.get('text')))
+        if self.failures:
+            raise self.failures.pop(0)
+        return kwargs.get('text')
+
+    async def send_message(self, **kwargs):
+        return await self._call('send_message', **kwargs)
+
+    async def edit_message_text(self, **kwargs):
+        return await self._call('edit_message_text', **kwargs)
+
+
+def unthrottled(bot):
+    return Outbox(bot, global_rate=1e9, global_burst=1e9, chat_rate=1e9, chat_burst=1e9)
+
+
+def test_queued_edits_of_one_message_are_coalesced():
+    async def main():
+        bot = StubBot()
+        outbox = unthrottled(bot)
+        first = outbox.edit_message_text('one', chat_id=1, message_id=5)
+        second = outbox.edit_message_text('two', chat_id=1, message_id=5)
+        other = outbox.edit_message_text('other', chat_id=1, message_id=6)
+        assert first is second
+        return bot, outbox, await second, await other
+
+    bot, outbox, result, _ = asyncio.run(main())
+    assert result == 'two'
+    assert bot.calls == [('edit_message_text', 'two'), ('edit_message_text', 'other')]
+    assert outbox.stats()['coalesced'] == 1
+
+
+def test_edit_after_the_previous_one_went_out_is_sent_again():
+    async def main():
+        bot = StubBot()
+        outbox = unthrottled(bot)
+        await outbox.edit_message_text('one', chat_id=1, message_id=5)
+        await outbox.edit_message_text('two', chat_id=1, message_id=5)
+        return bot
+
+    assert [text for _, text in asyncio.run(main()).calls] == ['one', 'two']
+
+
+def test_retry_after_is_retried_in_order():
+    async def main():
+        bot = StubBot([RetryAfter(0.01)])
+        outbox = unthrottled(bot)
+        results = await asyncio.gather(outbox.send_message(1, 'first'), outbox.send_message(1, 'second'))
+        return bot, outbox, results
+
+    bot, outbox, results = asyncio.run(main())
+    assert results == ['first', 'second']
+    assert [text for _, text in bot.calls] == ['first', 'first', 'second']
+    assert outbox.stats()['retried'] == 1
+
+
+def test_bad_request_fails_only_its_own_future():
+    async def main():
+        outbox = unthrottled(StubBot([BadRequest('message is not modified')]))
+        results = await asyncio.gather(outbox.send_message(1, 'bad'), outbox.send_message(1, 'good'),
+                                       return_exceptions=True)
+        return results
+
+    bad, good = asyncio.run(main())
+    assert isinstance(bad, BadRequest)
+    assert good == 'good'
+
+
+def test_limiter_serves_the_lowest_priority_number_first():
+    async def main():
+        limiter = PriorityRateLimiter(rate=100, burst=1)
+        await limiter.acquire(PRIORITY_MOVE)
+        order = []
+
+        async def acquire(priority, name):
+            await limiter.acquire(priority)
+            order.append(name)
+
+        await asyncio.gather(acquire(PRIORITY_SPECTATOR, 'spectator'), acquire(PRIORITY_MOVE, 'move'))
+        return order
+
+    assert asyncio.run(main()) == ['move', 'spectator']
@@ -0,0 +1,82 @@
+import random
+
+import pytest
+
+from ratings import RATING_K, DEFAULT_RATING, Leaderboard, SkipList, expected_score
+
+
+def test_skip_list_matches_a_sorted_list():
+    rng = random.Random(7)
+    skip_list = SkipList(seed=7)
+    keys = []
+    for _ in range(2000):
+        if keys and rng.random() < 0.4:
+            key = keys.pop(rng.randrange(len(keys)))
+            skip_list.remove(key)
+        else:
+            key = (rng.randrange(500), rng.randrange(10 ** 6))
+            if key in keys:
+                continue
+            keys.append(key)
+            skip_list.insert(key)
+    keys.sort()
+
+    assert len(skip_list) == len(keys)
+    for position in range(0, len(keys), 17):
+        assert skip_list.rank(keys[position]) == position
+    for start, count in ((0, 10), (5, 3), (len(keys) - 2, 10), (len(keys), 5)):
+        assert skip_list.slice(start, count) == keys[start:start + count]
+
+
+def test_skip_list_rejects_missing_keys():
+    skip_list = SkipList(seed=1)
+    skip_list.insert((1, 1))
+    with pytest.raises(KeyError):
+        skip_list.rank((2, 2))
+    with pytest.raises(KeyError):
+        skip_list.remove((2, 2))
+
+
+def test_elo_update_moves_both_ratings_by_the_same_amount():
+    leaderboard = Leaderboard()
+    leaderboard.record(1, 2, 1)
+
+    assert leaderboard.rating_of(1) == DEFAULT_RATING + RATING_K / 2
+    assert leaderboard.rating_of(2) == DEFAULT_RATING - RATING_K / 2
+    assert leaderboard.row(1)[1:] == (1, 0, 0)
+    assert leaderboard.row(2)[1:] == (0, 1, 0)
+
+
+def test_elo_gains_less_for_beating_a_weaker_player():
+    assert expected_score(1200, 1000) > 0.5
+    leaderboard = Leaderboard()
+    leaderboard.load([(1, 1200, 0, 0, 0), (2, 1000, 0, 0, 0)])
+    leaderboard.record(1, 2, 1)
+    assert 0 < leaderboard.rating_of(1) - 1200 < RATING_K / 2
+
+
+def test_draw_between_equals_changes_no_rating():
+    leaderboard = Leaderboard()
+    leaderboard.record(1, 2, 0.5)
+    assert leaderboard.rating_of(1) == leaderboard.rating_of(2) == DEFAULT_RATING
+    assert leaderboard.row(1)[1:] == (0, 0, 1)
+
+
+def test_ranks_follow_ratings():
+    leaderboard = Leaderboard()
+    leaderboard.load([(1, 1100, 0, 0, 0), (2, 1000, 0, 0, 0), (3, 900, 0, 0, 0)])
+    leaderboard.record(3, 1, 1)
+    leaderboard.record(3, 2, 1)
+
+    ranked = [user_id for user_id, _ in leaderboard.top(10)]
+    assert ranked == sorted(ranked, key=leaderboard.rating_of, reverse=True)
+    assert [leaderboard.rank_of(user_id) for user_id in ranked] == [1, 2, 3]
+    assert leaderboard.top(2, start=1) == leaderboard.top(10)[1:3]
+    assert leaderboard.rank_of(4) is None
+
+
+def test_loaded_players_are_not_listed_twice():
+    leaderboard = Leaderboard()
+    leaderboard.load([(1, DEFAULT_RATING, 0, 0, 0), (2, DEFAULT_RATING, 0, 0, 0)])
+    leaderboard.record(1, 2, 1)
+    assert len(leaderboard) == 2
@@ -0,0 +1,73 @@
+import asyncio
+from types import SimpleNamespace
+
+from router import CallbackRouter
+
+
+async def exact(query, context):
+    return 'exact'
+
+
+async def short(query, context, payload):
+    return 'short', payload
+
+
+async def long(query, context, payload):
+    return 'long', payload
+
+
+def make_router():
+    router = CallbackRouter(cache_size=4)
+    router.on('play_bot', exact)
+    router.on_prefix('play_', short)
+    router.on_prefix('play_bot_', long, int)
+    return router
+
+
+def test_exact_route_wins_over_a_matching_prefix():
+    handler, args, _ = make_router().resolve('play_bot')
+    assert handler is exact and args == ()
+
+
+def test_longest_prefix_wins_and_parses_its_payload():
+    router = make_router()
+    handler, args, _ = router.resolve('play_bot_3')
+    assert handler is long and args == (3,)
+    handler, args, _ = router.resolve('play_x')
+    assert handler is short and args == ('x',)
+
+
+def test_unparsable_payload_and_unknown_data_resolve_to_nothing():
+    router = make_router()
+    assert router.resolve('play_bot_hard') is None
+    assert router.resolve('unknown') is None
+    assert router.resolve('pla') is None
+
+
+def test_tuple_payloads_become_handler_arguments():
+    router = CallbackRouter()
+    router.on_prefix('symbol_', short, lambda payload: tuple(payload.split('_')))
+    _, args, _ = router.resolve('symbol_5_x')
+    assert args == ('5', 'x')
+
+
+def test_cache_is_bounded_and_cleared_by_new_routes():
+    router = make_router()
+    for cell in range(10):
+        router.resolve(f'play_bot_{cell}')
+    assert len(router.cache) <= 4
+    router.on('play_bot_1', exact)
+    assert router.resolve('play_bot_1')[0] is exact
+
+
+def test_dispatch_passes_the_parsed_arguments():
+    calls = []
+
+    async def handler(query, context, payload):
+        calls.append((query.data, payload))
+
+    router = CallbackRouter()
+    router.on_prefix('move', handler, int)
+    asyncio.run(router.dispatch(SimpleNamespace(data='move7'), None))
+    asyncio.run(router.dispatch(SimpleNamespace(data='nothing'), None))
+    assert calls == [('move7', 7)]
@@ -0,0 +1,64 @@
+import asyncio
+
+from scheduler import TimerWheel
+
+
+def run_wheel(schedule, duration):
+    async def main():
+        wheel = TimerWheel(tick=0.01, slots=8)
+        fired = []
+        schedule(wheel, fired)
+        await asyncio.sleep(duration)
+        wheel.stop()
+        return wheel, fired
+
+    return asyncio.run(main())
+
+
+def test_timers_fire_in_deadline_order():
+    def schedule(wheel, fired):
+        for delay in (0.05, 0.01, 0.03):
+            wheel.call_later(delay, fired.append, delay)
+
+    wheel, fired = run_wheel(schedule, 0.15)
+    assert fired == [0.01, 0.03, 0.05]
+    assert len(wheel) == 0
+
+
+def test_cancelled_timer_never_fires():
+    def schedule(wheel, fired):
+        wheel.call_later(0.02, fired.append, 'cancelled').cancel()
+        wheel.call_later(0.02, fired.append, 'kept')
+
+    _, fired = run_wheel(schedule, 0.1)
+    assert fired == ['kept']
+
+
+def test_delay_longer_than_one_turn_of_the_wheel():
+    # Eight slots of 10 ms: 0.2 s needs more than two rounds.
+    def schedule(wheel, fired):
+        wheel.call_later(0.2, fired.append, 'late')
+        wheel.call_later(0.02, fired.append, 'early')
+
+    wheel, fired = run_wheel(schedule, 0.1)
+    assert fired == ['early']
+    assert len(wheel) == 1
+
+    _, fired = run_wheel(schedule, 0.35)
+    assert fired == ['early', 'late']
+
+
+def test_coroutine_callbacks_run_and_failures_do_not_stop_the_wheel():
+    async def record(fired):
+        fired.append('coroutine')
+
+    def fail():
+        raise RuntimeError('boom')
+
+    def schedule(wheel, fired):
+        wheel.call_later(0.01, fail)
+        wheel.call_later(0.02, record, fired)
+        wheel.call_later(0.03, fired.append, 'after')
+
+    _, fired = run_wheel(schedule, 0.1)
+    assert fired == ['coroutine', 'after']
@@ -0,0 +1,91 @@
+import itertools
+
+from tournament import Tournament, seed_order
+
+
+def entrants(count):
+    return [(user_id, f'player{user_id}') for user_id in range(1, count + 1)]
+
+
+def play_round(tournament, pick):
+    matches = tournament.next_round()
+    for game_id, match in enumerate(matches):
+        tournament.begin(match, game_id)
+    closed = [tournament.result(match, pick(tournament, match)) for match in matches]
+    return matches, closed
+
+
+def better_seed(tournament, match):
+    return min(match.players, key=tournament.seeds.get)
+
+
+def test_seed_order_keeps_top_seeds_apart():
+    assert seed_order(4) == [0, 3, 1, 2]
+    order = seed_order(8)
+    assert sorted(order) == list(range(8))
+    # Seeds 0 and 1 sit in different halves, so they can only meet in the final.
+    assert (order.index(0) < 4) != (order.index(1) < 4)
+
+
+def test_single_elimination_plays_down_to_one_champion():
+    tournament = Tournament(1, entrants(8), 'single')
+    assert tournament.rounds == 3
+    games = []
+    while not tournament.finished:
+        matches, closed = play_round(tournament, better_seed)
+        assert closed[-1] and not any(closed[:-1])
+        games.append(len(matches))
+
+    assert games == [4, 2, 1]
+    assert tournament.champion() == 1
+    assert tournament.scores[1] == 3
+
+
+def test_single_elimination_gives_byes_to_the_top_seeds():
+    tournament = Tournament(1, entrants(6), 'single')
+    matches, _ = play_round(tournament, better_seed)
+    assert sorted(tournament.byes) == [1, 2]
+    assert len(matches) == 2
+    assert not {1, 2} & {user_id for match in matches for user_id in match.players}
+
+
+def test_knockout_draw_goes_to_the_better_seed():
+    tournament = Tournament(1, entrants(2), 'single')
+    (match,), _ = play_round(tournament, lambda tournament, match: None)
+    assert tournament.finished
+    assert tournament.champion() == 1
+    assert tournament.loser_of(match) == 2
+
+
+def test_swiss_never_repeats_a_pairing():
+    tournament = Tournament(1, entrants(8), 'swiss', rounds=3)
+    pairings = set()
+    while not tournament.finished:
+        matches, _ = play_round(tournament, lambda tournament, match: match.players[0])
+        for match in matches:
+            pair = frozenset(match.players)
+            assert pair not in pairings
+            pairings.add(pair)
+
+    assert tournament.round == 3
+    assert sum(tournament.scores.values()) == 12
+    assert tournament.standings()[0] == tournament.champion()
+
+
+def test_swiss_rotates_the_bye():
+    tournament = Tournament(1, entrants(5), 'swiss', rounds=3)
+    byes = []
+    while not tournament.finished:
+        matches, _ = play_round(tournament, lambda tournament, match: None)
+        assert len(matches) == 2
+        byes.extend(tournament.byes)
+    assert len(byes) == len(set(byes)) == 3
+
+
+def test_swiss_balances_crosses():
+    tournament = Tournament(1, entrants(4), 'swiss', rounds=3)
+    while not tournament.finished:
+        play_round(tournament, lambda tournament, match: None)
+    counts = tournament.crosses_played.values()
+    assert max(counts) - min(counts) <= 1
+    assert sum(counts) == len(list(itertools.combinations(range(4), 2)))
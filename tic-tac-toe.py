@@ -3,12 +3,31 @@ import json
 import asyncio
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, CallbackContext, filters
-from database import get_or_create_player, get_player_id, get_player_name_from_player_id, get_player_name_from_user_id
-from functions import (set_turn_timer, show_board, check_winner, announce_winner, announce_draw, tasks, set_confirm_timer,
-                       clear_previous_message, process_winner)
-from common import (games_in_progress, timers, user_board_message_ids, JOIN_MARKUP, LEAVE_MARKUP, user_messages,
-                    start_messages)
+from player_store import (get_or_create_player, get_player_id, get_player_name_from_user_id, find_player, search_players,
+                          load_index, load_ratings, cache_stats, index as player_index)
+from functions import (set_turn_timer, show_board, set_confirm_timer, cancel_confirm_timer, clear_previous_message,
+                       process_winner, next_bot_id, restore_live_state, render_board, end_game,
+                       spectator_text)
+from ai import DIFFICULTIES, build_table
+from engine import Board, BOARD_SIZES, MOVE_PREFIX, SYMBOLS
+from sessions import Game, get_session, touch_session, register_game, evict_idle_sessions, SESSION_SWEEP_INTERVAL
+from common import games_in_progress, player_sessions, waiting_room, JOIN_MARKUP, LEAVE_MARKUP, bot_players, menu_markup
 from telegram.constants import ParseMode
+from markups import (BACK_BUTTON, BACK_MARKUP, SETTINGS_MARKUP, DIFFICULTY_MARKUP, TOURNAMENT_JOIN_MARKUP,
+                     TOURNAMENT_LEAVE_MARKUP, board_size_markup, symbol_choice_markup, challenge_markup, spectator_markup)
+from outbox import outbox, fan_out
+from router import CallbackRouter
+from journal import journal, JOURNAL_PATH, STATE_STORE
+from history import history, HistoryStore, HISTORY_PATH, RESULT_DRAW, decode_moves
+from state_store import make_store
+from update_processor import OrderedUpdateProcessor
+from webhook import run_webhook
+from scheduler import wheel
+from metrics import registry as metrics, MetricsServer
+from ratings import leaderboard
+from tournament import tournaments, FORMATS, TOURNAMENT_BOARD_SIZE, ROUND_TIME_LIMIT
+from broadcast import broadcaster
+from database import save_ratings
 
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -17,17 +36,45 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-waiting_room = {}
-user_states = {}
+# Set in main() unless METRICS_PORT is switched off.
+metrics_server = None
+# Waiting players listed when a typed ID matches nobody exactly and is searched as a prefix instead.
+SEARCH_RESULTS = 10
+# Seconds between moves when a finished game is replayed.
+REPLAY_STEP = 1.0
+LEADERBOARD_SIZE = 10
+LIVE_GAMES_LISTED = 10
 
+def edit_query_message(query, text, **kwargs):
+    return outbox.edit_message_text(text=text, chat_id=query.message.chat_id, message_id=query.message.message_id,
+                                    **kwargs)
 
-async def waiting_room_check(query, user_id) -> None:
-    if user_id in waiting_room:
-        reply_markup = LEAVE_MARKUP
-    else:
-        reply_markup = JOIN_MARKUP
 
-    await query.edit_message_text(text="Зал очікування пустий.", reply_markup=reply_markup)
+def join_waiting_room(user_id, username):
+    waiting_room.add(user_id, username, leaderboard.rating_of(user_id))
+    journal.save_waiting(user_id, username)
+
+
+def leave_waiting_room(user_id):
+    if waiting_room.remove(user_id) is not None:
+        journal.drop_waiting(user_id)
+
+
+def is_busy(user_id):
+    return user_id in games_in_progress or user_id in tournaments
+
+
+def busy_text(user_id):
+    return "Ви вже граєте." if user_id in games_in_progress else "Ви берете участь у турнірі."
+
+
+def can_be_challenged(user_id):
+    session = player_sessions.get(user_id)
+    return not is_busy(user_id) and (session is None or session.confirm_timer is None)
+
+
+async def waiting_room_check(query, user_id) -> None:
+    await edit_query_message(query, text="Зал очікування пустий.", reply_markup=menu_markup(user_id))
 
 
 async def start(update: Update, context: CallbackContext) -> None:
@@ -35,32 +82,19 @@ async def start(update: Update, context: CallbackContext) -> None:
     first_name = update.message.from_user.first_name
     username = update.message.from_user.username
 
-    user_state = user_states.setdefault(user_id, {'awaiting_id': False,
-                                                  'started': False})
-    get_or_create_player(user_id, first_name, username)
-
-    if user_state.get('started'):
-        message_id = start_messages[user_id]
-        await context.bot.delete_message(chat_id=user_id, message_id=message_id[0])
-        del start_messages[user_id]
-        await send_start_message(context, user_id)
-    else:
-        user_state['started'] = True
+    session = touch_session(user_id)
+    await get_or_create_player(user_id, first_name, username)
 
-        if user_id in start_messages:
-            message_id = start_messages[user_id]
-            await context.bot.delete_message(chat_id=user_id, message_id=message_id[0])
+    session.started = True
+    if session.start_message_id is not None:
+        outbox.delete_message(chat_id=user_id, message_id=session.start_message_id)
+        session.start_message_id = None
 
-        await send_start_message(context, user_id)
+    await send_start_message(context, user_id)
 
 
 async def send_start_message(context, user_id: int):
-    if user_id in waiting_room:
-        reply_markup = LEAVE_MARKUP
-    else:
-        reply_markup = JOIN_MARKUP
-
-    sent_message = await context.bot.send_message(
+    sent_message = await outbox.send_message(
         chat_id=user_id,
         text="Привіт! Вітаємо вас в грі хрестики-нулики!\n\n"
              "<b>Керування</b>\n"
@@ -74,316 +108,693 @@ async def send_start_message(context, user_id: int):
              "Після вибору символу починається гра. На хід дається 20 секунд. Якщо за виділений "
              "час ви не зробите хід, система зробить хід за вас у випадковій клітинці.\n\n"
              "Бажаємо вам вдачної гри!",
-        reply_markup=reply_markup,
+        reply_markup=menu_markup(user_id),
         parse_mode=ParseMode.HTML
     )
-    if user_id not in start_messages:
-        start_messages[user_id] = []
-
-    start_messages[user_id].append(sent_message.message_id)
+    get_session(user_id).start_message_id = sent_message.message_id
     track_user_message(user_id, sent_message)
 
 
 async def handle_message(update: Update, context: CallbackContext) -> None:
     user_id = update.message.from_user.id
-    username = update.message.from_user.first_name
 
-    if user_states.get(user_id, {}).get('awaiting_id'):
+    if touch_session(user_id).awaiting_id:
         player_id = update.message.text.strip()
 
-        player_name = get_player_name_from_player_id(player_id)
-        if player_name:
-            if player_name != username:
-                keyboard = [
-                    [InlineKeyboardButton(player_name, callback_data=f'select_player_{uid}')] for uid, player_name in
-                    waiting_room.items() if uid != user_id
-                ]
-                keyboard.append([InlineKeyboardButton("Назад", callback_data='go_back')])
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                await context.bot.send_message(chat_id=user_id, text=f'Гравця знайдено.',
-                                               reply_markup=reply_markup)
-            else:
-                await context.bot.send_message(chat_id=user_id, text=f'Ви не можете грати самі з собою.')
+        entry = await find_player(player_id)
+        if entry is not None and entry[0] == user_id:
+            outbox.send_message(chat_id=user_id, text=f'Ви не можете грати самі з собою.')
+            return
+
+        found = [(player_id, entry)] if entry is not None else \
+            search_players(player_id, SEARCH_RESULTS, accept=lambda uid: uid in waiting_room and uid != user_id)
+        keyboard = [[InlineKeyboardButton(f'{first_name} ({found_id})', callback_data=f'select_player_{uid}')]
+                    for found_id, (uid, first_name, _) in found if uid in waiting_room]
+        if keyboard:
+            keyboard.append([BACK_BUTTON])
+            outbox.send_message(chat_id=user_id, text='Гравця знайдено.' if len(found) == 1 else 'Знайдені гравці:',
+                                reply_markup=InlineKeyboardMarkup(keyboard))
         else:
-            await context.bot.send_message(chat_id=user_id, text=f'Гравця з ID ({player_id}) не знайдено '
-                                                                 f'або він ще не перейшов в зал очікування.')
+            outbox.send_message(chat_id=user_id, text=f'Гравця з ID ({player_id}) не знайдено '
+                                                      f'або він ще не перейшов в зал очікування.')
+    else:
+        outbox.send_message(chat_id=user_id, text="Неправильна команда.")
+
+
+async def replay(update: Update, context: CallbackContext) -> None:
+    user_id = update.message.from_user.id
+    touch_session(user_id)
+
+    # A game that has only just ended may still be waiting for its batch.
+    history.flush()
+    if context.args:
+        row = await history.call(history.store.get, context.args[0])
     else:
-        await update.message.reply_text("Неправильна команда.")
+        row = await history.call(history.store.last_game_of, user_id)
+    if row is None:
+        outbox.send_message(chat_id=user_id, text="Гру не знайдено." if context.args else "Ви ще не зіграли жодної гри.")
+        return
+
+    message = await outbox.send_message(chat_id=user_id, text=replay_text(row, 0))
+    if message is not None:
+        wheel.call_later(REPLAY_STEP, replay_step, user_id, message.message_id, row, 1)
+
+
+def replay_step(user_id, message_id, row, shown):
+    outbox.edit_message_text(chat_id=user_id, message_id=message_id, text=replay_text(row, shown))
+    if shown < len(row[12]):
+        wheel.call_later(REPLAY_STEP, replay_step, user_id, message_id, row, shown + 1)
+
+
+def replay_text(row, shown):
+    (game_id, user_id, username, opponent_id, opponent_name, crosses, size, length, _, result, _, _, moves,
+     _, first_side) = row
+    names = (username, opponent_name) if crosses == user_id else (opponent_name, username)
+    moves = decode_moves(moves)
+    board = Board(size, length)
+    for index, (cell, _) in enumerate(moves[:shown]):
+        board.play((first_side + index) % 2, cell)
+
+    text = f"Повтор гри {game_id}\n{names[0]} ❌ проти {names[1]} ⭕\n\nХід {shown}/{len(moves)}"
+    if shown and moves[shown - 1][1]:
+        text += " (зроблено автоматично)"
+    text += f"\n\n{render_board(board)}"
+    if shown == len(moves):
+        text += "\n\nНічия!" if result == RESULT_DRAW else f"\n\n{names[result]} виграє!"
+    return text
 
 
 def track_user_message(user_id, message):
-    if user_id not in user_messages:
-        user_messages[user_id] = []
-    user_messages[user_id].append(message.message_id)
+    if message is not None:
+        get_session(user_id).last_message_id = message.message_id
 
 
 async def button(update: Update, context: CallbackContext) -> None:
     query = update.callback_query
     await query.answer()
+    touch_session(query.from_user.id)
+    await router.dispatch(query, context)
+
+
+async def on_join_waiting(query, context):
+    user_id = query.from_user.id
+    if user_id in tournaments:
+        await edit_query_message(query, text="Ви берете участь у турнірі.", reply_markup=BACK_MARKUP)
+    elif user_id not in waiting_room:
+        join_waiting_room(user_id, query.from_user.first_name)
+        message = await edit_query_message(query, text='Ви перейшли в зал очікування.', reply_markup=LEAVE_MARKUP)
+        track_user_message(user_id, message)
+    else:
+        await edit_query_message(query, text="Ви вже перебуваєте в залі очікування.", reply_markup=LEAVE_MARKUP)
+
+
+async def on_leave_waiting(query, context):
+    user_id = query.from_user.id
+    if user_id in waiting_room:
+        leave_waiting_room(user_id)
+        message = await edit_query_message(query, text='Ви вийшли із залу очікування.', reply_markup=JOIN_MARKUP)
+        track_user_message(user_id, message)
+    else:
+        message = await edit_query_message(query, text="Ви не зайшли в зал очікування.",
+                                           reply_markup=JOIN_MARKUP)
+        track_user_message(user_id, message)
+
+
+async def on_find_player(query, context, page=0):
+    user_id = query.from_user.id
+    if waiting_room and not (user_id in waiting_room and len(waiting_room) == 1):
+        reply_markup, page, pages = waiting_room.page_markup(page, user_id)
+        text = "Список доступних гравців:" if pages == 1 else f"Список доступних гравців ({page + 1}/{pages}):"
+        message = await edit_query_message(query, text=text, reply_markup=reply_markup)
+        track_user_message(user_id, message)
+    else:
+        await waiting_room_check(query, user_id)
+
+
+async def on_auto_match(query, context):
+    user_id = query.from_user.id
+    if is_busy(user_id):
+        await edit_query_message(query, text=busy_text(user_id))
+        return
+
+    match = waiting_room.match(user_id, leaderboard.rating_of(user_id), available=can_be_challenged)
+    if match is not None:
+        await challenge_player(query, context, *match)
+        return
+
+    if user_id not in waiting_room:
+        join_waiting_room(user_id, query.from_user.first_name)
+    message = await edit_query_message(query, text="Вільних гравців поки немає. Ви в залі очікування, "
+                                                   "гра почнеться, щойно вас оберуть.", reply_markup=LEAVE_MARKUP)
+    track_user_message(user_id, message)
+
+
+async def on_select_player(query, context, opponent_id):
+    user_id = query.from_user.id
+    opponent_name = waiting_room.get(opponent_id)
+    if opponent_id == user_id:
+        await edit_query_message(query, text="Ви не можете грати самі з собою.", reply_markup=BACK_MARKUP)
+    elif opponent_name and not can_be_challenged(opponent_id):
+        await edit_query_message(query, text="Обраний гравець зараз зайнятий. Спробуйте пізніше.",
+                                 reply_markup=BACK_MARKUP)
+    elif opponent_name:
+        await challenge_player(query, context, opponent_id, opponent_name)
+    else:
+        await edit_query_message(query, text="Обраний гравець більше недоступний.", reply_markup=BACK_MARKUP)
+
+
+async def challenge_player(query, context, opponent_id, opponent_name):
     user_id = query.from_user.id
     username = query.from_user.first_name
+    board_size = get_session(user_id).board_size
+    msg_user, msg_opponent = await fan_out(
+        outbox.send_message(chat_id=user_id,
+                            text=f"Очікуємо відповідь гравця {opponent_name}...\n"
+                                 f"Максимальний час очікування - 5 хвилин."),
+        outbox.send_message(chat_id=opponent_id,
+                            text=f"Гравець {username} хоче почати з вами гру "
+                                 f"на полі {board_size}×{board_size}!",
+                            reply_markup=challenge_markup(user_id))
+    )
+    track_user_message(user_id, msg_user)
+    track_user_message(opponent_id, msg_opponent)
+    await set_confirm_timer(context, opponent_id, opponent_name, user_id, username)
 
-    if query.data == 'join_waiting':
-        if user_id not in waiting_room:
-            waiting_room[user_id] = username
-            message = await query.edit_message_text(text='Ви перейшли в зал очікування.', reply_markup=LEAVE_MARKUP)
-            track_user_message(user_id, message)
-        else:
-            await query.edit_message_text(text="Ви вже перебуваєте в залі очікування.", reply_markup=LEAVE_MARKUP)
 
-    elif query.data == 'leave_waiting':
-        if user_id in waiting_room:
-            del waiting_room[user_id]
-            message = await query.edit_message_text(text='Ви вийшли із залу очікування.', reply_markup=JOIN_MARKUP)
-            track_user_message(user_id, message)
-        else:
-            message = await query.edit_message_text(text="Ви не зайшли в зал очікування.",
-                                                    reply_markup=JOIN_MARKUP)
-            track_user_message(user_id, message)
-
-    elif query.data == 'find_player':
-        current_markup = update.effective_message.reply_markup
-
-        if user_id not in user_states:
-            user_states[user_id] = {'started': True}
-
-        user_states[user_id]['reply_markup'] = current_markup
-        if waiting_room:
-            if not (user_id in waiting_room and len(waiting_room) == 1):
-                keyboard = [
-                    [InlineKeyboardButton(uname, callback_data=f'select_player_{uid}')] for uid, uname in
-                    waiting_room.items() if uid != user_id
-                ]
-                keyboard.append([InlineKeyboardButton("Пошук гравця по ID", callback_data='find_player_by_id')])
-                keyboard.append([InlineKeyboardButton("Назад", callback_data='go_back')])
-                if keyboard:
-                    reply_markup = InlineKeyboardMarkup(keyboard)
-                    message = await query.edit_message_text(text="Список доступних гравців:",
-                                                            reply_markup=reply_markup)
-                    track_user_message(user_id, message)
-            else:
-                await waiting_room_check(query, user_id)
+def parse_symbol_choice(payload):
+    user_id, symbol = payload.split('_')
+    return int(user_id), symbol
 
-        else:
-            await waiting_room_check(query, user_id)
-
-    elif query.data.startswith('select_player_'):
-        opponent_id = int(query.data.split('_')[-1])
-        opponent_name = waiting_room.get(opponent_id)
-        if opponent_name:
-            keyboard = [[InlineKeyboardButton("Підтвердити гру", callback_data=f'confirm_game_{user_id}')],
-                        [InlineKeyboardButton("Відхилити гру", callback_data=f'deny_game_{user_id}')]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            msg_user = await context.bot.send_message(chat_id=user_id,
-                                                      text=f"Очікуємо відповідь гравця {opponent_name}...\n"
-                                                           f"Максимальний час очікування - 5 хвилин.")
-            msg_opponent = await context.bot.send_message(chat_id=opponent_id,
-                                                          text=f"Гравець {username} хоче почати з вами гру!",
-                                                          reply_markup=reply_markup)
-            track_user_message(user_id, msg_user)
-            track_user_message(opponent_id, msg_opponent)
-            await set_confirm_timer(context, opponent_id, opponent_name, user_id, username)
-        else:
-            reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton("Назад", callback_data='go_back')]])
-            await query.edit_message_text(text="Обраний гравець більше недоступний.", reply_markup=reply_markup)
-
-    elif query.data.startswith('symbol_choice_'):
-        _, _, user_id_str, symbol = query.data.split('_')
-        user_id = int(user_id_str)
-        opponent_id = games_in_progress[user_id]['opponent_id']
-
-        if symbol == '❌':
-            games_in_progress[user_id]['symbol'] = '❌'
-            games_in_progress[opponent_id]['symbol'] = '⭕'
-            await clear_previous_message(user_id, context)
-            await context.bot.send_message(chat_id=user_id, text="Ваш символ ❌.")
-            await context.bot.send_message(chat_id=opponent_id, text="Ваш символ ⭕.")
-        else:
-            games_in_progress[user_id]['symbol'] = '⭕'
-            games_in_progress[opponent_id]['symbol'] = '❌'
-            await clear_previous_message(user_id, context)
-            await context.bot.send_message(chat_id=user_id, text="Ваш символ ⭕.")
-            await context.bot.send_message(chat_id=opponent_id, text="Ваш символ ❌.")
-
-        await show_board(context, user_id)
-        await set_turn_timer(context, user_id)
-        await show_board(context, opponent_id)
-
-    elif query.data.startswith('move'):
-        await handle_move(update, context)
-
-    elif query.data == 'check_id':
-        player_id = get_player_id(user_id)
-        keyboard = [[InlineKeyboardButton("Назад", callback_data='go_back')]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(text=f"Ваш ігровий ID:\n{player_id}", reply_markup=reply_markup)
-
-    elif query.data == 'go_back':
-        if user_id not in user_states:
-            previous_markup = JOIN_MARKUP
-        elif 'reply_markup' in user_states[user_id]:
-            previous_markup = user_states[user_id]['reply_markup']
-        else:
-            previous_markup = JOIN_MARKUP
-
-        if user_id in user_states:
-            if 'awaiting_id' in user_states[user_id]:
-                del user_states[user_id]['awaiting_id']
-        await query.edit_message_text(text='Ви повернулися до головного меню.',
-                                      reply_markup=previous_markup)
-
-    elif query.data == 'find_player_by_id':
-        updated_markup = InlineKeyboardMarkup(
-            [[InlineKeyboardButton("Назад", callback_data='go_back')]])
-
-        await query.edit_message_text(text='Введіть ID гравця:', reply_markup=updated_markup)
-        user_states[user_id]['awaiting_id'] = True
-
-    elif query.data == 'settings':
-        if user_id in user_states:
-            current_markup = update.effective_message.reply_markup
-            user_states[user_id]['reply_markup'] = current_markup
-
-        keyboard = [[InlineKeyboardButton("Мій ігровий ID", callback_data='check_id')],
-                    [InlineKeyboardButton("Правила", callback_data='check_rules')],
-                    [InlineKeyboardButton("Назад", callback_data='go_back')]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(text="Налаштування:", reply_markup=reply_markup)
-
-    elif query.data == 'check_rules':
-        if user_id not in user_states:
-            reply_markup = JOIN_MARKUP
-        elif 'reply_markup' in user_states[user_id]:
-            reply_markup = user_states[user_id]['reply_markup']
-        else:
-            reply_markup = JOIN_MARKUP
-
-        await query.edit_message_text(
-            text="<b>Керування</b>\n"
-                 "Взаємодійте з ботом тільки за допомогою кнопок. "
-                 "Лише в функції пошуку гравця по його ігровому ID можете вводити текст в чат.\n\n"
-                 "<b>Зал очікування</b>\n"
-                 "Для початку гри знайдіть гравця в залі очікування або самі зайдіть в зал очікування. "
-                 "На підтвердження гри дається максимум 5 хвилин.\n\n"
-                 "<b>Ігровий процес</b>\n"
-                 "Після підтвердження гри символ обирає той, хто був в залі очікування. "
-                 "Після вибору символу починається гра. На хід дається 20 секунд. Якщо за виділений "
-                 "час ви не зробите хід, система зробить хід за вас у випадковій клітинці.\n\n",
-            reply_markup=reply_markup, parse_mode=ParseMode.HTML)
-
-    elif query.data.startswith('confirm_game_'):
-        opponent_id = int(query.data.split('_')[-1])
-        opponent_name = get_player_name_from_user_id(opponent_id)
-
-        if user_id in timers:
-            job = context.job_queue.get_jobs_by_name(f'confirm_timer_{user_id}')
-            if job:
-                job[0].schedule_removal()
-            del timers[user_id]
-
-        await start_game(user_id, username, opponent_id, opponent_name, context)
-
-    elif query.data.startswith('deny_game_'):
-        opponent_id = int(query.data.split('_')[-1])
-        opponent_name = get_player_name_from_user_id(opponent_id)
-
-        if user_id in timers:
-            job = context.job_queue.get_jobs_by_name(f'confirm_timer_{user_id}')
-            if job:
-                job[0].schedule_removal()
-            del timers[user_id]
-
-        await clear_previous_message(user_id, context)
-        await context.bot.send_message(chat_id=user_id, text=f'Ви відхилили гру з {opponent_name}.')
-        await clear_previous_message(opponent_id, context)
-        await context.bot.send_message(chat_id=opponent_id, text=f'Гравець {username} відхилив з вами гру.')
+
+async def on_symbol_choice(query, context, user_id, symbol):
+    game = games_in_progress.get(user_id)
+    # A second click, or one on a symbol menu left over from a finished game.
+    if game is None or game.crosses is not None:
         return
+    opponent_id = game.opponent_of(user_id)
+
+    game.assign_symbol(user_id, symbol)
+    await clear_previous_message(user_id, context)
+    outbox.send_message(chat_id=user_id, text=f"Ваш символ {game.symbol_of(user_id)}.")
+    outbox.send_message(chat_id=opponent_id, text=f"Ваш символ {game.symbol_of(opponent_id)}.")
 
+    await fan_out(show_board(context, user_id), show_board(context, opponent_id))
+    await set_turn_timer(context, user_id)
+
+
+async def on_play_bot(query, context):
+    await edit_query_message(query, text="Оберіть складність бота:", reply_markup=DIFFICULTY_MARKUP)
+
+
+def parse_difficulty(payload):
+    if payload not in DIFFICULTIES:
+        raise KeyError(payload)
+    return payload
+
+
+async def on_play_bot_level(query, context, difficulty):
+    user_id = query.from_user.id
+    if is_busy(user_id):
+        await edit_query_message(query, text=busy_text(user_id))
+    else:
+        await start_bot_game(query, user_id, query.from_user.first_name, difficulty, context)
+
+
+async def on_check_id(query, context):
+    player_id = await get_player_id(query.from_user.id)
+    await edit_query_message(query, text=f"Ваш ігровий ID:\n{player_id}", reply_markup=BACK_MARKUP)
+
+
+async def on_go_back(query, context):
+    user_id = query.from_user.id
+    get_session(user_id).awaiting_id = False
+    await edit_query_message(query, text='Ви повернулися до головного меню.',
+                             reply_markup=menu_markup(user_id))
+
+
+async def on_find_player_by_id(query, context):
+    await edit_query_message(query, text="Введіть ID гравця або початок його імені:", reply_markup=BACK_MARKUP)
+    get_session(query.from_user.id).awaiting_id = True
+
+
+async def on_settings(query, context):
+    await edit_query_message(query, text="Налаштування:", reply_markup=SETTINGS_MARKUP)
+
+
+async def on_board_size(query, context, size=None):
+    session = get_session(query.from_user.id)
+    if size is not None:
+        session.board_size = size
+    await edit_query_message(query, text="Розмір поля для ігор, які ви пропонуєте:",
+                             reply_markup=board_size_markup(session.board_size))
+
+
+def parse_board_size(payload):
+    size = int(payload)
+    if size not in BOARD_SIZES:
+        raise ValueError(payload)
+    return size
+
+
+async def on_check_rules(query, context):
+    await edit_query_message(
+        query,
+        text="<b>Керування</b>\n"
+             "Взаємодійте з ботом тільки за допомогою кнопок. "
+             "Лише в функції пошуку гравця по його ігровому ID можете вводити текст в чат.\n\n"
+             "<b>Зал очікування</b>\n"
+             "Для початку гри знайдіть гравця в залі очікування або самі зайдіть в зал очікування. "
+             "На підтвердження гри дається максимум 5 хвилин.\n\n"
+             "<b>Ігровий процес</b>\n"
+             "Після підтвердження гри символ обирає той, хто був в залі очікування. "
+             "Після вибору символу починається гра. На хід дається 20 секунд. Якщо за виділений "
+             "час ви не зробите хід, система зробить хід за вас у випадковій клітинці.\n\n",
+        reply_markup=menu_markup(query.from_user.id), parse_mode=ParseMode.HTML)
+
+
+async def on_leaderboard(query, context):
+    await edit_query_message(query, text=leaderboard_text(query.from_user.id), reply_markup=BACK_MARKUP)
+
+
+def leaderboard_text(viewer_id):
+    if not leaderboard:
+        return "Рейтинг поки порожній. Зіграйте гру з іншим гравцем, щоб потрапити в нього."
+    lines = ["Рейтинг гравців (перемоги/поразки/нічиї):"]
+    for rank, (user_id, entry) in enumerate(leaderboard.top(LEADERBOARD_SIZE), 1):
+        lines.append(f"{rank}. {player_index.name_of(user_id) or 'Гравець'} — {entry.rating:.0f} "
+                     f"({entry.wins}/{entry.losses}/{entry.draws})")
+    entry = leaderboard.get(viewer_id)
+    if entry is None:
+        lines.append("\nВи ще не в рейтингу. Зіграйте гру з іншим гравцем, щоб потрапити в нього.")
+    else:
+        lines.append(f"\nВаше місце: {leaderboard.rank_of(viewer_id)} з {len(leaderboard)}, рейтинг {entry.rating:.0f} "
+                     f"({entry.wins}/{entry.losses}/{entry.draws}).")
+    return "\n".join(lines)
+
+
+async def on_tournament(query, context):
+    user_id = query.from_user.id
+    await edit_query_message(query, text=tournament_text(user_id), reply_markup=tournament_markup(user_id))
+
+
+def tournament_markup(user_id):
+    if user_id in tournaments.registered:
+        return TOURNAMENT_LEAVE_MARKUP
+    return BACK_MARKUP if user_id in tournaments else TOURNAMENT_JOIN_MARKUP
+
+
+def tournament_text(user_id):
+    tournament = tournaments.by_player.get(user_id)
+    if tournament is not None:
+        return (f"Турнір, раунд {tournament.round} з {tournament.rounds}.\n"
+                f"Ваші очки: {tournament.scores[user_id]:g}.")
+    text = (f"Турнір {FORMATS[tournaments.format]} на {tournaments.size} гравців.\n"
+            f"Зареєстровано: {len(tournaments.registered)}/{tournaments.size}.")
+    if user_id in tournaments.registered:
+        text += "\nВи зареєстровані. Турнір почнеться, щойно зберуться всі гравці."
+    return text
+
+
+async def on_tournament_join(query, context):
+    user_id = query.from_user.id
+    if user_id in games_in_progress:
+        await edit_query_message(query, text="Ви вже граєте.")
+        return
+
+    tournament = None
+    if user_id not in tournaments:
+        leave_waiting_room(user_id)
+        tournament = tournaments.register(user_id, query.from_user.first_name)
+    await edit_query_message(query, text=tournament_text(user_id), reply_markup=tournament_markup(user_id))
+    if tournament is not None:
+        await start_round(context, tournament)
+
+
+async def on_tournament_leave(query, context):
+    user_id = query.from_user.id
+    text = "Ви скасували реєстрацію на турнір." if tournaments.unregister(user_id) else tournament_text(user_id)
+    await edit_query_message(query, text=text, reply_markup=menu_markup(user_id))
+
+
+async def start_round(context, tournament):
+    games = []
+    while not games and not tournament.finished:
+        for match in tournament.next_round():
+            busy = [user_id for user_id in match.players if user_id in games_in_progress]
+            if busy:
+                # Whoever is in another game when the round starts forfeits this one.
+                winner = None if len(busy) == 2 else game_opponent(match.players, busy[0])
+                record_tournament_result(tournament, match, winner)
+                continue
+            first, second = match.players
+            game = Game(first, tournament.names[first], second, tournament.names[second], TOURNAMENT_BOARD_SIZE)
+            game.assign_symbol(first, SYMBOLS[0])
+            register_game(game)
+            journal.save_game(game)
+            tournaments.begin(tournament, match, game.game_id)
+            games.append(game)
+        for user_id in tournament.byes:
+            outbox.send_message(chat_id=user_id, text=f"Раунд {tournament.round}: ви проходите далі без гри.")
+    if not games:
+        finish_tournament(tournament)
+        return
+
+    round_number = tournament.round
+    await asyncio.gather(*(open_tournament_game(context, tournament, game) for game in games))
+    if tournament.round != round_number:
+        return
+    # The whole round starts its clock together, once every board is out.
+    for game in games:
+        if not game.moves and games_in_progress.get(game.turn) is game:
+            await set_turn_timer(context, game.turn)
+    tournament.deadline = wheel.call_later(ROUND_TIME_LIMIT, round_deadline, context, tournament, round_number)
+
+
+def game_opponent(players, user_id):
+    return players[1] if user_id == players[0] else players[0]
+
+
+async def open_tournament_game(context, tournament, game):
+    await fan_out(*(outbox.send_message(chat_id=user_id,
+                                        text=f"Турнір, раунд {tournament.round} з {tournament.rounds}.\n"
+                                             f"Ваш суперник: {game.name_of(game.opponent_of(user_id))}. "
+                                             f"Ваш символ {game.symbol_of(user_id)}.")
+                    for user_id in game.players))
+    await fan_out(*(show_board(context, user_id) for user_id in game.players))
+
+
+async def round_deadline(context, tournament, round_number):
+    if tournament.round != round_number:
+        return
+    for match in list(tournament.games.values()):
+        game = games_in_progress.get(match.players[0])
+        if game is not None and game.game_id == match.game_id:
+            await end_game(context, game, None)
+
+
+async def on_tournament_game_over(context, game, winner):
+    tournament, match = tournaments.game_over(game.game_id)
+    winner = None if winner is None else game.crosses if winner == 0 else game.opponent_of(game.crosses)
+    if record_tournament_result(tournament, match, winner):
+        if tournament.deadline is not None:
+            tournament.deadline.cancel()
+            tournament.deadline = None
+        await start_round(context, tournament)
+
+
+def record_tournament_result(tournament, match, winner):
+    round_over = tournament.result(match, winner)
+    loser = tournament.loser_of(match)
+    for user_id in match.players:
+        if user_id == loser:
+            tournaments.retire(tournament, (user_id,))
+            outbox.send_message(chat_id=user_id, text=f"Ви вибули з турніру в {tournament.round}-му раунді.",
+                                reply_markup=menu_markup(user_id))
+        elif not tournament.finished:
+            outbox.send_message(chat_id=user_id, text=f"Ваші очки в турнірі: {tournament.scores[user_id]:g}. "
+                                                      f"Очікуйте наступного раунду.")
+    return round_over
+
+
+def finish_tournament(tournament):
+    names = tournament.names
+    lines = [f"Турнір завершено! Переможець: {names[tournament.champion()]}."]
+    if tournament.format == 'swiss':
+        lines.append("")
+        lines += [f"{place}. {names[user_id]} — {tournament.scores[user_id]:g}"
+                  for place, user_id in enumerate(tournament.standings()[:LEADERBOARD_SIZE], 1)]
+    text = "\n".join(lines)
+    for user_id in names:
+        if tournaments.by_player.get(user_id) is tournament:
+            outbox.send_message(chat_id=user_id, text=text, reply_markup=menu_markup(user_id))
+    tournaments.close(tournament)
+
+
+tournaments.on_game_over = on_tournament_game_over
+
+
+async def on_live_games(query, context):
+    user_id = query.from_user.id
+    keyboard = []
+    listed = set()
+    for game in games_in_progress.values():
+        if len(keyboard) >= LIVE_GAMES_LISTED:
+            break
+        if game.game_id in listed or game.crosses is None or user_id in game.players:
+            continue
+        listed.add(game.game_id)
+        keyboard.append([InlineKeyboardButton(f"{game.names[0]} — {game.names[1]}",
+                                              callback_data=f'watch_{game.players[0]}')])
+    if not keyboard:
+        await edit_query_message(query, text="Зараз немає ігор, які можна подивитися.",
+                                 reply_markup=menu_markup(user_id))
+        return
+    keyboard.append([BACK_BUTTON])
+    await edit_query_message(query, text="Оберіть гру:", reply_markup=InlineKeyboardMarkup(keyboard))
+
+
+async def on_watch(query, context, player_id):
+    user_id = query.from_user.id
+    game = games_in_progress.get(player_id)
+    if game is None or game.crosses is None:
+        await edit_query_message(query, text="Ця гра вже завершилася.", reply_markup=BACK_MARKUP)
+    elif user_id in game.players:
+        await edit_query_message(query, text="Це ваша гра.", reply_markup=BACK_MARKUP)
+    else:
+        text, markup = broadcaster.watch(user_id, game.game_id, query.message.message_id, spectator_text(game),
+                                         spectator_markup(game.board))
+        await edit_query_message(query, text=text, reply_markup=markup)
+
+
+async def on_unwatch(query, context):
+    user_id = query.from_user.id
+    broadcaster.unwatch(user_id)
+    await edit_query_message(query, text='Ви повернулися до головного меню.', reply_markup=menu_markup(user_id))
+
+
+async def on_spectate(query, context):
+    pass
+
+
+async def on_confirm_game(query, context, opponent_id):
+    user_id = query.from_user.id
+    session = player_sessions.get(user_id)
+    # The challenge may have timed out, been replaced by a newer one or already been accepted.
+    if session is None or session.confirm_timer is None or session.challenger != opponent_id:
+        await edit_query_message(query, text="Цей виклик більше недійсний.", reply_markup=menu_markup(user_id))
+        return
+
+    opponent_name = await get_player_name_from_user_id(opponent_id)
+    cancel_confirm_timer(user_id)
+    # Either side may have started another game or joined a tournament while the challenge was open.
+    if is_busy(user_id) or is_busy(opponent_id):
+        text = busy_text(user_id) if is_busy(user_id) else f"Гравець {opponent_name} зараз недоступний."
+        await edit_query_message(query, text=text, reply_markup=menu_markup(user_id))
+        outbox.send_message(chat_id=opponent_id, text=f"Гра з {query.from_user.first_name} не відбулася.")
+        return
+
+    await start_game(user_id, query.from_user.first_name, opponent_id, opponent_name, context)
+
+
+async def on_deny_game(query, context, opponent_id):
+    user_id = query.from_user.id
+    opponent_name = await get_player_name_from_user_id(opponent_id)
+
+    cancel_confirm_timer(user_id)
 
-async def start_game(user_id, username, opponent_id, opponent_name, context):
-    if opponent_id in waiting_room:
-        del waiting_room[opponent_id]
-    if user_id in waiting_room:
-        del waiting_room[user_id]
-
-    games_in_progress[user_id] = {
-        'player_id': user_id,
-        'username': username,
-        'opponent_id': opponent_id,
-        'board': [' ' for _ in range(9)],
-        'turn': user_id,
-        'symbol': None
-    }
-
-    games_in_progress[opponent_id] = {
-        'player_id': opponent_id,
-        'username': opponent_name,
-        'opponent_id': user_id,
-        'board': games_in_progress[user_id]['board'],
-        'turn': user_id,
-        'symbol': None
-    }
     await clear_previous_message(user_id, context)
-    message = await context.bot.send_message(chat_id=user_id, text=f"Починаємо гру з {opponent_name}.")
+    outbox.send_message(chat_id=user_id, text=f'Ви відхилили гру з {opponent_name}.')
+    await clear_previous_message(opponent_id, context)
+    outbox.send_message(chat_id=opponent_id, text=f'Гравець {query.from_user.first_name} відхилив з вами гру.')
+
+
+async def start_bot_game(query, user_id, username, difficulty, context):
+    leave_waiting_room(user_id)
+
+    bot_id = next_bot_id()
+    bot_players.add(bot_id)
+    game = Game(user_id, username, bot_id, "Бот", get_session(user_id).board_size, difficulty)
+    game.assign_symbol(user_id, '❌')
+    register_game(game)
+
+    message = await edit_query_message(query, text=f"Починаємо гру з ботом ({DIFFICULTIES[difficulty]}).\n"
+                                                   f"Ваш символ ❌, ви ходите першим.")
     track_user_message(user_id, message)
+    await show_board(context, user_id)
+    await set_turn_timer(context, user_id)
+
+
+async def start_game(user_id, username, opponent_id, opponent_name, context):
+    leave_waiting_room(opponent_id)
+    leave_waiting_room(user_id)
+
+    # The challenger picked the board size when sending the challenge.
+    game = Game(user_id, username, opponent_id, opponent_name, get_session(opponent_id).board_size)
+    register_game(game)
+    journal.save_game(game)
 
+    await clear_previous_message(user_id, context)
     await clear_previous_message(opponent_id, context)
-    message = await context.bot.send_message(chat_id=opponent_id, text=f"{username} почав(-ла) з вами гру.")
-    track_user_message(user_id, message)
+    message_user, message_opponent = await fan_out(
+        outbox.send_message(chat_id=user_id, text=f"Починаємо гру з {opponent_name}."),
+        outbox.send_message(chat_id=opponent_id, text=f"{username} почав(-ла) з вами гру.")
+    )
+    track_user_message(user_id, message_user)
+    track_user_message(opponent_id, message_opponent)
 
     await ask_symbol_choice(user_id, username, opponent_id, context)
 
 
 async def ask_symbol_choice(user_id, username, opponent_id, context):
-    keyboard = [
-        [InlineKeyboardButton("❌", callback_data=f'symbol_choice_{user_id}_❌')],
-        [InlineKeyboardButton("⭕", callback_data=f'symbol_choice_{user_id}_⭕')]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    msg = await context.bot.send_message(chat_id=user_id, text="Виберіть ваш символ:", reply_markup=reply_markup)
+    msg, _ = await fan_out(
+        outbox.send_message(chat_id=user_id, text="Виберіть ваш символ:", reply_markup=symbol_choice_markup(user_id)),
+        outbox.send_message(chat_id=opponent_id, text=f"{username} вибирає свій символ...")
+    )
     track_user_message(user_id, msg)
-    await context.bot.send_message(chat_id=opponent_id, text=f"{username} вибирає свій символ...")
 
 
-async def handle_move(update, context):
-    query = update.callback_query
+async def handle_move(query, context, move_index):
     user_id = query.from_user.id
-    data = query.data
-
-    move_index = int(data[4:])
-    game = games_in_progress[user_id]
-    opponent_id = game['opponent_id']
+    game = games_in_progress.get(user_id)
+    if game is None:
+        return
+    opponent_id = game.opponent_of(user_id)
 
-    if user_id != game['turn']:
+    if user_id != game.turn:
         return
 
-    if game['board'][move_index] != ' ':
+    if not game.board.is_empty(move_index):
         return
 
-    user_symbol = game['symbol']
-    opponent_symbol = games_in_progress[opponent_id]['symbol']
-    game['board'][move_index] = user_symbol if user_id == game['turn'] else opponent_symbol
+    game.play(game.side_of(user_id), move_index)
 
     await process_winner(user_id, opponent_id, context)
-    await query.answer()
+
+
+router = CallbackRouter()
+router.on_prefix(MOVE_PREFIX, handle_move, int)
+router.on('join_waiting', on_join_waiting)
+router.on('leave_waiting', on_leave_waiting)
+router.on('find_player', on_find_player)
+router.on_prefix('waiting_page_', on_find_player, int)
+router.on('auto_match', on_auto_match)
+router.on('find_player_by_id', on_find_player_by_id)
+router.on_prefix('select_player_', on_select_player, int)
+router.on_prefix('symbol_choice_', on_symbol_choice, parse_symbol_choice)
+router.on('play_bot', on_play_bot)
+router.on_prefix('play_bot_', on_play_bot_level, parse_difficulty)
+router.on('check_id', on_check_id)
+router.on('go_back', on_go_back)
+router.on('settings', on_settings)
+router.on('board_size', on_board_size)
+router.on_prefix('board_size_', on_board_size, parse_board_size)
+router.on('check_rules', on_check_rules)
+router.on('leaderboard', on_leaderboard)
+router.on('tournament', on_tournament)
+router.on('tournament_join', on_tournament_join)
+router.on('tournament_leave', on_tournament_leave)
+router.on('live_games', on_live_games)
+router.on_prefix('watch_', on_watch, int)
+router.on('unwatch', on_unwatch)
+router.on('spectate', on_spectate)
+router.on_prefix('confirm_game_', on_confirm_game, int)
+router.on_prefix('deny_game_', on_deny_game, int)
+
+
+def tracked_message_ids():
+    return sum((session.last_message_id is not None) + (session.start_message_id is not None) +
+               (session.board_message_id is not None) for session in player_sessions.values())
+
+
+def player_cache_count(key):
+    stats = cache_stats()
+    return stats['by_user'][key] + stats['by_player'][key]
+
+
+metrics.gauge('live_games', lambda: len(games_in_progress) // 2, 'Games in progress, bot games included.')
+metrics.gauge('waiting_room_players', lambda: len(waiting_room), 'Players in the waiting room.')
+metrics.gauge('player_sessions', lambda: len(player_sessions), 'Player sessions held in memory.')
+metrics.gauge('pending_timers', lambda: len(wheel), 'Turn, countdown, challenge and housekeeping timers armed.')
+metrics.gauge('tracked_message_ids', tracked_message_ids, 'Message IDs kept in player sessions.')
+metrics.gauge('outbox_queued', lambda: outbox.stats()['queued'], 'Bot API requests waiting in the outbox.')
+metrics.gauge('history_pending', lambda: history.stats()['pending'], 'Finished games not yet written.')
+metrics.gauge('spectators', broadcaster.spectators, 'Users watching a live game.')
+metrics.gauge('tournament_games', lambda: len(tournaments.by_game), 'Tournament games in progress.')
+metrics.gauge('ratings_pending', lambda: leaderboard.stats()['pending'], 'Changed ratings not yet written.')
+metrics.gauge('player_cache_hits', lambda: player_cache_count('hits'), 'Player profile lookups served from memory.')
+metrics.gauge('player_cache_misses', lambda: player_cache_count('misses'), 'Player profile lookups not in memory.')
+metrics.gauge('player_cache_shared_hits', lambda: cache_stats()['shared']['hits'],
+              'Player profile lookups served from the shared cache.')
+metrics.gauge('player_cache_shared_misses', lambda: cache_stats()['shared']['misses'],
+              'Player profile lookups that also missed the shared cache.')
+
+
+def sweep_sessions():
+    evicted = evict_idle_sessions()
+    if evicted:
+        logger.info('Evicted %d idle sessions', evicted)
+    wheel.call_later(SESSION_SWEEP_INTERVAL, sweep_sessions)
+
+
+async def post_init(application: Application) -> None:
+    store = make_store(STATE_STORE, JOURNAL_PATH)
+    journal.open(store)
+    history.open(HistoryStore(HISTORY_PATH))
+    logger.info('Indexed %d players', await load_index())
+    logger.info('Loaded %d ratings', await load_ratings())
+    leaderboard.open(save_ratings)
+    games, waiting, challenges = await restore_live_state(CallbackContext(application))
+    logger.info('Restored %d games, %d waiting players and %d challenges', games, waiting, challenges)
+    wheel.call_later(SESSION_SWEEP_INTERVAL, sweep_sessions)
+    if metrics_server is not None:
+        await metrics_server.start()
+
+
+async def post_shutdown(application: Application) -> None:
+    if metrics_server is not None:
+        await metrics_server.stop()
+    journal.close()
+    history.close()
+    leaderboard.close()
+
+
+def add_handlers(application):
+    application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("replay", replay))
+    application.add_handler(CallbackQueryHandler(button))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
 
 
 def main() -> None:
+    global metrics_server
     print(f'Starting bot...')
 
     with open('credentials.json', 'r') as f:
         credentials = json.load(f)
 
     TOKEN = credentials.get('TOKEN')
-
-    application = Application.builder().token(TOKEN).build()
-
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CallbackQueryHandler(button))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
-
-    application.run_polling()
-
+    WEBHOOK_URL = credentials.get('WEBHOOK_URL')
+    CONCURRENT_UPDATES = int(credentials.get('CONCURRENT_UPDATES', 64))
+    # Metrics are for a scraper on the same host; 0 switches the endpoint off.
+    METRICS_PORT = int(credentials.get('METRICS_PORT', 9100))
+    if METRICS_PORT:
+        metrics_server = MetricsServer(credentials.get('METRICS_LISTEN', '127.0.0.1'), METRICS_PORT)
+
+    application = (Application.builder().token(TOKEN)
+                   .concurrent_updates(OrderedUpdateProcessor(CONCURRENT_UPDATES))
+                   .post_init(post_init).post_shutdown(post_shutdown).build())
+    outbox.bind(application.bot)
+    build_table()
+    add_handlers(application)
+
+    if WEBHOOK_URL:
+        asyncio.run(run_webhook(application, WEBHOOK_URL,
+                                credentials.get('WEBHOOK_LISTEN', '0.0.0.0'),
+                                int(credentials.get('WEBHOOK_PORT', 8443)),
+                                credentials.get('WEBHOOK_PATH', '/telegram'),
+                                credentials.get('WEBHOOK_SECRET')))
+    else:
+        application.run_polling()
 
 if __name__ == '__main__':
     main()
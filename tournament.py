@@ -0,0 +1,214 @@
+import itertools
+from collections import OrderedDict
+
+import database
+from ratings import leaderboard
+
+TOURNAMENT_SIZE = int(database.credentials.get("TOURNAMENT_SIZE", 8))
+# 'single' is single elimination; 'swiss' plays every entrant in every round, pairing equal scores.
+TOURNAMENT_FORMAT = database.credentials.get("TOURNAMENT_FORMAT", "single")
+# Swiss rounds; 0 plays as many as single elimination would need.
+SWISS_ROUNDS = int(database.credentials.get("SWISS_ROUNDS", 0))
+TOURNAMENT_BOARD_SIZE = int(database.credentials.get("TOURNAMENT_BOARD_SIZE", 3))
+# Games of a round still running this long after the round started are scored as draws.
+ROUND_TIME_LIMIT = float(database.credentials.get("ROUND_TIME_LIMIT", 600))
+FORMATS = {'single': 'на вибування', 'swiss': 'за швейцарською системою'}
+
+
+def seed_order(size):
+    # Bracket positions for seeds 0..size-1, so the top seeds can only meet in the last rounds: 0 3 1 2 for 4.
+    order = [0]
+    while len(order) < size:
+        order = [seed for position in order for seed in (position, 2 * len(order) - 1 - position)]
+    return order
+
+
+class Match:
+    __slots__ = ('players', 'slot', 'game_id')
+
+    def __init__(self, players, slot=None):
+        # The first player plays crosses.
+        self.players = players
+        self.slot = slot
+        self.game_id = None
+
+
+class Tournament:
+    def __init__(self, tournament_id, entrants, tournament_format=TOURNAMENT_FORMAT, rounds=SWISS_ROUNDS):
+        # entrants: (user_id, name), best seed first.
+        self.tournament_id = tournament_id
+        self.format = tournament_format
+        self.names = dict(entrants)
+        self.seeds = {user_id: seed for seed, (user_id, _) in enumerate(entrants)}
+        self.scores = dict.fromkeys(self.names, 0.0)
+        self.opponents = {user_id: set() for user_id in self.names}
+        self.crosses_played = dict.fromkeys(self.names, 0)
+        self.had_bye = set()
+        self.round = 0
+        self.rounds = max(1, (len(entrants) - 1).bit_length())
+        if tournament_format == 'swiss' and rounds:
+            self.rounds = min(rounds, len(entrants) - 1) or 1
+        self.bracket = []
+        if tournament_format != 'swiss':
+            self.bracket = [entrants[seed][0] if seed < len(entrants) else None
+                            for seed in seed_order(1 << self.rounds)]
+        self.next_bracket = []
+        self.byes = []
+        # game_id -> Match for the games of the current round still being played.
+        self.games = {}
+        self.open = 0
+        self.deadline = None
+
+    @property
+    def finished(self):
+        return self.open == 0 and self.round >= self.rounds
+
+    def next_round(self):
+        # Returns the round's matches; byes are scored straight away and listed in self.byes.
+        self.round += 1
+        self.byes = []
+        if self.format == 'swiss':
+            matches = self._swiss_matches()
+        else:
+            matches = self._bracket_matches()
+        self.open = len(matches)
+        if not matches:
+            self._close_round()
+        return matches
+
+    def _bracket_matches(self):
+        matches = []
+        self.next_bracket = [None] * (len(self.bracket) // 2)
+        for slot in range(len(self.next_bracket)):
+            first, second = self.bracket[2 * slot:2 * slot + 2]
+            if first is None or second is None:
+                self.next_bracket[slot] = first if second is None else second
+                if self.next_bracket[slot] is not None:
+                    self.byes.append(self.next_bracket[slot])
+            else:
+                matches.append(Match(self._colours(first, second), slot))
+        return matches
+
+    def _swiss_matches(self):
+        players = sorted(self.names, key=lambda user_id: (-self.scores[user_id], self.seeds[user_id]))
+        if len(players) % 2:
+            bye = next((user_id for user_id in reversed(players) if user_id not in self.had_bye), players[-1])
+            players.remove(bye)
+            self.had_bye.add(bye)
+            self.scores[bye] += 1
+            self.byes.append(bye)
+        matches = []
+        # Top of the standings first, each against the next player with the same or a close score not yet met.
+        while players:
+            first = players.pop(0)
+            index = next((index for index, user_id in enumerate(players) if user_id not in self.opponents[first]), 0)
+            matches.append(Match(self._colours(first, players.pop(index))))
+        return matches
+
+    def _colours(self, first, second):
+        if self.crosses_played[second] < self.crosses_played[first]:
+            first, second = second, first
+        self.crosses_played[first] += 1
+        return first, second
+
+    def begin(self, match, game_id):
+        match.game_id = game_id
+        self.games[game_id] = match
+
+    def result(self, match, winner):
+        # winner is a user_id, or None for a draw; returns True when this closes the round.
+        self.games.pop(match.game_id, None)
+        first, second = match.players
+        self.opponents[first].add(second)
+        self.opponents[second].add(first)
+        if winner is None:
+            self.scores[first] += 0.5
+            self.scores[second] += 0.5
+        else:
+            self.scores[winner] += 1
+        if match.slot is not None:
+            # A drawn knockout game goes to the better seed.
+            self.next_bracket[match.slot] = winner if winner is not None else min(match.players, key=self.seeds.get)
+        self.open -= 1
+        if self.open:
+            return False
+        self._close_round()
+        return True
+
+    def _close_round(self):
+        if self.format != 'swiss':
+            self.bracket = self.next_bracket
+
+    def loser_of(self, match):
+        # Who is out of a knockout after this result; None in Swiss, where everyone plays every round.
+        if match.slot is None:
+            return None
+        advancing = self.next_bracket[match.slot]
+        return match.players[1] if advancing == match.players[0] else match.players[0]
+
+    def standings(self):
+        return sorted(self.names, key=lambda user_id: (-self.scores[user_id], self.seeds[user_id]))
+
+    def champion(self):
+        if self.format == 'swiss':
+            return self.standings()[0]
+        return self.bracket[0]
+
+
+class Tournaments:
+    # Registration for the next tournament, and which player and game belong to which running one.
+    def __init__(self, size=TOURNAMENT_SIZE, tournament_format=TOURNAMENT_FORMAT):
+        self.size = size
+        self.format = tournament_format
+        self.registered = OrderedDict()
+        self.by_player = {}
+        self.by_game = {}
+        self.running = {}
+        # Set by the bot module: coroutine (context, game, winner) run when a tournament game ends.
+        self.on_game_over = None
+        self._ids = itertools.count(1)
+
+    def __contains__(self, user_id):
+        return user_id in self.registered or user_id in self.by_player
+
+    def register(self, user_id, name):
+        # Returns the new tournament once the registration fills up.
+        self.registered[user_id] = name
+        if len(self.registered) < self.size:
+            return None
+        entrants = [self.registered.popitem(last=False) for _ in range(self.size)]
+        entrants.sort(key=lambda entrant: -leaderboard.rating_of(entrant[0]))
+        tournament = Tournament(next(self._ids), entrants, self.format)
+        self.running[tournament.tournament_id] = tournament
+        for user_id, _ in entrants:
+            self.by_player[user_id] = tournament
+        return tournament
+
+    def unregister(self, user_id):
+        return self.registered.pop(user_id, None) is not None
+
+    def begin(self, tournament, match, game_id):
+        tournament.begin(match, game_id)
+        self.by_game[game_id] = tournament
+
+    def owns(self, game_id):
+        return game_id in self.by_game
+
+    def game_over(self, game_id):
+        # Returns the tournament and the match the game was played for.
+        tournament = self.by_game.pop(game_id)
+        return tournament, tournament.games[game_id]
+
+    def retire(self, tournament, user_ids):
+        for user_id in user_ids:
+            if self.by_player.get(user_id) is tournament:
+                del self.by_player[user_id]
+
+    def close(self, tournament):
+        self.retire(tournament, tournament.names)
+        for game_id in tournament.games:
+            self.by_game.pop(game_id, None)
+        self.running.pop(tournament.tournament_id, None)
+
+
+tournaments = Tournaments()
@@ -0,0 +1,56 @@
+import asyncio
+from contextlib import AsyncExitStack
+
+from telegram.ext import BaseUpdateProcessor
+
+from common import games_in_progress
+
+
+class OrderedUpdateProcessor(BaseUpdateProcessor):
+    # Updates run concurrently, except that updates from one chat, and from both players of one game, run one at a
+    # time and in the order they reached the lock: two moves on the same board never interleave.
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        self.locks = {}
+
+    def keys(self, update):
+        keys = []
+        chat = getattr(update, 'effective_chat', None)
+        if chat is not None:
+            keys.append(('chat', chat.id))
+        user = getattr(update, 'effective_user', None)
+        game = games_in_progress.get(user.id) if user is not None else None
+        if game is not None:
+            keys.append(('game', game.game_id))
+        return keys
+
+    async def do_process_update(self, update, coroutine):
+        keys = self.keys(update)
+        if not keys:
+            await coroutine
+            return
+
+        # Always chat before game, so two updates can never wait on each other's lock.
+        for key in keys:
+            entry = self.locks.get(key)
+            if entry is None:
+                entry = self.locks[key] = [asyncio.Lock(), 0]
+            entry[1] += 1
+        try:
+            async with AsyncExitStack() as stack:
+                for key in keys:
+                    await stack.enter_async_context(self.locks[key][0])
+                await coroutine
+        finally:
+            coroutine.close()
+            for key in keys:
+                entry = self.locks[key]
+                entry[1] -= 1
+                if not entry[1]:
+                    del self.locks[key]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
@@ -0,0 +1,109 @@
+import asyncio
+import hmac
+import json
+import logging
+import signal
+
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY = 1 << 20
+REASONS = {200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found', 405: 'Method Not Allowed',
+           413: 'Payload Too Large'}
+
+
+class WebhookServer:
+    # Minimal HTTP/1.1 endpoint for Telegram's webhook POSTs, on asyncio streams; keeps connections alive.
+    def __init__(self, application, path, secret_token=None):
+        self.application = application
+        self.path = path
+        self.secret_token = secret_token
+        self.server = None
+        self.received = 0
+        self.rejected = 0
+
+    async def start(self, listen, port):
+        self.server = await asyncio.start_server(self._serve, listen, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def _serve(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get('content-length', 0))
+                if length > MAX_BODY:
+                    await self._respond(writer, 413)
+                    break
+                body = await reader.readexactly(length) if length else b''
+                await self._respond(writer, await self._handle(method, target, headers, body))
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _handle(self, method, target, headers, body):
+        if target != self.path:
+            return 404
+        if method != 'POST':
+            return 405
+        token = headers.get('x-telegram-bot-api-secret-token', '')
+        if self.secret_token and not hmac.compare_digest(token, self.secret_token):
+            self.rejected += 1
+            return 403
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except (ValueError, TypeError, KeyError):
+            self.rejected += 1
+            return 400
+
+        await self.application.update_queue.put(update)
+        self.received += 1
+        return 200
+
+    @staticmethod
+    async def _respond(writer, status):
+        writer.write(f'HTTP/1.1 {status} {REASONS[status]}\r\nContent-Length: 0\r\n\r\n'.encode('latin-1'))
+        await writer.drain()
+
+
+async def run_webhook(application, url, listen, port, path, secret_token=None):
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    async with application:
+        if application.post_init:
+            await application.post_init(application)
+        await application.bot.set_webhook(url=url, secret_token=secret_token, allowed_updates=Update.ALL_TYPES)
+        await application.start()
+        server = WebhookServer(application, path, secret_token)
+        await server.start(listen, port)
+        logger.info('Listening for webhook updates on %s:%s%s', listen, port, path)
+        try:
+            await stop.wait()
+        finally:
+            await server.stop()
+            await application.stop()
+            if application.post_shutdown:
+                await application.post_shutdown(application)
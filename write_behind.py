@@ -0,0 +1,51 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehind:
+    # The one writer thread of a store: batches land in the order they were taken and the store's connection is only
+    # ever used from that thread. Owners take their rows on the event loop and hand them over with submit().
+    def __init__(self, name, what):
+        self.name = name
+        # What a failed batch held, for the log.
+        self.what = what
+        self.executor = None
+        self._flush_handle = None
+
+    @property
+    def is_open(self):
+        return self.executor is not None
+
+    def open(self):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=self.name)
+
+    def close(self):
+        self.cancel()
+        self.executor.shutdown()
+        self.executor = None
+
+    def schedule(self, flush, delay=0):
+        # At most one flush is pending; a delay of 0 runs it once the current loop iteration is done.
+        if self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(delay, flush) if delay else loop.call_soon(flush)
+
+    def cancel(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+    def submit(self, func, *args):
+        future = self.executor.submit(func, *args)
+        future.add_done_callback(self._log_failure)
+        return future
+
+    async def call(self, method, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, method, *args)
+
+    def _log_failure(self, future):
+        if future.exception() is not None:
+            logger.error('Could not write %s', self.what, exc_info=future.exception())